@@ -0,0 +1,227 @@
+"""
+Pré-examen des demandes d'aide par règles déclaratives.
+- Faits calculés en lot pour toutes les aides en attente, en quelques requêtes ensemblistes :
+  ancienneté dans le groupe, mois consécutifs de cotisation, aides déjà reçues, fonds du groupe
+  (archives comprises)
+- AID_RULES : (code, issue, test, message) ; une règle 'reject' refuse l'aide, une règle 'flag' la laisse
+  aux admins avec ses motifs ; aucune règle déclenchée : approbation automatique
+- Dans un groupe, les aides sont examinées par ordre d'arrivée contre le fonds restant ; l'approbation
+  passe ensuite par decide_many() (UPDATE conditionnel, voir group_funds.py), qui reste l'arbitre final
+- aid_screening garde la dernière décision et les motifs de chaque aide, affichés dans la liste /admin
+- AID_SCREENING_MODE = 'flag' : annoter seulement, ne jamais décider
+
+Usage :
+    flask --app app screen-aids [--dry-run]
+"""
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import DateTime, bindparam, func, select, text
+
+from archive import transaction_source
+from group_funds import decide_many
+from models import db, group_balances
+
+APPROVE, REJECT, FLAG = 'approve', 'reject', 'flag'
+
+AID_SCREENING_DDL = (
+    'CREATE TABLE IF NOT EXISTS aid_screening ('
+    ' id INTEGER PRIMARY KEY,'
+    ' decision VARCHAR(10) NOT NULL,'
+    ' reasons VARCHAR(255),'
+    ' screened_at DATETIME NOT NULL)'
+)
+AID_SCREENING_TRIGGERS = {
+    # L'id est celui de la transaction : la ligne part avec l'aide (suppression, archivage)
+    'as_transaction_del': "AFTER DELETE ON 'transaction' WHEN OLD.type = 'aide' BEGIN "
+                          'DELETE FROM aid_screening WHERE id = OLD.id; END',
+}
+
+Rule = namedtuple('Rule', 'code outcome test message')
+
+AID_RULES = (
+    Rule('not_member', REJECT, lambda f, s: f['joined_at'] is None,
+         "Le demandeur n'est pas membre du groupe"),
+    Rule('new_member', FLAG, lambda f, s: f['tenure_days'] is not None and f['tenure_days'] < 30 * s['min_streak'],
+         'Membre du groupe depuis moins de {min_streak} mois'),
+    Rule('short_streak', REJECT, lambda f, s: f['streak'] < s['min_streak'],
+         'Moins de {min_streak} mois consécutifs de cotisation'),
+    Rule('over_fund', FLAG, lambda f, s: f['amount'] > f['fund'],
+         'Montant supérieur au fonds disponible du groupe'),
+    Rule('over_cap', FLAG, lambda f, s: f['amount'] > f['fund'] * s['max_fund_share'],
+         'Montant supérieur à {max_fund_pct} % du fonds du groupe'),
+    Rule('recent_aid', FLAG, lambda f, s: f['days_since_aid'] is not None and f['days_since_aid'] < s['cooldown_days'],
+         'Aide déjà reçue il y a moins de {cooldown_days} jours'),
+    Rule('large_amount', FLAG, lambda f, s: f['amount'] > s['auto_approve_max'],
+         "Montant au-delà du plafond d'approbation automatique ({auto_approve_max} MAD)"),
+)
+RULES_BY_CODE = {r.code: r for r in AID_RULES}
+
+
+def _config(name, default):
+    try:
+        return current_app.config.get(name, default)
+    except RuntimeError:
+        return default
+
+
+def settings():
+    """Rule thresholds from the configuration."""
+    share = _config('AID_MAX_FUND_SHARE', 0.5)
+    return {
+        'min_streak': _config('AID_MIN_STREAK_MONTHS', 3),
+        'max_fund_share': share,
+        'max_fund_pct': int(share * 100),
+        'cooldown_days': _config('AID_COOLDOWN_DAYS', 90),
+        'auto_approve_max': _config('AID_AUTO_APPROVE_MAX_AMOUNT', 500),
+        'lookback_months': _config('AID_STREAK_LOOKBACK_MONTHS', 24),
+    }
+
+
+def create_screening(conn):
+    conn.execute(text(AID_SCREENING_DDL))
+    for name, body in AID_SCREENING_TRIGGERS.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body}'))
+
+
+def _month_index(dt):
+    return dt.year * 12 + dt.month - 1
+
+
+def _streak(months, aid_date):
+    """Consecutive contribution months ending with the aid's month (or the one before, not yet paid)."""
+    current = _month_index(aid_date)
+    if current not in months:
+        current -= 1
+    streak = 0
+    while current in months:
+        streak += 1
+        current -= 1
+    return streak
+
+
+def membership_facts(aid_ids=None, params=None):
+    """Facts of the pending aids (all of them, or `aid_ids`), oldest first within each group."""
+    params = params or settings()
+    where, args = '', {}
+    if aid_ids is not None:
+        args['ids'] = list(aid_ids)
+        if not args['ids']:
+            return []
+        where = 'AND t.id IN :ids'
+    stmt = text("SELECT t.id, t.group_id, t.user_id, t.amount, t.date, m.joined_at FROM 'transaction' t "
+                'LEFT JOIN membership m ON m.group_id = t.group_id AND m.user_id = t.user_id '
+                f"WHERE t.type = 'aide' AND t.status = 'pending' {where} ORDER BY t.group_id, t.date, t.id")
+    if where:
+        stmt = stmt.bindparams(bindparam('ids', expanding=True))
+    aids = [dict(r._mapping) for r in db.session.execute(stmt, args)]
+    if not aids:
+        return []
+    for a in aids:
+        for key in ('date', 'joined_at'):
+            if isinstance(a[key], str):
+                a[key] = datetime.fromisoformat(a[key])
+    users = sorted({a['user_id'] for a in aids})
+    groups = sorted({a['group_id'] for a in aids})
+    T = transaction_source(True)
+    scope = (T.user_id.in_(users), T.group_id.in_(groups), T.status == 'approved')
+    # Mois cotisés par (groupe, membre) sur la fenêtre d'examen, en une requête
+    since = min(a['date'] for a in aids) - timedelta(days=31 * params['lookback_months'])
+    month = func.strftime('%Y-%m', T.date)
+    paid = {}
+    for gid, uid, ym in db.session.execute(
+            select(T.group_id, T.user_id, month).where(*scope, T.type == 'cotisation', T.date >= since).distinct()):
+        year, mon = ym.split('-')
+        paid.setdefault((gid, uid), set()).add(int(year) * 12 + int(mon) - 1)
+    last_aid = {(gid, uid): last for gid, uid, last in db.session.execute(
+        select(T.group_id, T.user_id, func.max(T.date)).where(*scope, T.type == 'aide')
+        .group_by(T.group_id, T.user_id))}
+    funds = group_balances(groups)
+    for a in aids:
+        key = (a['group_id'], a['user_id'])
+        last = last_aid.get(key)
+        if isinstance(last, str):
+            last = datetime.fromisoformat(last)
+        a['tenure_days'] = (a['date'] - a['joined_at']).days if a['joined_at'] else None
+        a['streak'] = _streak(paid.get(key, ()), a['date'])
+        a['days_since_aid'] = (a['date'] - last).days if last else None
+        a['fund'] = funds.get(a['group_id'], 0)
+    return aids
+
+
+def evaluate(facts, params=None):
+    """Apply AID_RULES to each aid, drawing approvals from a running fund per group: {id: (decision, codes)}."""
+    params = params or settings()
+    remaining = {}
+    out = {}
+    for f in facts:
+        # Fonds restant après les aides du même groupe déjà retenues dans ce passage
+        f = dict(f, fund=remaining.setdefault(f['group_id'], f['fund']))
+        fired = [r for r in AID_RULES if r.test(f, params)]
+        codes = [r.code for r in fired]
+        if any(r.outcome == REJECT for r in fired):
+            out[f['id']] = (REJECT, [r.code for r in fired if r.outcome == REJECT])
+        elif fired:
+            out[f['id']] = (FLAG, codes)
+        else:
+            out[f['id']] = (APPROVE, [])
+            remaining[f['group_id']] -= f['amount']
+    return out
+
+
+def reason_messages(codes, params=None):
+    params = params or settings()
+    return [RULES_BY_CODE[c].message.format(**params) if c in RULES_BY_CODE else c for c in codes]
+
+
+def screening_for(aid_ids):
+    """{aid id: {'decision', 'reasons': [message, ...], 'screened_at'}} for the listed aids."""
+    aid_ids = list(aid_ids)
+    if not aid_ids:
+        return {}
+    params = settings()
+    rows = db.session.execute(text('SELECT id, decision, reasons, screened_at FROM aid_screening WHERE id IN :ids')
+                              .bindparams(bindparam('ids', expanding=True)), {'ids': aid_ids})
+    return {r.id: {'decision': r.decision, 'screened_at': r.screened_at,
+                   'reasons': reason_messages([c for c in (r.reasons or '').split(',') if c], params)}
+            for r in rows}
+
+
+def screen_aids(aid_ids=None, dry_run=False, now=None, logger=None):
+    """Evaluate the pending aids and apply the decisions. Returns a report with the counts per outcome."""
+    started = time.perf_counter()
+    now = now or datetime.utcnow()
+    params = settings()
+    decisions = evaluate(membership_facts(aid_ids, params), params)
+    # Mode 'flag' : la décision n'est qu'une recommandation affichée aux admins
+    apply = not dry_run and _config('AID_SCREENING_MODE', 'auto') != 'flag'
+    to_reject = [i for i, (d, _) in decisions.items() if d == REJECT]
+    to_approve = [i for i, (d, _) in decisions.items() if d == APPROVE]
+    if apply and to_reject:
+        decide_many(to_reject, 'reject', notes={i: '; '.join(reason_messages(decisions[i][1], params))
+                                                for i in to_reject})
+    if apply and to_approve:
+        for i, result in decide_many(to_approve, 'approve').items():
+            if result == 'insufficient_funds':
+                # Le fonds a bougé depuis le calcul des faits : laissé aux admins
+                decisions[i] = (FLAG, ['over_fund'])
+    if decisions and not dry_run:
+        db.session.execute(
+            text('INSERT INTO aid_screening (id, decision, reasons, screened_at) VALUES (:id, :d, :r, :at) '
+                 'ON CONFLICT (id) DO UPDATE SET decision = excluded.decision, reasons = excluded.reasons, '
+                 'screened_at = excluded.screened_at '
+                 # Inchangée : pas d'écriture, donc pas de nouvel ETag pour /admin à chaque passage
+                 'WHERE decision IS NOT excluded.decision OR reasons IS NOT excluded.reasons'
+                 ).bindparams(bindparam('at', type_=DateTime)),
+            [{'id': i, 'd': d, 'r': ','.join(codes), 'at': now} for i, (d, codes) in decisions.items()])
+        db.session.commit()
+    report = {'aids': len(decisions), APPROVE: 0, REJECT: 0, FLAG: 0, 'applied': apply}
+    for decision, _ in decisions.values():
+        report[decision] += 1
+    report['duration_s'] = round(time.perf_counter() - started, 3)
+    if logger and report['aids']:
+        logger.info('Aid screening: %s', report)
+    return report
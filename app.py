@@ -3,28 +3,41 @@ Application MyTakaful (Flask)
 - Authentification USER/ADMIN avec anti-bruteforce
 - Dashboards USER/ADMIN, paiements Stripe/PayPal, notifications SSE
 - Exports CSV/PDF, gestion utilisateurs/groupes
+- create_app() : aucune requête SQL ni thread à l'import ; schéma, admin et planificateur
+  passent par les commandes flask (voir cli.py et scheduler.py)
 """
 import os
-os.makedirs(os.path.join(os.path.dirname(__file__), "instance"), exist_ok=True)
 from functools import wraps
 import time
 import json
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, flash, g
+from flask import Blueprint, Flask, current_app, render_template, request, redirect, url_for, session, flash, g, stream_with_context
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy import text
-from models import db, User, Group, Membership, Transaction, Notification, group_balance
+from models import db, User, Group, Membership, Transaction, Notification, group_balance, group_balances, notify_user, notify_admins
 from config import Config
+from sqlite_profile import install_sqlite_profile
+from db_routing import REPLICA_BIND, init_read_your_writes, replica_reads
 from i18n import t, get_current_language, set_language, get_available_languages, get_language_direction
 from ai_assistant import ai_assistant
-
-app = Flask(__name__)
-app.config.from_object(Config)
-db.init_app(app)
-STRIPE_SECRET_KEY = app.config.get('STRIPE_SECRET_KEY')
-STRIPE_PUBLIC_KEY = app.config.get('STRIPE_PUBLIC_KEY')
-PAYPAL_CLIENT_ID = app.config.get('PAYPAL_CLIENT_ID')
-PAYPAL_CLIENT_SECRET = app.config.get('PAYPAL_CLIENT_SECRET')
+from providers import ProviderError, get_paypal_client, get_stripe
+from payments import find_provider_transactions, settle_transaction
+from webhooks import verify_stripe_signature, verify_paypal_signature, store_event
+from notifications import counter_state, mark_read, new_since, unread_count
+from reconciliation import run_reconciliation
+from cli import register_commands, seed_admin, upgrade_schema
+from assets import init_assets
+from template_cache import LazyMap, cached_page, group_versions, init_template_cache
+from http_cache import current_day, current_month, etag_versioned, group_scopes
+from aid_rules import screen_aids, screening_for
+from archive import archived_user_totals, delete_archived_user, install_archive_attach, notification_source, transaction_source
+from contribution_streaks import activity_rate, activity_rates, arrears
+from fund_history import fund_as_of, fund_series, invalidate_user
+from group_funds import approve, decide_many
+from group_purge import delete_groups, purge_status, set_archived
+from group_search import search_groups
+from user_directory import activity_counts, search_users
+
+bp = Blueprint('main', __name__)
 
 def current_user():
     uid = session.get('user_id')
@@ -40,7 +53,7 @@ def login_required(f):
     def wrapper(*args, **kwargs):
         if not current_user():
             flash('Veuillez vous connecter')
-            return redirect(url_for('login', next=request.path))
+            return redirect(url_for('main.login', next=request.path))
         return f(*args, **kwargs)
     return wrapper
 
@@ -51,42 +64,34 @@ def role_required(role):
             u = current_user()
             if not u:
                 flash('Veuillez vous connecter')
-                return redirect(url_for('login', next=request.path))
+                return redirect(url_for('main.login', next=request.path))
             if u.role != role:
                 flash('Accès non autorisé')
                 if u.role == 'admin':
-                    return redirect(url_for('admin'))
-                return redirect(url_for('dashboard'))
+                    return redirect(url_for('main.admin'))
+                return redirect(url_for('main.dashboard'))
             return f(*args, **kwargs)
         return wrapper
     return decorator
 
-@app.before_request
+@bp.before_app_request
 def load_user():
+    if request.blueprint == 'assets' or request.endpoint == 'static':
+        # Fichiers statiques : pas de session, donc pas de "Vary: Cookie"
+        return
     current_user()
 
-@app.route('/')
+@bp.route('/')
+@cached_page()
 def home():
     if 'user_id' in session:
         u = User.query.get(session.get('user_id'))
         if u and u.role == 'admin':
-            return redirect(url_for('admin'))
-        return redirect(url_for('groups'))
+            return redirect(url_for('main.admin'))
+        return redirect(url_for('main.groups'))
     return render_template('home.html')
 
-def notify_user(user_id, type_, message, group_id=None):
-    n = Notification(user_id=user_id, group_id=group_id, type=type_, message=message)
-    db.session.add(n)
-    db.session.commit()
-
-def notify_admins(type_, message, group_id=None):
-    admins = User.query.filter_by(role='admin').all()
-    for a in admins:
-        n = Notification(user_id=a.id, group_id=group_id, type=type_, message=message)
-        db.session.add(n)
-    db.session.commit()
-
-@app.route('/register', methods=['GET', 'POST'])
+@bp.route('/register', methods=['GET', 'POST'])
 def register():
     if request.method == 'POST':
         name = request.form.get('name', '').strip()
@@ -94,12 +99,12 @@ def register():
         password = request.form.get('password', '')
         if not name or not email or not password:
             flash('Veuillez remplir tous les champs')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         existing_username = User.query.filter_by(name=name).first()
         existing_email = User.query.filter_by(email=email).first()
         if existing_username or existing_email:
             flash('Utilisateur ou email déjà utilisé')
-            return redirect(url_for('register'))
+            return redirect(url_for('main.register'))
         role = 'user'
         has_admin = User.query.filter_by(role='admin').first()
         if not has_admin:
@@ -110,11 +115,11 @@ def register():
         db.session.commit()
         session['user_id'] = user.id
         if role == 'admin':
-            return redirect(url_for('admin'))
-        return redirect(url_for('groups'))
+            return redirect(url_for('main.admin'))
+        return redirect(url_for('main.groups'))
     return render_template('register.html')
 
-@app.route('/login', methods=['GET', 'POST'])
+@bp.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         identifier = request.form.get('identifier', '').strip() or request.form.get('name', '').strip()
@@ -126,10 +131,10 @@ def login():
         if user:
             if user.is_blocked:
                 flash('Compte bloqué')
-                return redirect(url_for('login'))
+                return redirect(url_for('main.login'))
             if user.lock_until and user.lock_until > datetime.utcnow():
                 flash('Trop de tentatives, réessayez plus tard')
-                return redirect(url_for('login'))
+                return redirect(url_for('main.login'))
         if not user or not check_password_hash(user.password_hash, password):
             if user:
                 user.failed_attempts = (user.failed_attempts or 0) + 1
@@ -139,7 +144,7 @@ def login():
                     user.is_blocked = True
                 db.session.commit()
             flash('Identifiants invalides')
-            return redirect(url_for('login'))
+            return redirect(url_for('main.login'))
         session['user_id'] = user.id
         user.failed_attempts = 0
         user.lock_until = None
@@ -147,118 +152,202 @@ def login():
         if next_url:
             return redirect(next_url)
         if user.role == 'admin':
-            return redirect(url_for('admin'))
-        return redirect(url_for('groups'))
+            return redirect(url_for('main.admin'))
+        return redirect(url_for('main.groups'))
     return render_template('login.html')
 
-@app.route('/logout')
+@bp.route('/logout')
 @login_required
 def logout():
     session.pop('user_id', None)
     flash('Déconnecté')
-    return redirect(url_for('login'))
+    return redirect(url_for('main.login'))
 
-@app.route('/dashboard')
+@bp.route('/dashboard')
 @login_required
+@etag_versioned()
 def dashboard():
     u = g.user
     if u.role == 'admin':
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     memberships = Membership.query.filter_by(user_id=u.id).all()
     joined_groups = [m.group for m in memberships]
-    available_groups = Group.query.filter(~Group.memberships.any(Membership.user_id == u.id), Group.archived == False).all()
-    transactions = Transaction.query.filter_by(user_id=u.id).order_by(Transaction.date.desc()).all()
-    transactions_json = [{
-        'date': t.date.isoformat(),
-        'type': t.type,
-        'amount': t.amount,
-        'status': t.status
-    } for t in transactions]
-    balances = {g.id: group_balance(g.id) for g in joined_groups}
+    # Aperçu seulement : la liste complète et la recherche sont sur /groups
+    available_groups = Group.query.filter(~Group.memberships.any(Membership.user_id == u.id), Group.archived == False).order_by(Group.id.desc()).limit(DASHBOARD_AVAILABLE_GROUPS).all()
+    balances = group_balances(g.id for g in joined_groups)
     total_balance = sum(balances.values()) if balances else 0
     total_monthly_due = sum(getattr(g, 'monthly_contribution', 0) for g in joined_groups)
-    aids_received = sum(t.amount for t in Transaction.query.filter_by(user_id=u.id, type='aide', status='approved').all())
+    aids_received = db.session.query(db.func.coalesce(db.func.sum(Transaction.amount), 0)).filter(Transaction.user_id == u.id, Transaction.type == 'aide', Transaction.status == 'approved').scalar() or 0
+    aids_received += archived_user_totals(u.id, 'aide', 'approved')[0]
     notes = Notification.query.filter_by(user_id=u.id).order_by(Notification.date.desc()).limit(20).all()
-    
-    group_funds = [{'name': g.name, 'fund': balances.get(g.id, 0)} for g in joined_groups]
-    return render_template('dashboard_user.html', user=u, joined_groups=joined_groups, available_groups=available_groups, transactions=transactions, transactions_json=transactions_json, balances=balances, total_balance=total_balance, total_monthly_due=total_monthly_due, aids_received=aids_received, notifications=notes, group_funds=group_funds, paypal_client_id=PAYPAL_CLIENT_ID, stripe_public_key=STRIPE_PUBLIC_KEY)
 
-@app.route('/groups')
+    group_funds = [{'name': g.name, 'fund': balances.get(g.id, 0)} for g in joined_groups]
+    # Historique et graphique chargés après affichage (voir les routes /api/dashboard/...)
+    return render_template('dashboard_user.html', user=u, joined_groups=joined_groups, available_groups=available_groups, balances=balances, total_balance=total_balance, total_monthly_due=total_monthly_due, aids_received=aids_received, notifications=notes, group_funds=group_funds, paypal_client_id=current_app.config.get('PAYPAL_CLIENT_ID'), stripe_public_key=current_app.config.get('STRIPE_PUBLIC_KEY'))
+
+API_PAGE_SIZE = 100
+GROUPS_PAGE_SIZE = 30
+DASHBOARD_AVAILABLE_GROUPS = 10
+API_MAX_PAGE_SIZE = 500
+
+def _columnar(columns, rows):
+    """Compact JSON payload: one list per column instead of one object per row."""
+    values = list(zip(*rows)) or [()] * len(columns)
+    return {c: list(v) for c, v in zip(columns, values)}
+
+def _page_args():
+    """Keyset pagination arguments: (before_id or None, limit)."""
+    before = request.args.get('before', type=int)
+    limit = request.args.get('limit', API_PAGE_SIZE, type=int)
+    return before, max(1, min(limit, API_MAX_PAGE_SIZE))
+
+def _paged(query, id_column, columns, serialize):
+    """Run a keyset page of `query` (newest id first) and wrap it with the next cursor."""
+    before, limit = _page_args()
+    if before is not None:
+        query = query.filter(id_column < before)
+    rows = query.order_by(id_column.desc()).limit(limit + 1).all()
+    more = len(rows) > limit
+    rows = [serialize(r) for r in rows[:limit]]
+    payload = _columnar(columns, rows)
+    payload['next'] = rows[-1][0] if more else None
+    return payload
+
+def _iso(dt):
+    return dt.isoformat(timespec='minutes') if dt else None
+
+def _include_archived():
+    """?archived=1 : history views and exports also read the archive tables (see archive.py)."""
+    return request.args.get('archived') == '1'
+
+@bp.route('/api/dashboard/transactions')
 @login_required
+@replica_reads
+@etag_versioned()
+def api_dashboard_transactions():
+    T = transaction_source(_include_archived())
+    q = db.session.query(T.id, T.date, T.type, T.amount, T.status, Group.name).join(Group, T.group_id == Group.id) \
+        .filter(T.user_id == g.user.id)
+    return _paged(q, T.id, ('id', 'date', 'type', 'amount', 'status', 'group'),
+                  lambda r: (r[0], _iso(r[1]), r[2], r[3], r[4], r[5]))
+
+@bp.route('/api/dashboard/group-funds')
+@login_required
+@replica_reads
+@etag_versioned()
+def api_dashboard_group_funds():
+    joined = db.session.query(Group.id, Group.name).join(Membership, Membership.group_id == Group.id) \
+        .filter(Membership.user_id == g.user.id).order_by(Group.id).all()
+    balances = group_balances(gid for gid, _ in joined)
+    return {'labels': [name for _, name in joined], 'values': [balances[gid] for gid, _ in joined]}
+
+@bp.route('/api/notifications')
+@login_required
+@replica_reads
+@etag_versioned()
+def api_notifications():
+    N = notification_source(_include_archived())
+    q = db.session.query(N.id, N.date, N.type, N.message, N.read).filter(N.user_id == g.user.id)
+    return _paged(q, N.id, ('id', 'date', 'type', 'message', 'read'),
+                  lambda r: (r[0], _iso(r[1]), r[2], r[3], bool(r[4])))
+
+@bp.route('/groups')
+@login_required
+@replica_reads
+@etag_versioned()
 def groups():
     u = g.user
     if u.role == 'admin':
-        return redirect(url_for('admin'))
-    all_groups = Group.query.filter_by(archived=False).order_by(Group.created_at.desc()).all()
-    membership_ids = {m.group_id for m in Membership.query.filter_by(user_id=u.id).all()}
-    funds = {gobj.id: group_balance(gobj.id) for gobj in all_groups}
-    return render_template('groups.html', user=u, all_groups=all_groups, membership_ids=membership_ids, funds=funds)
-
-@app.route('/admin')
-@role_required('admin')
-def admin():
-    users = User.query.count()
-    groups_qs = Group.query.filter_by(archived=False).all()
-    groups = len(groups_qs)
-    txs = Transaction.query.count()
-    totals = {g.id: group_balance(g.id) for g in groups_qs}
-    total_funds = sum(totals.values())
-    notes = Notification.query.filter_by(user_id=g.user.id).order_by(Notification.date.desc()).limit(20).all()
-    chart_labels = [g.name for g in groups_qs]
-    chart_values = [totals.get(g.id, 0) for g in groups_qs]
-    # Only show pending transactions in the recent transactions section
-    recent = Transaction.query.filter_by(status='pending').order_by(Transaction.date.desc()).limit(50).all()
-
+        return redirect(url_for('main.admin'))
+    q = request.args.get('q', '').strip()
+    after = request.args.get('after', '').strip()
+    if q:
+        results, next_cursor = search_groups(q, limit=GROUPS_PAGE_SIZE, after=after)
+        all_groups = results
+        page_ids = [r['id'] for r in results]
+        prefilled = {r['id']: r['fund'] for r in results}
+    else:
+        # Plus récents d'abord, par pages (clé : id décroissant)
+        page_q = Group.query.filter_by(archived=False)
+        if after.isdigit():
+            page_q = page_q.filter(Group.id < int(after))
+        all_groups = page_q.order_by(Group.id.desc()).limit(GROUPS_PAGE_SIZE + 1).all()
+        next_cursor = None
+        if len(all_groups) > GROUPS_PAGE_SIZE:
+            all_groups = all_groups[:GROUPS_PAGE_SIZE]
+            next_cursor = str(all_groups[-1].id)
+        page_ids = [gobj.id for gobj in all_groups]
+        prefilled = {}
+    my_groups = Group.query.join(Membership, Membership.group_id == Group.id) \
+        .filter(Membership.user_id == u.id, Group.archived == False).order_by(Group.id.desc()).all()
+    membership_ids = {gobj.id for gobj in my_groups}
+    # Soldes calculés seulement pour les cartes absentes du cache (voir template_cache.py)
+    funds = LazyMap(group_balance)
+    funds.update(prefilled)
+    versions = group_versions(set(page_ids) | membership_ids)
+    return render_template('groups.html', user=u, all_groups=all_groups, my_groups=my_groups,
+                           membership_ids=membership_ids, funds=funds, versions=versions, q=q, next_cursor=next_cursor)
+
+@bp.route('/api/groups/search')
+@login_required
+@etag_versioned()
+def api_groups_search():
+    _, limit = _page_args()
+    rows, next_cursor = search_groups(request.args.get('q', ''), limit=limit, after=request.args.get('after'))
+    columns = ('id', 'name', 'description', 'monthly_contribution', 'members', 'fund')
+    payload = _columnar(columns, [tuple(r[c] for c in columns) for r in rows])
+    payload['next'] = next_cursor
+    return payload
+
+def _admin_tx_filters(T=Transaction):
+    """Filters from the admin dashboard form on `T` (see transaction_source): (filters, group_id, start, end)."""
     gid = request.args.get('group_id', '').strip()
     start = request.args.get('start', '').strip()
     end = request.args.get('end', '').strip()
-    from datetime import datetime, timedelta
     filters = []
     if gid:
         try:
-            filters.append(Transaction.group_id == int(gid))
+            filters.append(T.group_id == int(gid))
         except Exception:
             pass
     if start:
         try:
             sd = datetime.strptime(start, '%Y-%m-%d')
-            filters.append(Transaction.date >= sd)
+            filters.append(T.date >= sd)
         except Exception:
             pass
     if end:
         try:
             ed = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-            filters.append(Transaction.date <= ed)
+            filters.append(T.date <= ed)
         except Exception:
             pass
-    base_q = Transaction.query
-    if filters:
-        for f in filters:
-            base_q = base_q.filter(f)
-    cotisations = base_q.filter(Transaction.type == 'cotisation', Transaction.status == 'approved').order_by(Transaction.date.desc()).all()
+    return filters, gid, start, end
+
+@bp.route('/admin')
+@role_required('admin')
+@etag_versioned(extra=current_month)
+def admin():
+    users = User.query.count()
+    groups_qs = Group.query.filter_by(archived=False).all()
+    groups = len(groups_qs)
+    txs = Transaction.query.count()
+    total_funds = sum(group_balances(g.id for g in groups_qs).values())
+    notes = Notification.query.filter_by(user_id=g.user.id).order_by(Notification.date.desc()).limit(20).all()
+    # Only show pending transactions in the recent transactions section
+    recent = Transaction.query.filter_by(status='pending').order_by(Transaction.date.desc()).limit(50).all()
+
+    filters, gid, start, end = _admin_tx_filters()
     # Only show pending aids in the admin dashboard
-    aides = base_q.filter(Transaction.type == 'aide', Transaction.status == 'pending').order_by(Transaction.date.desc()).all()
+    aides = Transaction.query.filter(*filters).filter(Transaction.type == 'aide', Transaction.status == 'pending').order_by(Transaction.date.desc()).all()
 
     active_members = Membership.query.join(Group, Membership.group_id == Group.id).filter(Group.archived == False).count()
     pending_aids = Transaction.query.filter_by(type='aide', status='pending').count()
-    from datetime import datetime
     now_dt = datetime.utcnow()
     start_month = datetime(now_dt.year, now_dt.month, 1)
     monthly_revenue = db.session.query(db.func.coalesce(db.func.sum(Transaction.amount), 0)).filter(Transaction.type == 'cotisation', Transaction.status == 'approved', Transaction.date >= start_month).scalar() or 0
 
-    aid_status_counts = {
-        'pending': Transaction.query.filter_by(type='aide', status='pending').count(),
-        'approved': Transaction.query.filter_by(type='aide', status='approved').count(),
-        'rejected': Transaction.query.filter_by(type='aide', status='rejected').count(),
-    }
-    # contributions per day for current month
-    revenue_by_day = {}
-    for t in Transaction.query.filter(Transaction.type == 'cotisation', Transaction.status == 'approved', Transaction.date >= start_month).all():
-        d = t.date.strftime('%Y-%m-%d')
-        revenue_by_day[d] = revenue_by_day.get(d, 0) + t.amount
-    revenue_labels = sorted(revenue_by_day.keys())
-    revenue_values = [revenue_by_day[d] for d in revenue_labels]
-
+    # Graphiques et liste des cotisations chargés après affichage (voir les routes /api/admin/...)
     return render_template(
         'dashboard_admin.html',
         user_count=users,
@@ -266,24 +355,107 @@ def admin():
         tx_count=txs,
         total_funds=total_funds,
         notifications=notes,
-        chart_labels=chart_labels,
-        chart_values=chart_values,
         transactions=recent,
         active_members=active_members,
         pending_aids=pending_aids,
         monthly_revenue=monthly_revenue,
-        aid_status_counts=aid_status_counts,
-        revenue_labels=revenue_labels,
-        revenue_values=revenue_values,
         groups_list=groups_qs,
         selected_group_id=gid,
         start_date=start,
         end_date=end,
-        cotisations=cotisations,
+        archived=_include_archived(),
         aides=aides,
+        screening=screening_for(a.id for a in aides),
     )
 
-@app.route('/create-group', methods=['GET', 'POST'])
+@bp.route('/api/admin/cotisations')
+@role_required('admin')
+@replica_reads
+@etag_versioned()
+def api_admin_cotisations():
+    T = transaction_source(_include_archived())
+    filters, _, _, _ = _admin_tx_filters(T)
+    q = db.session.query(T.id, T.date, T.amount, User.name, Group.name) \
+        .join(User, T.user_id == User.id).join(Group, T.group_id == Group.id) \
+        .filter(*filters).filter(T.type == 'cotisation', T.status == 'approved')
+    return _paged(q, T.id, ('id', 'date', 'amount', 'user', 'group'),
+                  lambda r: (r[0], _iso(r[1]), r[2], r[3], r[4]))
+
+def _chart_group_funds():
+    groups_qs = db.session.query(Group.id, Group.name).filter(Group.archived == False).order_by(Group.id).all()
+    totals = group_balances(gid for gid, _ in groups_qs)
+    return {'labels': [name for _, name in groups_qs], 'values': [totals[gid] for gid, _ in groups_qs]}
+
+def _chart_aid_status():
+    counts = dict(db.session.query(Transaction.status, db.func.count(Transaction.id))
+                  .filter(Transaction.type == 'aide').group_by(Transaction.status).all())
+    labels = ['pending', 'approved', 'rejected']
+    return {'labels': labels, 'values': [counts.get(s, 0) for s in labels]}
+
+def _chart_revenue():
+    # contributions per day for current month
+    now_dt = datetime.utcnow()
+    start_month = datetime(now_dt.year, now_dt.month, 1)
+    day = db.func.strftime('%Y-%m-%d', Transaction.date)
+    rows = db.session.query(day, db.func.sum(Transaction.amount)) \
+        .filter(Transaction.type == 'cotisation', Transaction.status == 'approved', Transaction.date >= start_month) \
+        .group_by(day).order_by(day).all()
+    return _columnar(('labels', 'values'), rows)
+
+ADMIN_CHARTS = {
+    'group-funds': _chart_group_funds,
+    'aid-status': _chart_aid_status,
+    'revenue': _chart_revenue,
+}
+
+@bp.route('/api/admin/charts/<name>')
+@role_required('admin')
+@replica_reads
+@etag_versioned(extra=current_month)
+def api_admin_chart(name):
+    if name not in ADMIN_CHARTS:
+        return {'error': 'unknown_chart'}, 404
+    return ADMIN_CHARTS[name]()
+
+def _date_arg(name, end_of_day=False):
+    """?<name>=YYYY-MM-DD as a datetime (the next midnight when `end_of_day`), None when absent or invalid."""
+    try:
+        day = datetime.strptime(request.args.get(name, ''), '%Y-%m-%d')
+    except ValueError:
+        return None
+    return day + timedelta(days=1) if end_of_day else day
+
+@bp.route('/api/admin/groups/<int:id>/fund')
+@role_required('admin')
+@replica_reads
+@etag_versioned(lambda view_args: (f"group:{view_args['id']}",))
+def api_admin_group_fund(id):
+    Group.query.get_or_404(id)
+    at = _date_arg('at', end_of_day=True)
+    return {'group_id': id, 'at': _iso(at), 'fund': fund_as_of(id, at)}
+
+@bp.route('/api/admin/groups/<int:id>/fund-history')
+@role_required('admin')
+@replica_reads
+# Série arrêtée à aujourd'hui par défaut : dernier point daté du jour, nouveau point chaque mois
+@etag_versioned(lambda view_args: (f"group:{view_args['id']}",), extra=current_day)
+def api_admin_group_fund_history(id):
+    Group.query.get_or_404(id)
+    series = fund_series(id, _date_arg('start'), _date_arg('end', end_of_day=True))
+    return _columnar(('labels', 'values'), [(d.strftime('%Y-%m-%d'), v) for d, v in series])
+
+@bp.route('/api/admin/groups/<int:id>/arrears')
+@role_required('admin')
+@replica_reads
+# Retards calculés par rapport au mois en cours : il fait partie de l'ETag
+@etag_versioned(lambda view_args: (f"group:{view_args['id']}",), extra=current_month)
+def api_admin_group_arrears(id):
+    Group.query.get_or_404(id)
+    rows = arrears(id, request.args.get('min_months', 1, type=int))
+    columns = ('user_id', 'name', 'last_paid', 'months_in_arrears', 'total_paid')
+    return _columnar(columns, [tuple(r[c] for c in columns) for r in rows])
+
+@bp.route('/create-group', methods=['GET', 'POST'])
 @login_required
 def create_group():
     u = g.user
@@ -293,11 +465,11 @@ def create_group():
         monthly_val = 10
         if not name:
             flash('Nom du groupe requis')
-            return redirect(url_for('create_group'))
+            return redirect(url_for('main.create_group'))
         existing = Group.query.filter_by(name=name).first()
         if existing:
             flash('Nom du groupe déjà utilisé')
-            return redirect(url_for('create_group'))
+            return redirect(url_for('main.create_group'))
         gobj = Group(name=name, description=description, monthly_contribution=monthly_val, created_by=u.id)
         db.session.add(gobj)
         db.session.commit()
@@ -306,10 +478,10 @@ def create_group():
         db.session.commit()
         flash('Groupe créé')
         notify_admins('group_created', f"Groupe '{name}' créé", group_id=gobj.id)
-        return redirect(url_for('group_details', id=gobj.id))
+        return redirect(url_for('main.group_details', id=gobj.id))
     return render_template('create_group.html')
 
-@app.route('/group/<int:id>')
+@bp.route('/group/<int:id>')
 @login_required
 def group_details(id):
     u = g.user
@@ -319,9 +491,10 @@ def group_details(id):
     bal = group_balance(id)
     # Get user's aids for this group
     user_aids = Transaction.query.filter_by(group_id=id, user_id=u.id, type='aide').order_by(Transaction.date.desc()).all()
-    return render_template('group_details.html', group=gobj, members=members, transactions=txs, balance=bal, user_aids=user_aids)
+    return render_template('group_details.html', group=gobj, members=members, transactions=txs, balance=bal, user_aids=user_aids,
+                           version=group_versions([id])[id])
 
-@app.route('/join-group/<int:id>', methods=['POST'])
+@bp.route('/join-group/<int:id>', methods=['POST'])
 @login_required
 def join_group(id):
     u = g.user
@@ -329,16 +502,16 @@ def join_group(id):
     existing = Membership.query.filter_by(user_id=u.id, group_id=id).first()
     if existing:
         flash('Déjà membre')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     m = Membership(user_id=u.id, group_id=id)
     db.session.add(m)
     db.session.commit()
     flash('Groupe rejoint')
     notify_user(u.id, 'group_join', f"Vous avez rejoint le groupe '{gobj.name}'", group_id=id)
     notify_admins('group_join', f"{u.name} a rejoint le groupe '{gobj.name}'", group_id=id)
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/leave-group/<int:id>', methods=['POST'])
+@bp.route('/leave-group/<int:id>', methods=['POST'])
 @login_required
 def leave_group(id):
     u = g.user
@@ -346,15 +519,15 @@ def leave_group(id):
     m = Membership.query.filter_by(user_id=u.id, group_id=id).first()
     if not m:
         flash('Vous n’êtes pas membre de ce groupe')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     db.session.delete(m)
     db.session.commit()
     notify_user(u.id, 'group_leave', f"Vous avez quitté le groupe '{gobj.name}'", group_id=id)
     notify_admins('group_leave', f"{u.name} a quitté le groupe '{gobj.name}'", group_id=id)
     flash('Groupe quitté')
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/request-aid/<int:id>', methods=['POST'])
+@bp.route('/request-aid/<int:id>', methods=['POST'])
 @login_required
 def request_aid(id):
     u = g.user
@@ -367,7 +540,7 @@ def request_aid(id):
             raise ValueError()
     except Exception:
         flash("Montant d'aide invalide")
-        return redirect(url_for('group_details', id=id))
+        return redirect(url_for('main.group_details', id=id))
     t = Transaction(group_id=id, user_id=u.id, amount=amt, type='aide', status='pending', reason=reason)
     db.session.add(t)
     db.session.commit()
@@ -376,30 +549,35 @@ def request_aid(id):
     if reason:
         msg += f" — Motif: {reason}"
     notify_admins('aid_request', msg, group_id=id)
-    return redirect(url_for('group_details', id=id))
+    return redirect(url_for('main.group_details', id=id))
 
-@app.route('/admin/transactions')
+@bp.route('/admin/transactions')
 @role_required('admin')
 def admin_transactions():
     txs = Transaction.query.order_by(Transaction.date.desc()).all()
     return render_template('dashboard_admin.html', transactions=txs, users=User.query.all(), groups=Group.query.all())
 
-@app.route('/admin/export/csv')
+@bp.route('/admin/export/csv')
 @role_required('admin')
+@replica_reads
+@etag_versioned()
 def export_csv():
     import csv
     from io import StringIO
     si = StringIO()
     writer = csv.writer(si)
     writer.writerow(['id','date','type','amount','status','user','group'])
-    for t in Transaction.query.order_by(Transaction.date.asc()).all():
+    T = transaction_source(_include_archived())
+    for t in db.session.query(T).order_by(T.date.asc()).all():
         writer.writerow([t.id, t.date.isoformat(), t.type, t.amount, t.status, getattr(t.user, 'name', ''), getattr(t.group, 'name', '')])
-    resp = app.response_class(si.getvalue(), mimetype='text/csv')
+    resp = current_app.response_class(si.getvalue(), mimetype='text/csv')
     resp.headers['Content-Disposition'] = 'attachment; filename="transactions.csv"'
     return resp
 
-@app.route('/admin/export/cotisations.csv')
+@bp.route('/admin/export/cotisations.csv')
 @role_required('admin')
+@replica_reads
+@etag_versioned()
 def export_cotisations_csv():
     import csv
     from io import StringIO
@@ -407,35 +585,38 @@ def export_cotisations_csv():
     start = request.args.get('start', '').strip()
     end = request.args.get('end', '').strip()
     from datetime import datetime, timedelta
-    q = Transaction.query.filter(Transaction.type == 'cotisation', Transaction.status == 'approved')
+    T = transaction_source(_include_archived())
+    q = db.session.query(T).filter(T.type == 'cotisation', T.status == 'approved')
     if gid:
         try:
-            q = q.filter(Transaction.group_id == int(gid))
+            q = q.filter(T.group_id == int(gid))
         except Exception:
             pass
     if start:
         try:
             sd = datetime.strptime(start, '%Y-%m-%d')
-            q = q.filter(Transaction.date >= sd)
+            q = q.filter(T.date >= sd)
         except Exception:
             pass
     if end:
         try:
             ed = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-            q = q.filter(Transaction.date <= ed)
+            q = q.filter(T.date <= ed)
         except Exception:
             pass
     si = StringIO()
     w = csv.writer(si)
     w.writerow(['id','date','amount','user','group'])
-    for t in q.order_by(Transaction.date.asc()).all():
+    for t in q.order_by(T.date.asc()).all():
         w.writerow([t.id, t.date.isoformat(), t.amount, getattr(t.user, 'name', ''), getattr(t.group, 'name', '')])
-    resp = app.response_class(si.getvalue(), mimetype='text/csv')
+    resp = current_app.response_class(si.getvalue(), mimetype='text/csv')
     resp.headers['Content-Disposition'] = 'attachment; filename="cotisations.csv"'
     return resp
 
-@app.route('/admin/export/aides.csv')
+@bp.route('/admin/export/aides.csv')
 @role_required('admin')
+@replica_reads
+@etag_versioned()
 def export_aides_csv():
     import csv
     from io import StringIO
@@ -443,35 +624,38 @@ def export_aides_csv():
     start = request.args.get('start', '').strip()
     end = request.args.get('end', '').strip()
     from datetime import datetime, timedelta
-    q = Transaction.query.filter(Transaction.type == 'aide')
+    T = transaction_source(_include_archived())
+    q = db.session.query(T).filter(T.type == 'aide')
     if gid:
         try:
-            q = q.filter(Transaction.group_id == int(gid))
+            q = q.filter(T.group_id == int(gid))
         except Exception:
             pass
     if start:
         try:
             sd = datetime.strptime(start, '%Y-%m-%d')
-            q = q.filter(Transaction.date >= sd)
+            q = q.filter(T.date >= sd)
         except Exception:
             pass
     if end:
         try:
             ed = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-            q = q.filter(Transaction.date <= ed)
+            q = q.filter(T.date <= ed)
         except Exception:
             pass
     si = StringIO()
     w = csv.writer(si)
     w.writerow(['id','date','amount','user','group','reason','status'])
-    for t in q.order_by(Transaction.date.asc()).all():
+    for t in q.order_by(T.date.asc()).all():
         w.writerow([t.id, t.date.isoformat(), t.amount, getattr(t.user, 'name', ''), getattr(t.group, 'name', ''), getattr(t, 'reason', '') or '', t.status])
-    resp = app.response_class(si.getvalue(), mimetype='text/csv')
+    resp = current_app.response_class(si.getvalue(), mimetype='text/csv')
     resp.headers['Content-Disposition'] = 'attachment; filename="aides.csv"'
     return resp
 
-@app.route('/admin/export/cotisations.pdf')
+@bp.route('/admin/export/cotisations.pdf')
 @role_required('admin')
+@replica_reads
+@etag_versioned()
 def export_cotisations_pdf():
     from reportlab.pdfgen import canvas
     from reportlab.lib.pagesizes import A4
@@ -480,22 +664,23 @@ def export_cotisations_pdf():
     start = request.args.get('start', '').strip()
     end = request.args.get('end', '').strip()
     from datetime import datetime, timedelta
-    q = Transaction.query.filter(Transaction.type == 'cotisation', Transaction.status == 'approved')
+    T = transaction_source(_include_archived())
+    q = db.session.query(T).filter(T.type == 'cotisation', T.status == 'approved')
     if gid:
         try:
-            q = q.filter(Transaction.group_id == int(gid))
+            q = q.filter(T.group_id == int(gid))
         except Exception:
             pass
     if start:
         try:
             sd = datetime.strptime(start, '%Y-%m-%d')
-            q = q.filter(Transaction.date >= sd)
+            q = q.filter(T.date >= sd)
         except Exception:
             pass
     if end:
         try:
             ed = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-            q = q.filter(Transaction.date <= ed)
+            q = q.filter(T.date <= ed)
         except Exception:
             pass
     buf = BytesIO()
@@ -506,7 +691,7 @@ def export_cotisations_pdf():
     c.drawString(40, y, "Cotisations")
     y -= 24
     c.setFont("Helvetica", 11)
-    for t in q.order_by(Transaction.date.asc()).all():
+    for t in q.order_by(T.date.asc()).all():
         line = f"{t.date.strftime('%Y-%m-%d')} | {t.amount} MAD | {getattr(t.user,'name','')} | {getattr(t.group,'name','')}"
         c.drawString(40, y, line)
         y -= 18
@@ -515,12 +700,14 @@ def export_cotisations_pdf():
     c.showPage(); c.save()
     pdf = buf.getvalue()
     buf.close()
-    resp = app.response_class(pdf, mimetype='application/pdf')
+    resp = current_app.response_class(pdf, mimetype='application/pdf')
     resp.headers['Content-Disposition'] = 'attachment; filename="cotisations.pdf"'
     return resp
 
-@app.route('/admin/export/aides.pdf')
+@bp.route('/admin/export/aides.pdf')
 @role_required('admin')
+@replica_reads
+@etag_versioned()
 def export_aides_pdf():
     from reportlab.pdfgen import canvas
     from reportlab.lib.pagesizes import A4
@@ -529,22 +716,23 @@ def export_aides_pdf():
     start = request.args.get('start', '').strip()
     end = request.args.get('end', '').strip()
     from datetime import datetime, timedelta
-    q = Transaction.query.filter(Transaction.type == 'aide')
+    T = transaction_source(_include_archived())
+    q = db.session.query(T).filter(T.type == 'aide')
     if gid:
         try:
-            q = q.filter(Transaction.group_id == int(gid))
+            q = q.filter(T.group_id == int(gid))
         except Exception:
             pass
     if start:
         try:
             sd = datetime.strptime(start, '%Y-%m-%d')
-            q = q.filter(Transaction.date >= sd)
+            q = q.filter(T.date >= sd)
         except Exception:
             pass
     if end:
         try:
             ed = datetime.strptime(end, '%Y-%m-%d') + timedelta(days=1) - timedelta(seconds=1)
-            q = q.filter(Transaction.date <= ed)
+            q = q.filter(T.date <= ed)
         except Exception:
             pass
     buf = BytesIO()
@@ -555,7 +743,7 @@ def export_aides_pdf():
     c.drawString(40, y, "Aides")
     y -= 24
     c.setFont("Helvetica", 11)
-    for t in q.order_by(Transaction.date.asc()).all():
+    for t in q.order_by(T.date.asc()).all():
         line = f"{t.date.strftime('%Y-%m-%d')} | {getattr(t.user,'name','')} | {t.amount} MAD | {getattr(t,'reason','') or ''} | {t.status}"
         c.drawString(40, y, line)
         y -= 18
@@ -564,12 +752,14 @@ def export_aides_pdf():
     c.showPage(); c.save()
     pdf = buf.getvalue()
     buf.close()
-    resp = app.response_class(pdf, mimetype='application/pdf')
+    resp = current_app.response_class(pdf, mimetype='application/pdf')
     resp.headers['Content-Disposition'] = 'attachment; filename="aides.pdf"'
     return resp
 
-@app.route('/admin/export/pdf')
+@bp.route('/admin/export/pdf')
 @role_required('admin')
+@replica_reads
+@etag_versioned()
 def export_pdf():
     from reportlab.lib.pagesizes import A4
     from reportlab.pdfgen import canvas
@@ -593,40 +783,26 @@ def export_pdf():
     c.save()
     pdf = buf.getvalue()
     buf.close()
-    resp = app.response_class(pdf, mimetype='application/pdf')
+    resp = current_app.response_class(pdf, mimetype='application/pdf')
     resp.headers['Content-Disposition'] = 'attachment; filename="rapport.pdf"'
     return resp
 
-@app.route('/admin/transaction/<int:tx_id>/approve', methods=['POST'])
+@bp.route('/admin/transaction/<int:tx_id>/approve', methods=['POST'])
 @role_required('admin')
 def approve_transaction(tx_id):
     t = Transaction.query.get_or_404(tx_id)
-    if t.type == 'aide':
-        bal = group_balance(t.group_id)
-        if bal < t.amount:
-            flash('Fonds insuffisants pour approuver l’aide')
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return '', 200
-            return redirect(url_for('admin'))
-    
-    # Approve the transaction
-    old_status = t.status
-    t.status = 'approved'
-    db.session.commit()
-    
-    # Update group funds if this is a contribution
-    if t.type == 'cotisation' and old_status != 'approved':
-        # Add the amount to the group balance
-        membership = Membership.query.filter_by(user_id=t.user_id, group_id=t.group_id).first()
-        if membership:
-            try:
-                # Credit the group with the contribution amount
-                group_membership = Membership.query.filter_by(group_id=t.group_id).first()
-                if group_membership and hasattr(group_membership, 'balance'):
-                    group_membership.balance = (group_membership.balance or 0) + t.amount
-            except Exception:
-                pass
-            db.session.commit()
+    # One conditional UPDATE: an aid only passes if the group fund covers it at write time (see group_funds.py)
+    result = approve(t.id)
+    if result == 'insufficient_funds':
+        flash('Fonds insuffisants pour approuver l’aide')
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return '', 200
+        return redirect(url_for('main.admin'))
+    if result == 'already_approved':
+        flash('Transaction déjà approuvée')
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return '', 200
+        return redirect(url_for('main.admin'))
     
     flash('Transaction approuvée avec succès', 'success')
     notify_user(t.user_id, 'aid_approved' if t.type == 'aide' else 'tx_approved', 'Transaction approuvée', group_id=t.group_id)
@@ -636,9 +812,9 @@ def approve_transaction(tx_id):
     # Return appropriate response based on request type
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return '', 200
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
 
-@app.route('/admin/transaction/<int:tx_id>/reject', methods=['POST'])
+@bp.route('/admin/transaction/<int:tx_id>/reject', methods=['POST'])
 @role_required('admin')
 def reject_transaction(tx_id):
     t = Transaction.query.get_or_404(tx_id)
@@ -649,9 +825,9 @@ def reject_transaction(tx_id):
     # Return appropriate response based on request type
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return '', 200
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
 
-@app.route('/admin/aide/<int:aid_id>/approve', methods=['POST'])
+@bp.route('/admin/aide/<int:aid_id>/approve', methods=['POST'])
 @role_required('admin')
 def approve_aid(aid_id):
     t = Transaction.query.get_or_404(aid_id)
@@ -661,19 +837,20 @@ def approve_aid(aid_id):
         flash('Transaction invalide')
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return '', 400
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     
-    # Check if group has sufficient funds
-    bal = group_balance(t.group_id)
-    if bal < t.amount:
+    # Approve the aid only if the group has sufficient funds, checked and written in one statement
+    result = approve(t.id)
+    if result == 'insufficient_funds':
         flash('Fonds insuffisants pour approuver l’aide')
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return '', 400
-        return redirect(url_for('admin'))
-    
-    # Approve the aid
-    t.status = 'approved'
-    db.session.commit()
+        return redirect(url_for('main.admin'))
+    if result == 'already_approved':
+        flash('Aide déjà approuvée')
+        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return '', 200
+        return redirect(url_for('main.admin'))
     
     flash('Aide approuvée avec succès', 'success')
     notify_user(t.user_id, 'aid_approved', 'Votre demande d’aide a été approuvée', group_id=t.group_id)
@@ -682,9 +859,9 @@ def approve_aid(aid_id):
     # Return appropriate response based on request type
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return '', 200
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
 
-@app.route('/admin/aide/<int:aid_id>/reject', methods=['POST'])
+@bp.route('/admin/aide/<int:aid_id>/reject', methods=['POST'])
 @role_required('admin')
 def reject_aid(aid_id):
     t = Transaction.query.get_or_404(aid_id)
@@ -694,7 +871,7 @@ def reject_aid(aid_id):
         flash('Transaction invalide')
         if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
             return '', 400
-        return redirect(url_for('admin'))
+        return redirect(url_for('main.admin'))
     
     # Reject the aid
     t.status = 'rejected'
@@ -706,9 +883,58 @@ def reject_aid(aid_id):
     # Return appropriate response based on request type
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return '', 200
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
+
+@bp.route('/admin/transactions/bulk', methods=['POST'])
+@role_required('admin')
+def bulk_decide_transactions():
+    # JSON {"action": "approve"|"reject", "ids": [...]} or the admin form (action, ids)
+    data = request.get_json(silent=True) if request.is_json else None
+    if data is not None:
+        action, ids = data.get('action'), data.get('ids') or []
+    else:
+        action, ids = request.form.get('action'), request.form.getlist('ids')
+    wants_json = request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest'
+    try:
+        ids = [int(i) for i in ids]
+    except (TypeError, ValueError):
+        ids = None
+    limit = current_app.config.get('BULK_DECISION_MAX_IDS', 1000)
+    if action not in ('approve', 'reject') or not ids or len(ids) > limit:
+        if wants_json:
+            return {'error': 'invalid_request', 'max_ids': limit}, 400
+        flash('Sélection invalide')
+        return redirect(url_for('main.admin'))
+    results = decide_many(ids, action)
+    counts = {}
+    for result in results.values():
+        counts[result] = counts.get(result, 0) + 1
+    if wants_json:
+        return {'results': {str(k): v for k, v in results.items()}, 'counts': counts}
+    done = counts.get('approved' if action == 'approve' else 'rejected', 0)
+    message = f"{done} transaction(s) {'approuvée(s)' if action == 'approve' else 'refusée(s)'}"
+    if counts.get('insufficient_funds'):
+        message += f", {counts['insufficient_funds']} aide(s) non approuvée(s) faute de fonds"
+    flash(message)
+    return redirect(url_for('main.admin'))
+
+@bp.route('/admin/aides/screen', methods=['POST'])
+@role_required('admin')
+def screen_pending_aids():
+    report = screen_aids(logger=current_app.logger)
+    if report['applied']:
+        flash(f"Pré-examen : {report['approve']} aide(s) approuvée(s), {report['reject']} refusée(s), "
+              f"{report['flag']} à examiner")
+    else:
+        flash(f"Pré-examen : {report['aids']} aide(s) annotée(s), aucune décision prise (mode recommandation)")
+    return redirect(url_for('main.admin'))
 
-@app.route('/admin/force-contribution/<int:user_id>/<int:group_id>', methods=['POST'])
+@bp.route('/admin/reconcile', methods=['POST'])
+@role_required('admin')
+def admin_reconcile():
+    return run_reconciliation()
+
+@bp.route('/admin/force-contribution/<int:user_id>/<int:group_id>', methods=['POST'])
 @role_required('admin')
 def force_contribution(user_id, group_id):
     gobj = Group.query.get_or_404(group_id)
@@ -719,9 +945,9 @@ def force_contribution(user_id, group_id):
     flash('Cotisation forcée')
     notify_user(user_id, 'contribution_paid', f"Cotisation de {gobj.monthly_contribution} MAD enregistrée", group_id=group_id)
     notify_admins('contribution_paid', f"Cotisation enregistrée pour utilisateur #{user_id}", group_id=group_id)
-    return redirect(url_for('admin'))
+    return redirect(url_for('main.admin'))
 
-@app.route('/pay-contribution/<int:group_id>', methods=['POST'])
+@bp.route('/pay-contribution/<int:group_id>', methods=['POST'])
 @login_required
 def pay_contribution(group_id):
     u = g.user
@@ -729,50 +955,55 @@ def pay_contribution(group_id):
     membership = Membership.query.filter_by(user_id=u.id, group_id=group_id).first()
     if not membership:
         flash('Vous devez rejoindre le groupe pour cotiser')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     t = Transaction(group_id=group_id, user_id=u.id, amount=gobj.monthly_contribution, type='cotisation', status='approved')
     db.session.add(t)
     db.session.commit()
     flash('Cotisation payée')
     notify_user(u.id, 'contribution_paid', f"Cotisation de {gobj.monthly_contribution} MAD payée", group_id=group_id)
     notify_admins('contribution_paid', f"{u.name} a payé sa cotisation", group_id=group_id)
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/pay/stripe/create-checkout-session/<int:group_id>', methods=['POST'])
+@bp.route('/pay/stripe/create-checkout-session/<int:group_id>', methods=['POST'])
 @login_required
 def create_checkout_session(group_id):
-    if not STRIPE_SECRET_KEY or not STRIPE_PUBLIC_KEY:
+    if not current_app.config.get('STRIPE_SECRET_KEY') or not current_app.config.get('STRIPE_PUBLIC_KEY'):
         flash('Paiement Stripe indisponible (clé manquante)')
-        return redirect(url_for('dashboard'))
-    import stripe
-    stripe.api_key = STRIPE_SECRET_KEY
+        return redirect(url_for('main.dashboard'))
+    stripe = get_stripe(current_app.config)
     u = g.user
     gobj = Group.query.get_or_404(group_id)
     membership = Membership.query.filter_by(user_id=u.id, group_id=group_id).first()
     if not membership:
         flash('Vous devez rejoindre le groupe pour cotiser')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     amount_cents = int(gobj.monthly_contribution) * 100
-    session_obj = stripe.checkout.Session.create(
-        payment_method_types=['card'],
-        line_items=[{
-            'price_data': {
-                'currency': 'mad',
-                'product_data': {'name': f'Cotisation {gobj.name}'},
-                'unit_amount': amount_cents,
-            },
-            'quantity': 1,
-        }],
-        mode='payment',
-        success_url=url_for('stripe_success', group_id=group_id, _external=True),
-        cancel_url=url_for('stripe_cancel', group_id=group_id, _external=True),
-    )
+    try:
+        session_obj = stripe.checkout.Session.create(
+            payment_method_types=['card'],
+            line_items=[{
+                'price_data': {
+                    'currency': 'mad',
+                    'product_data': {'name': f'Cotisation {gobj.name}'},
+                    'unit_amount': amount_cents,
+                },
+                'quantity': 1,
+            }],
+            mode='payment',
+            # {CHECKOUT_SESSION_ID} est remplacé par Stripe : ne pas l'échapper via url_for
+            success_url=url_for('main.stripe_success', group_id=group_id, _external=True) + '&session_id={CHECKOUT_SESSION_ID}',
+            cancel_url=url_for('main.stripe_cancel', group_id=group_id, _external=True),
+        )
+    except stripe.StripeError:
+        current_app.logger.exception('Stripe checkout session creation failed')
+        flash('Paiement Stripe indisponible')
+        return redirect(url_for('main.dashboard'))
     t = Transaction(group_id=group_id, user_id=u.id, amount=gobj.monthly_contribution, type='cotisation', status='pending', provider='stripe', external_id=session_obj.id)
     db.session.add(t)
     db.session.commit()
     return redirect(session_obj.url)
 
-@app.route('/pay', methods=['GET', 'POST'])
+@bp.route('/pay', methods=['GET', 'POST'])
 @login_required
 def pay():
     u = g.user
@@ -783,9 +1014,9 @@ def pay():
         membership = Membership.query.filter_by(user_id=u.id, group_id=group_id).first()
         if not membership:
             flash('Vous devez rejoindre le groupe pour cotiser')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         if provider == 'stripe':
-            return redirect(url_for('create_checkout_session', group_id=group_id))
+            return redirect(url_for('main.create_checkout_session', group_id=group_id))
         elif provider == 'internal':
             t = Transaction(group_id=group_id, user_id=u.id, amount=gobj.monthly_contribution, type='cotisation', status='approved')
             db.session.add(t)
@@ -793,13 +1024,13 @@ def pay():
             notify_user(u.id, 'contribution_paid', f"Cotisation de {gobj.monthly_contribution} MAD payée", group_id=group_id)
             notify_admins('contribution_paid', f"{u.name} a payé sa cotisation", group_id=group_id)
             flash('Cotisation payée')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         elif provider == 'paypal':
             flash('Utilisez le bouton PayPal sur la page de paiement')
-            return redirect(url_for('pay', group_id=group_id))
+            return redirect(url_for('main.pay', group_id=group_id))
         else:
             flash('Fournisseur inconnu')
-            return redirect(url_for('pay'))
+            return redirect(url_for('main.pay'))
     # GET
     q_group_id = request.args.get('group_id', None)
     groups = Group.query.filter(~Group.memberships.any(Membership.user_id == u.id) == False, Group.archived == False).all()
@@ -810,9 +1041,9 @@ def pay():
             selected = Group.query.get(gid)
         except Exception:
             selected = None
-    return render_template('pay.html', user=u, groups=groups, selected_group=selected, paypal_client_id=PAYPAL_CLIENT_ID, stripe_public_key=STRIPE_PUBLIC_KEY)
+    return render_template('pay.html', user=u, groups=groups, selected_group=selected, paypal_client_id=current_app.config.get('PAYPAL_CLIENT_ID'), stripe_public_key=current_app.config.get('STRIPE_PUBLIC_KEY'))
 
-@app.route('/paiement', methods=['GET', 'POST'])
+@bp.route('/paiement', methods=['GET', 'POST'])
 @login_required
 def paiement():
     u = g.user
@@ -831,11 +1062,11 @@ def paiement():
                 raise ValueError()
         except Exception:
             flash('Montant invalide (minimum 10 MAD)')
-            return redirect(url_for('paiement'))
+            return redirect(url_for('main.paiement'))
         
         if not mode:
             flash('Veuillez choisir un mode de paiement')
-            return redirect(url_for('paiement', group_id=group_id))
+            return redirect(url_for('main.paiement', group_id=group_id))
         
         # Map mode to provider
         provider = 'stripe' if mode == 'carte' else ('paypal' if mode == 'paypal' else 'internal')
@@ -844,7 +1075,7 @@ def paiement():
         membership = Membership.query.filter_by(user_id=u.id, group_id=group_id).first()
         if not membership:
             flash('Vous devez rejoindre le groupe pour cotiser')
-            return redirect(url_for('dashboard'))
+            return redirect(url_for('main.dashboard'))
         
         # Process payment directly (simulated) - create with pending status
         t = Transaction(group_id=group_id, user_id=u.id, amount=amount, type='cotisation', status='pending', provider=provider)
@@ -862,7 +1093,7 @@ def paiement():
         notify_user(u.id, 'contribution_paid', f"Cotisation de {amount} MAD payée (Simulation {mode_text})", group_id=group_id)
         notify_admins('contribution_paid', f"Cotisation simulée via {mode_text} pour utilisateur #{u.id}", group_id=group_id)
         flash(f'Paiement simulé via {mode_text}')
-        return redirect(url_for('dashboard'))
+        return redirect(url_for('main.dashboard'))
     # GET
     q_group_id = request.args.get('group_id', None)
     groups = Group.query.filter(Group.memberships.any(Membership.user_id == u.id), Group.archived == False).all()
@@ -874,29 +1105,21 @@ def paiement():
             selected = Group.query.get(gid)
         except Exception:
             selected = None
-    return render_template('paiement.html', user=u, groups=groups, balances=balances, selected_group=selected, paypal_client_id=PAYPAL_CLIENT_ID, stripe_public_key=STRIPE_PUBLIC_KEY)
+    return render_template('paiement.html', user=u, groups=groups, balances=balances, selected_group=selected, paypal_client_id=current_app.config.get('PAYPAL_CLIENT_ID'), stripe_public_key=current_app.config.get('STRIPE_PUBLIC_KEY'))
 
 def paypal_access_token():
-    import base64, requests
-    if not PAYPAL_CLIENT_ID or not PAYPAL_CLIENT_SECRET:
-        return None
-    auth = base64.b64encode(f"{PAYPAL_CLIENT_ID}:{PAYPAL_CLIENT_SECRET}".encode()).decode()
-    r = requests.post('https://api-m.sandbox.paypal.com/v1/oauth2/token', headers={'Authorization': f'Basic {auth}'}, data={'grant_type': 'client_credentials'})
-    if r.status_code == 200:
-        return r.json().get('access_token')
-    return None
+    return get_paypal_client(current_app.config).access_token()
 
-@app.route('/pay/paypal/create-order/<int:group_id>', methods=['POST'])
+@bp.route('/pay/paypal/create-order/<int:group_id>', methods=['POST'])
 @login_required
 def paypal_create_order(group_id):
-    import requests
     u = g.user
     gobj = Group.query.get_or_404(group_id)
     membership = Membership.query.filter_by(user_id=u.id, group_id=group_id).first()
     if not membership:
         return {'error': 'join_required'}, 400
-    token = paypal_access_token()
-    if not token:
+    client = get_paypal_client(current_app.config)
+    if not client.configured:
         return {'error': 'paypal_not_configured'}, 400
     body = {
         'intent': 'CAPTURE',
@@ -904,8 +1127,12 @@ def paypal_create_order(group_id):
             'amount': {'currency_code': 'USD', 'value': str(gobj.monthly_contribution)}
         }]
     }
-    r = requests.post('https://api-m.sandbox.paypal.com/v2/checkout/orders', json=body, headers={'Authorization': f'Bearer {token}', 'Content-Type': 'application/json'})
-    if r.status_code != 201:
+    try:
+        r = client.create_order(body)
+    except ProviderError:
+        current_app.logger.exception('PayPal create-order failed')
+        r = None
+    if r is None or r.status_code != 201:
         return {'error': 'order_failed'}, 400
     order = r.json()
     t = Transaction(group_id=group_id, user_id=u.id, amount=gobj.monthly_contribution, type='cotisation', status='pending', provider='paypal', external_id=order['id'])
@@ -913,86 +1140,164 @@ def paypal_create_order(group_id):
     db.session.commit()
     return {'id': order['id']}
 
-@app.route('/pay/paypal/capture/<order_id>')
+@bp.route('/pay/paypal/capture/<order_id>')
 @login_required
 def paypal_capture(order_id):
-    import requests
-    token = paypal_access_token()
-    if not token:
+    client = get_paypal_client(current_app.config)
+    if not client.configured:
         flash('PayPal indisponible')
-        return redirect(url_for('dashboard'))
-    r = requests.post(f'https://api-m.sandbox.paypal.com/v2/checkout/orders/{order_id}/capture', headers={'Authorization': f'Bearer {token}'})
-    if r.status_code != 201:
+        return redirect(url_for('main.dashboard'))
+    try:
+        r = client.capture_order(order_id)
+    except ProviderError:
+        current_app.logger.exception('PayPal capture failed')
+        r = None
+    if r is None or r.status_code != 201:
         flash('Échec capture PayPal')
-        return redirect(url_for('dashboard'))
-    t = Transaction.query.filter_by(external_id=order_id, provider='paypal', status='pending').first()
-    if t:
-        t.status = 'approved'
+        return redirect(url_for('main.dashboard'))
+    t = find_provider_transactions('paypal', [order_id]).get(order_id)
+    if t and settle_transaction(t, 'approved'):
         db.session.commit()
-        notify_user(t.user_id, 'contribution_paid', f"Cotisation de {t.amount} MAD payée (PayPal)", group_id=t.group_id)
-        notify_admins('contribution_paid', f"Cotisation PayPal capturée pour utilisateur #{t.user_id}", group_id=t.group_id)
     flash('Paiement PayPal réussi')
-    return redirect(url_for('dashboard'))
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/pay/stripe/success')
+@bp.route('/pay/stripe/success')
 @login_required
 def stripe_success():
-    group_id = int(request.args.get('group_id'))
     u = g.user
-    t = Transaction.query.filter_by(group_id=group_id, user_id=u.id, type='cotisation', status='pending', provider='stripe').order_by(Transaction.date.desc()).first()
-    if t:
-        t.status = 'approved'
-        db.session.commit()
-        notify_user(u.id, 'contribution_paid', f"Cotisation de {t.amount} MAD payée (Stripe)", group_id=group_id)
-        notify_admins('contribution_paid', f"{u.name} a payé sa cotisation (Stripe)", group_id=group_id)
-    flash('Paiement réussi')
-    return redirect(url_for('dashboard'))
+    session_id = request.args.get('session_id', '').strip()
+    t = find_provider_transactions('stripe', [session_id]).get(session_id) if session_id else None
+    if not t or t.user_id != u.id:
+        flash('Paiement reçu, confirmation en cours')
+        return redirect(url_for('main.dashboard'))
+    if t.status == 'pending' and not current_app.config.get('STRIPE_WEBHOOK_SECRET'):
+        # Sans webhook configuré, on interroge Stripe pour cette session précise
+        try:
+            session_obj = get_stripe(current_app.config).checkout.Session.retrieve(session_id)
+            if session_obj.payment_status in ('paid', 'no_payment_required') and settle_transaction(t, 'approved'):
+                db.session.commit()
+        except Exception:
+            current_app.logger.exception('Stripe session lookup failed')
+    if t.status == 'approved':
+        flash('Paiement réussi')
+    else:
+        flash('Paiement reçu, confirmation en cours')
+    return redirect(url_for('main.dashboard'))
 
-@app.route('/pay/stripe/cancel')
+@bp.route('/pay/stripe/cancel')
 @login_required
 def stripe_cancel():
     flash('Paiement annulé')
-    return redirect(url_for('dashboard'))
-
-@app.route('/notifications/stream')
+    return redirect(url_for('main.dashboard'))
+
+@bp.route('/webhooks/stripe', methods=['POST'])
+def stripe_webhook():
+    payload = request.get_data()
+    secret = current_app.config.get('STRIPE_WEBHOOK_SECRET')
+    if not verify_stripe_signature(payload, request.headers.get('Stripe-Signature', ''), secret):
+        return {'error': 'invalid_signature'}, 400
+    try:
+        event = json.loads(payload)
+    except ValueError:
+        return {'error': 'invalid_payload'}, 400
+    if not event.get('id'):
+        return {'error': 'invalid_payload'}, 400
+    created = store_event('stripe', event['id'], event.get('type'), payload.decode('utf-8'))
+    return {'received': True, 'duplicate': not created}
+
+@bp.route('/webhooks/paypal', methods=['POST'])
+def paypal_webhook():
+    event = request.get_json(silent=True)
+    if not event or not event.get('id'):
+        return {'error': 'invalid_payload'}, 400
+    try:
+        valid = verify_paypal_signature(get_paypal_client(current_app.config), current_app.config.get('PAYPAL_WEBHOOK_ID'), request.headers, event)
+    except ProviderError:
+        # PayPal renverra l'événement : réponse non-2xx
+        current_app.logger.exception('PayPal webhook verification failed')
+        return {'error': 'verification_unavailable'}, 503
+    if not valid:
+        return {'error': 'invalid_signature'}, 400
+    created = store_event('paypal', event['id'], event.get('event_type'), request.get_data(as_text=True))
+    return {'received': True, 'duplicate': not created}
+
+@bp.route('/notifications/stream')
 @login_required
 def notifications_stream():
+    interval = current_app.config.get('NOTIFICATION_STREAM_SECONDS', 3)
     def event_stream(uid):
-        last_id = None
+        # Une lecture de notification_counter par tour ; la liste n'est relue que si elle a changé
+        unread, last_id = counter_state(uid)
+        db.session.remove()
+        yield f"data: {json.dumps({'unread': unread, 'items': []})}\n\n"
         while True:
-            q = Notification.query.filter_by(user_id=uid).order_by(Notification.date.desc()).limit(5).all()
-            payload = [{'id': getattr(n, 'id', 0), 'message': n.message, 'date': n.date.isoformat()} for n in q]
-            yield f"data: {json.dumps(payload)}\n\n"
-            time.sleep(3)
-    return app.response_class(event_stream(g.user.id), mimetype='text/event-stream')
+            time.sleep(interval)
+            state = counter_state(uid)
+            items = new_since(uid, last_id) if state[1] > last_id else []
+            # Pas de connexion gardée pendant l'attente
+            db.session.remove()
+            if state == (unread, last_id):
+                continue
+            unread, last_id = state
+            yield f"data: {json.dumps({'unread': unread, 'items': items}, default=str)}\n\n"
+    return current_app.response_class(stream_with_context(event_stream(g.user.id)), mimetype='text/event-stream')
+
+def _notifications_done(unread):
+    if request.is_json:
+        return {'unread': unread}
+    return redirect(request.referrer or url_for('main.dashboard'))
+
+@bp.route('/notifications/read', methods=['POST'])
+@login_required
+def notifications_mark_read():
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get('ids') if request.is_json else request.form.getlist('ids')
+    try:
+        ids = [int(i) for i in ids or []]
+    except (TypeError, ValueError):
+        return {'error': 'invalid_ids'}, 400
+    return _notifications_done(mark_read(g.user.id, ids))
 
-@app.route('/admin/users')
+@bp.route('/notifications/read-all', methods=['POST'])
+@login_required
+def notifications_mark_all_read():
+    return _notifications_done(mark_read(g.user.id))
+
+@bp.route('/admin/users')
 @role_required('admin')
 def admin_users():
-    users = User.query.order_by(User.created_at.desc()).all()
-    return render_template('admin_users.html', users=users)
-
-@app.route('/admin/users/<int:id>')
+    # Base principale : user_fts n'est pas répliqué (voir user_directory.py)
+    q = request.args.get('q', '').strip()
+    role = request.args.get('role', '').strip()
+    status = request.args.get('status', '').strip()
+    users, next_before = search_users(q, role=role, status=status, before=request.args.get('before', type=int))
+    return render_template('admin_users.html', users=users, counts=activity_counts(u.id for u in users),
+                           q=q, role=role, status=status, next_before=next_before, now=datetime.utcnow())
+
+@bp.route('/admin/users/<int:id>')
 @role_required('admin')
 def admin_user_detail(id):
     u = User.query.get_or_404(id)
     groups = [m.group for m in Membership.query.filter_by(user_id=id).all()]
-    cotisations = Transaction.query.filter_by(user_id=id, type='cotisation', status='approved').order_by(Transaction.date.desc()).all()
-    aides = Transaction.query.filter_by(user_id=id, type='aide').order_by(Transaction.date.desc()).all()
-    return render_template('admin_user_detail.html', user_detail=u, groups=groups, cotisations=cotisations, aides=aides)
+    archived = _include_archived()
+    T = transaction_source(archived)
+    cotisations = db.session.query(T).filter(T.user_id == id, T.type == 'cotisation', T.status == 'approved').order_by(T.date.desc()).all()
+    aides = db.session.query(T).filter(T.user_id == id, T.type == 'aide').order_by(T.date.desc()).all()
+    return render_template('admin_user_detail.html', user_detail=u, groups=groups, cotisations=cotisations, aides=aides, archived=archived)
 
-@app.route('/admin/user/<int:id>/block', methods=['POST'])
+@bp.route('/admin/user/<int:id>/block', methods=['POST'])
 @role_required('admin')
 def admin_user_block(id):
     u = User.query.get_or_404(id)
     u.is_blocked = True
     db.session.commit()
     flash('Utilisateur bloqué')
-    return redirect(url_for('admin_users'))
+    return redirect(url_for('main.admin_users'))
 
-def calculate_group_stats(group, start_date='', end_date=''):
+def calculate_group_stats(group, start_date='', end_date='', include_archived=False):
     """Calculate statistics for a specific group"""
     from datetime import datetime, timedelta
+    T = transaction_source(include_archived)
     
     # Parse dates if provided
     start_dt = None
@@ -1008,39 +1313,31 @@ def calculate_group_stats(group, start_date='', end_date=''):
         except Exception:
             pass
     
-    # Get all members
-    members = Membership.query.filter_by(group_id=group.id).all()
-    total_members = len(members)
-    
-    # Get active members (those who have paid in the last 3 months)
-    active_threshold = datetime.utcnow() - timedelta(days=90)
-    active_members = Membership.query.filter(
-        Membership.group_id == group.id,
-        Membership.joined_at >= active_threshold
-    ).count()
+    # Members and those up to date with their contributions (see contribution_streaks.py)
+    total_members, active_members = activity_rates([group.id]).get(group.id, (0, 0))
     
     # Calculate activity rate
-    activity_rate = (active_members / total_members * 100) if total_members > 0 else 0
+    rate = (active_members / total_members * 100) if total_members > 0 else 0
     
     # Get transactions with filters
-    tx_query = Transaction.query.filter_by(group_id=group.id)
+    tx_query = db.session.query(T).filter(T.group_id == group.id)
     
     # Apply date filters
     if start_dt:
-        tx_query = tx_query.filter(Transaction.date >= start_dt)
+        tx_query = tx_query.filter(T.date >= start_dt)
     if end_dt:
-        tx_query = tx_query.filter(Transaction.date <= end_dt)
+        tx_query = tx_query.filter(T.date <= end_dt)
     
     # Get approved contributions
     contributions = tx_query.filter(
-        Transaction.type == 'cotisation',
-        Transaction.status == 'approved'
+        T.type == 'cotisation',
+        T.status == 'approved'
     ).all()
     
     # Get approved aids
     aids = tx_query.filter(
-        Transaction.type == 'aide',
-        Transaction.status == 'approved'
+        T.type == 'aide',
+        T.status == 'approved'
     ).all()
     
     # Calculate totals
@@ -1049,36 +1346,41 @@ def calculate_group_stats(group, start_date='', end_date=''):
     
     # Get current group balance
     current_balance = group_balance(group.id)
+    # Fund at the end of the selected period (monthly checkpoint + delta, see fund_history.py)
+    balance_at_end = fund_as_of(group.id, end_dt + timedelta(seconds=1)) if end_dt else None
     
     # Get contributions this month
     now = datetime.utcnow()
     start_of_month = datetime(now.year, now.month, 1)
-    monthly_contributions = Transaction.query.filter(
-        Transaction.group_id == group.id,
-        Transaction.type == 'cotisation',
-        Transaction.status == 'approved',
-        Transaction.date >= start_of_month
+    monthly_contributions = db.session.query(T).filter(
+        T.group_id == group.id,
+        T.type == 'cotisation',
+        T.status == 'approved',
+        T.date >= start_of_month
     ).count()
     
     # Get total aid requests
-    total_aid_requests = Transaction.query.filter(
-        Transaction.group_id == group.id,
-        Transaction.type == 'aide'
+    total_aid_requests = db.session.query(T).filter(
+        T.group_id == group.id,
+        T.type == 'aide'
     ).count()
     
     return {
         'total_members': total_members,
         'current_balance': current_balance,
+        'balance_at_end': balance_at_end,
         'total_contributions': total_contributions,
         'monthly_contributions': monthly_contributions,
         'total_aid_requests': total_aid_requests,
         'total_aids': total_aids,
-        'activity_rate': round(activity_rate, 1)
+        'activity_rate': round(rate, 1),
+        'members_in_arrears': total_members - active_members
     }
 
-def get_group_transactions(group, start_date='', end_date=''):
+def get_group_transactions(group, start_date='', end_date='', include_archived=False):
     """Get transaction data for charts and table"""
     from datetime import datetime, timedelta
+    T = transaction_source(include_archived)
     
     # Parse dates if provided
     start_dt = None
@@ -1095,22 +1397,23 @@ def get_group_transactions(group, start_date='', end_date=''):
             pass
     
     # Get transactions with filters
-    tx_query = Transaction.query.filter_by(group_id=group.id)
+    tx_query = db.session.query(T).filter(T.group_id == group.id)
     
     # Apply date filters
     if start_dt:
-        tx_query = tx_query.filter(Transaction.date >= start_dt)
+        tx_query = tx_query.filter(T.date >= start_dt)
     if end_dt:
-        tx_query = tx_query.filter(Transaction.date <= end_dt)
+        tx_query = tx_query.filter(T.date <= end_dt)
     
     # Order by date descending
-    transactions = tx_query.order_by(Transaction.date.desc()).all()
+    transactions = tx_query.order_by(T.date.desc()).all()
     
     return transactions
 
-def calculate_overall_stats(start_date='', end_date=''):
+def calculate_overall_stats(start_date='', end_date='', include_archived=False):
     """Calculate overall statistics for all groups"""
     from datetime import datetime, timedelta
+    T = transaction_source(include_archived)
     
     # Parse dates if provided
     start_dt = None
@@ -1134,24 +1437,24 @@ def calculate_overall_stats(start_date='', end_date=''):
     total_members = Membership.query.count()
     
     # Get transactions with filters
-    tx_query = Transaction.query
+    tx_query = db.session.query(T)
     
     # Apply date filters
     if start_dt:
-        tx_query = tx_query.filter(Transaction.date >= start_dt)
+        tx_query = tx_query.filter(T.date >= start_dt)
     if end_dt:
-        tx_query = tx_query.filter(Transaction.date <= end_dt)
+        tx_query = tx_query.filter(T.date <= end_dt)
     
     # Get approved contributions
     contributions = tx_query.filter(
-        Transaction.type == 'cotisation',
-        Transaction.status == 'approved'
+        T.type == 'cotisation',
+        T.status == 'approved'
     ).all()
     
     # Get approved aids
     aids = tx_query.filter(
-        Transaction.type == 'aide',
-        Transaction.status == 'approved'
+        T.type == 'aide',
+        T.status == 'approved'
     ).all()
     
     # Calculate totals
@@ -1165,30 +1468,27 @@ def calculate_overall_stats(start_date='', end_date=''):
     now = datetime.utcnow()
     start_of_month = datetime(now.year, now.month, 1)
     
-    monthly_tx_query = Transaction.query
+    monthly_tx_query = db.session.query(T)
     if start_dt:
-        monthly_tx_query = monthly_tx_query.filter(Transaction.date >= start_dt)
+        monthly_tx_query = monthly_tx_query.filter(T.date >= start_dt)
     if end_dt:
-        monthly_tx_query = monthly_tx_query.filter(Transaction.date <= end_dt)
+        monthly_tx_query = monthly_tx_query.filter(T.date <= end_dt)
     
     monthly_contributions = monthly_tx_query.filter(
-        Transaction.type == 'cotisation',
-        Transaction.status == 'approved',
-        Transaction.date >= start_of_month
+        T.type == 'cotisation',
+        T.status == 'approved',
+        T.date >= start_of_month
     ).count()
     
     # Get total aid requests
-    aid_query = Transaction.query.filter(Transaction.type == 'aide')
+    aid_query = db.session.query(T).filter(T.type == 'aide')
     if start_dt:
-        aid_query = aid_query.filter(Transaction.date >= start_dt)
+        aid_query = aid_query.filter(T.date >= start_dt)
     if end_dt:
-        aid_query = aid_query.filter(Transaction.date <= end_dt)
+        aid_query = aid_query.filter(T.date <= end_dt)
     
     total_aid_requests = aid_query.count()
     
-    # Calculate average activity rate (simplified)
-    activity_rate = 75.0  # Placeholder - would need more complex calculation
-    
     return {
         'total_groups': total_groups,
         'total_members': total_members,
@@ -1197,12 +1497,13 @@ def calculate_overall_stats(start_date='', end_date=''):
         'monthly_contributions': monthly_contributions,
         'total_aid_requests': total_aid_requests,
         'total_aids': total_aids,
-        'activity_rate': activity_rate
+        'activity_rate': activity_rate()
     }
 
-def get_all_transactions(start_date='', end_date=''):
+def get_all_transactions(start_date='', end_date='', include_archived=False):
     """Get all transactions for charts and table"""
     from datetime import datetime, timedelta
+    T = transaction_source(include_archived)
     
     # Parse dates if provided
     start_dt = None
@@ -1219,21 +1520,23 @@ def get_all_transactions(start_date='', end_date=''):
             pass
     
     # Get transactions with filters
-    tx_query = Transaction.query
+    tx_query = db.session.query(T)
     
     # Apply date filters
     if start_dt:
-        tx_query = tx_query.filter(Transaction.date >= start_dt)
+        tx_query = tx_query.filter(T.date >= start_dt)
     if end_dt:
-        tx_query = tx_query.filter(Transaction.date <= end_dt)
+        tx_query = tx_query.filter(T.date <= end_dt)
     
     # Order by date descending
-    transactions = tx_query.order_by(Transaction.date.desc()).all()
+    transactions = tx_query.order_by(T.date.desc()).all()
     
     return transactions
 
-@app.route('/admin/group-statistics')
+@bp.route('/admin/group-statistics')
 @role_required('admin')
+@replica_reads
+@etag_versioned(group_scopes('group_id'), extra=current_month)
 def admin_group_statistics():
     # Get all groups
     groups = Group.query.all()
@@ -1250,6 +1553,7 @@ def admin_group_statistics():
     # Get date filters
     start_date = request.args.get('start', '').strip()
     end_date = request.args.get('end', '').strip()
+    archived = _include_archived()
     
     # Get group status filter
     group_status = request.args.get('group_status', 'all').strip()
@@ -1266,12 +1570,12 @@ def admin_group_statistics():
     
     if selected_group:
         # Calculate statistics for selected group
-        stats = calculate_group_stats(selected_group, start_date, end_date)
-        transactions_data = get_group_transactions(selected_group, start_date, end_date)
+        stats = calculate_group_stats(selected_group, start_date, end_date, archived)
+        transactions_data = get_group_transactions(selected_group, start_date, end_date, archived)
     elif not group_id:
         # Calculate overall statistics if no group selected
-        stats = calculate_overall_stats(start_date, end_date)
-        transactions_data = get_all_transactions(start_date, end_date)
+        stats = calculate_overall_stats(start_date, end_date, archived)
+        transactions_data = get_all_transactions(start_date, end_date, archived)
     
     return render_template(
         'admin_group_statistics.html',
@@ -1281,10 +1585,11 @@ def admin_group_statistics():
         transactions=transactions_data,
         start_date=start_date,
         end_date=end_date,
-        group_status=group_status
+        group_status=group_status,
+        archived=archived
     )
 
-@app.route('/admin/user/<int:id>/unblock', methods=['POST'])
+@bp.route('/admin/user/<int:id>/unblock', methods=['POST'])
 @role_required('admin')
 def admin_user_unblock(id):
     u = User.query.get_or_404(id)
@@ -1293,27 +1598,27 @@ def admin_user_unblock(id):
     u.lock_until = None
     db.session.commit()
     flash('Utilisateur débloqué')
-    return redirect(url_for('admin_users'))
+    return redirect(url_for('main.admin_users'))
 
-@app.route('/admin/user/<int:id>/make-admin', methods=['POST'])
+@bp.route('/admin/user/<int:id>/make-admin', methods=['POST'])
 @role_required('admin')
 def admin_user_make_admin(id):
     u = User.query.get_or_404(id)
     u.role = 'admin'
     db.session.commit()
     flash('Utilisateur promu admin')
-    return redirect(url_for('admin_users'))
+    return redirect(url_for('main.admin_users'))
 
-@app.route('/admin/user/<int:id>/make-user', methods=['POST'])
+@bp.route('/admin/user/<int:id>/make-user', methods=['POST'])
 @role_required('admin')
 def admin_user_make_user(id):
     u = User.query.get_or_404(id)
     u.role = 'user'
     db.session.commit()
     flash('Utilisateur rétrogradé en user')
-    return redirect(url_for('admin_users'))
+    return redirect(url_for('main.admin_users'))
 
-@app.route('/admin/users/<int:id>', methods=['DELETE', 'POST'])
+@bp.route('/admin/users/<int:id>', methods=['DELETE', 'POST'])
 @role_required('admin')
 def admin_user_delete(id):
     me = g.user
@@ -1321,26 +1626,32 @@ def admin_user_delete(id):
     if target.id == me.id:
         if request.method == 'POST':
             flash('Impossible de supprimer votre propre compte')
-            return redirect(url_for('admin_users'))
+            return redirect(url_for('main.admin_users'))
         return {'error': 'cannot_delete_self'}, 400
     admin_count = User.query.filter_by(role='admin').count()
     if target.role == 'admin' and admin_count <= 1:
         if request.method == 'POST':
             flash('Impossible de supprimer le dernier admin')
-            return redirect(url_for('admin_users'))
+            return redirect(url_for('main.admin_users'))
         return {'error': 'cannot_delete_last_admin'}, 400
+    # Groups created by this user are kept and handed over to the deleting admin (foreign keys are enforced)
+    Group.query.filter_by(created_by=id).update({'created_by': me.id})
     Membership.query.filter_by(user_id=id).delete()
+    invalidate_user(id)
     Transaction.query.filter_by(user_id=id).delete()
     Notification.query.filter_by(user_id=id).delete()
+    delete_archived_user(id)
     db.session.delete(target)
     db.session.commit()
     if request.method == 'POST':
         flash('Utilisateur supprimé')
-        return redirect(url_for('admin_users'))
+        return redirect(url_for('main.admin_users'))
     return {'ok': True}
 
-@app.route('/admin/export/group-statistics.csv')
+@bp.route('/admin/export/group-statistics.csv')
 @role_required('admin')
+@replica_reads
+@etag_versioned(group_scopes('group_id'), extra=current_month)
 def export_group_statistics_csv():
     from io import StringIO
     import csv
@@ -1350,16 +1661,17 @@ def export_group_statistics_csv():
     group_id = request.args.get('group_id', '').strip()
     start_date = request.args.get('start', '').strip()
     end_date = request.args.get('end', '').strip()
+    archived = _include_archived()
     
     # Get transactions
     if group_id:
         try:
             group = Group.query.get(int(group_id))
-            transactions = get_group_transactions(group, start_date, end_date)
+            transactions = get_group_transactions(group, start_date, end_date, archived)
         except Exception:
             transactions = []
     else:
-        transactions = get_all_transactions(start_date, end_date)
+        transactions = get_all_transactions(start_date, end_date, archived)
     
     # Create CSV
     output = StringIO()
@@ -1394,8 +1706,10 @@ def export_group_statistics_csv():
         headers={'Content-Disposition': 'attachment; filename=group-statistics.csv'}
     )
 
-@app.route('/admin/export/group-statistics.pdf')
+@bp.route('/admin/export/group-statistics.pdf')
 @role_required('admin')
+@replica_reads
+@etag_versioned(group_scopes('group_id'), extra=current_month)
 def export_group_statistics_pdf():
     from io import BytesIO
     from flask import Response
@@ -1408,16 +1722,17 @@ def export_group_statistics_pdf():
     group_id = request.args.get('group_id', '').strip()
     start_date = request.args.get('start', '').strip()
     end_date = request.args.get('end', '').strip()
+    archived = _include_archived()
     
     # Get transactions
     if group_id:
         try:
             group = Group.query.get(int(group_id))
-            transactions = get_group_transactions(group, start_date, end_date)
+            transactions = get_group_transactions(group, start_date, end_date, archived)
         except Exception:
             transactions = []
     else:
-        transactions = get_all_transactions(start_date, end_date)
+        transactions = get_all_transactions(start_date, end_date, archived)
     
     # Create PDF
     buffer = BytesIO()
@@ -1476,7 +1791,7 @@ def export_group_statistics_pdf():
         headers={'Content-Disposition': 'attachment; filename=group-statistics.pdf'}
     )
 
-@app.route('/admin/groups', methods=['GET', 'POST'])
+@bp.route('/admin/groups', methods=['GET', 'POST'])
 @role_required('admin')
 def admin_groups():
     if request.method == 'POST':
@@ -1485,38 +1800,46 @@ def admin_groups():
         monthly_val = 10
         if not name:
             flash('Nom du groupe requis')
-            return redirect(url_for('admin_groups'))
+            return redirect(url_for('main.admin_groups'))
         existing = Group.query.filter_by(name=name).first()
         if existing:
             flash('Nom du groupe déjà utilisé')
-            return redirect(url_for('admin_groups'))
+            return redirect(url_for('main.admin_groups'))
         gobj = Group(name=name, description=description, monthly_contribution=monthly_val, created_by=g.user.id)
         db.session.add(gobj)
         db.session.commit()
         flash('Groupe créé')
         notify_admins('group_created', f"Groupe '{name}' créé", group_id=gobj.id)
-        return redirect(url_for('admin_groups'))
+        return redirect(url_for('main.admin_groups'))
     groups = Group.query.order_by(Group.created_at.desc()).all()
-    funds = {g.id: group_balance(g.id) for g in groups}
-    return render_template('admin_groups.html', groups=groups, funds=funds)
+    funds = group_balances(g.id for g in groups)
+    purges = purge_status()
+    return render_template('admin_groups.html', groups=groups, funds=funds, purges=purges)
 
-@app.route('/delete-account', methods=['POST'])
+@bp.route('/delete-account', methods=['POST'])
 @login_required
 def delete_account():
     u = g.user
-    # Delete user's transactions
+    # Hand the groups this user created over to an admin (foreign keys are enforced)
+    heir = User.query.filter(User.role == 'admin', User.id != u.id).order_by(User.id).first()
+    if heir:
+        Group.query.filter_by(created_by=u.id).update({'created_by': heir.id})
+    # Delete user's transactions (the funds history of their groups is recomputed)
+    invalidate_user(u.id)
     Transaction.query.filter_by(user_id=u.id).delete()
     # Delete user's memberships
     Membership.query.filter_by(user_id=u.id).delete()
     # Delete user's notifications
     Notification.query.filter_by(user_id=u.id).delete()
+    # Delete the user's archived history
+    delete_archived_user(u.id)
     # Delete the user
     db.session.delete(u)
     db.session.commit()
     flash('Votre compte a été supprimé définitivement')
-    return redirect(url_for('logout'))
+    return redirect(url_for('main.logout'))
 
-@app.route('/profile', methods=['GET', 'POST'])
+@bp.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
     u = g.user
@@ -1528,28 +1851,30 @@ def profile():
         # Check if passwords match when changing password
         if password and password != password_confirm:
             flash('Les mots de passe ne correspondent pas')
-            return redirect(url_for('profile'))
+            return redirect(url_for('main.profile'))
         
         if email:
             exists = User.query.filter(User.email == email, User.id != u.id).first()
             if exists:
                 flash('Email déjà utilisé')
-                return redirect(url_for('profile'))
+                return redirect(url_for('main.profile'))
             u.email = email
         if password:
             if len(password) < 6:
                 flash('Mot de passe trop court (minimum 6 caractères)')
-                return redirect(url_for('profile'))
+                return redirect(url_for('main.profile'))
             u.password_hash = generate_password_hash(password)
         db.session.commit()
         flash('Profil mis à jour avec succès')
-        return redirect(url_for('profile'))
+        return redirect(url_for('main.profile'))
     
     # Prepare statistics data based on user role
     if u.role == 'user':
         # User statistics
         total_contributions = sum(t.amount for t in Transaction.query.filter_by(user_id=u.id, type='cotisation', status='approved').all())
+        total_contributions += archived_user_totals(u.id, 'cotisation', 'approved')[0]
         aids_requested = Transaction.query.filter_by(user_id=u.id, type='aide').count()
+        aids_requested += archived_user_totals(u.id, 'aide')[1]
         return render_template('profile.html', user=u, total_contributions=total_contributions, aids_requested=aids_requested)
     else:
         # Admin statistics
@@ -1570,103 +1895,76 @@ def profile():
         return render_template('profile.html', user=u, user_count=user_count, group_count=group_count, 
                              transaction_count=transaction_count, monthly_revenue=monthly_revenue)
 
-@app.route('/admin/groups/<int:id>/delete', methods=['POST'])
+@bp.route('/admin/groups/<int:id>/delete', methods=['POST'])
 @role_required('admin')
 def delete_group(id):
     gobj = Group.query.get_or_404(id)
-    
-    # Delete related transactions
-    Transaction.query.filter_by(group_id=gobj.id).delete()
-    
-    # Delete related memberships
-    Membership.query.filter_by(group_id=gobj.id).delete()
-    
-    # Delete related notifications
-    Notification.query.filter_by(group_id=gobj.id).delete()
-    
-    # Finally delete the group
-    db.session.delete(gobj)
-    db.session.commit()
-    flash('Groupe supprimé définitivement')
-    return redirect(url_for('admin_groups'))
+    result = delete_groups([gobj.id], requested_by=g.user.id)
+    if result['scheduled']:
+        flash('Groupe suspendu : suppression définitive en cours en arrière-plan')
+    else:
+        flash('Groupe supprimé définitivement')
+    return redirect(url_for('main.admin_groups'))
 
-@app.route('/admin/groups/<int:id>/activate', methods=['POST'])
+@bp.route('/admin/groups/<int:id>/activate', methods=['POST'])
 @role_required('admin')
 def activate_group(id):
     gobj = Group.query.get_or_404(id)
-    gobj.archived = False
-    db.session.commit()
-    flash('Groupe activé')
-    return redirect(url_for('admin_groups'))
+    if set_archived([gobj.id], False):
+        flash('Groupe activé')
+    else:
+        flash('Groupe en cours de suppression')
+    return redirect(url_for('main.admin_groups'))
 
-@app.route('/admin/groups/<int:id>/suspend', methods=['POST'])
+@bp.route('/admin/groups/<int:id>/suspend', methods=['POST'])
 @role_required('admin')
 def suspend_group(id):
     gobj = Group.query.get_or_404(id)
-    gobj.archived = True
-    db.session.commit()
+    set_archived([gobj.id], True)
     flash('Groupe suspendu')
-    return redirect(url_for('admin_groups'))
+    return redirect(url_for('main.admin_groups'))
 
-@app.route('/admin/groups/bulk-action', methods=['POST'])
+@bp.route('/admin/groups/bulk-action', methods=['POST'])
 @role_required('admin')
 def bulk_group_action():
     action = request.form.get('action')
-    group_ids = request.form.getlist('group_ids')
+    group_ids = request.form.getlist('group_ids', type=int)
     
     if not group_ids:
         flash('Aucun groupe sélectionné')
-        return redirect(url_for('admin_groups'))
-    
-    # Convert string IDs to integers
-    group_ids = [int(id) for id in group_ids]
-    
-    # Get all selected groups
-    groups = Group.query.filter(Group.id.in_(group_ids)).all()
+        return redirect(url_for('main.admin_groups'))
     
+    # Set-based: one statement per table for the whole selection (see group_purge.py)
     if action == 'delete':
-        # Delete all selected groups permanently
-        for group in groups:
-            # Delete related transactions
-            Transaction.query.filter_by(group_id=group.id).delete()
-            
-            # Delete related memberships
-            Membership.query.filter_by(group_id=group.id).delete()
-            
-            # Delete related notifications
-            Notification.query.filter_by(group_id=group.id).delete()
-            
-            # Finally delete the group
-            db.session.delete(group)
-        db.session.commit()
-        flash(f'{len(groups)} groupe(s) supprimé(s) définitivement')
+        result = delete_groups(group_ids, requested_by=g.user.id)
+        message = f"{result['deleted']} groupe(s) supprimé(s) définitivement"
+        if result['scheduled']:
+            message += f", {result['scheduled']} suspendu(s) et en cours de suppression en arrière-plan"
+        flash(message)
     elif action == 'activate':
-        # Activate all selected groups
-        for group in groups:
-            group.archived = False
-        db.session.commit()
-        flash(f'{len(groups)} groupe(s) activé(s)')
+        flash(f'{set_archived(group_ids, False)} groupe(s) activé(s)')
     elif action == 'suspend':
-        # Suspend all selected groups
-        for group in groups:
-            group.archived = True
-        db.session.commit()
-        flash(f'{len(groups)} groupe(s) suspendu(s)')
+        flash(f'{set_archived(group_ids, True)} groupe(s) suspendu(s)')
     else:
         flash('Action non reconnue')
     
-    return redirect(url_for('admin_groups'))
+    return redirect(url_for('main.admin_groups'))
 
-@app.route('/set_language/<lang_code>')
+@bp.route('/set_language/<lang_code>')
 def set_language_route(lang_code):
     set_language(lang_code)
     # Redirect back to the previous page or home
     referer = request.headers.get('Referer')
     if referer:
         return redirect(referer)
-    return redirect(url_for('home'))
+    return redirect(url_for('main.home'))
+
+@bp.app_context_processor
+def inject_notifications():
+    # Appelé par base.html seulement pour un utilisateur connecté : une lecture de notification_counter
+    return dict(unread_notifications=lambda: unread_count(g.user.id))
 
-@app.context_processor
+@bp.app_context_processor
 def inject_i18n():
     return dict(
         t=t,
@@ -1675,7 +1973,7 @@ def inject_i18n():
         language_direction=get_language_direction()
     )
 
-@app.route('/ai_assistant', methods=['POST'])
+@bp.route('/ai_assistant', methods=['POST'])
 def ai_assistant_endpoint():
     """Endpoint for AI assistant queries."""
     question = request.form.get('question', '').strip()
@@ -1686,102 +1984,48 @@ def ai_assistant_endpoint():
     response = ai_assistant.get_response(question)
     
     # Log the question and response
-    app.logger.info(f'AI Assistant Query: {question} | Response: {response}')
+    current_app.logger.info(f'AI Assistant Query: {question} | Response: {response}')
     
     return {'response': response}
 
-@app.route('/ai_suggestions')
+@bp.route('/ai_suggestions')
 def ai_suggestions_endpoint():
     """Endpoint for AI assistant suggestions."""
     user_role = 'admin' if g.user and g.user.role == 'admin' else 'user'
     suggestions = ai_assistant.get_suggestions(user_role)
     return {'suggestions': suggestions}
 
-with app.app_context():
-    db.create_all()
-    def column_exists(table, column):
-        try:
-            rows = db.session.execute(text(f"PRAGMA table_info('{table}')")).mappings().all()
-            return any(r.get('name') == column for r in rows)
-        except Exception:
-            return False
-    try:
-        if not column_exists('transaction', 'provider'):
-            db.session.execute(text("ALTER TABLE 'transaction' ADD COLUMN provider VARCHAR(20)"))
-        if not column_exists('transaction', 'external_id'):
-            db.session.execute(text("ALTER TABLE 'transaction' ADD COLUMN external_id VARCHAR(120)"))
-        if not column_exists('group', 'archived'):
-            db.session.execute(text("ALTER TABLE 'group' ADD COLUMN archived BOOLEAN DEFAULT 0"))
-        if not column_exists('membership', 'auto_pay'):
-            db.session.execute(text("ALTER TABLE 'membership' ADD COLUMN auto_pay BOOLEAN DEFAULT 1"))
-        if not column_exists('user', 'failed_attempts'):
-            db.session.execute(text("ALTER TABLE 'user' ADD COLUMN failed_attempts INTEGER DEFAULT 0"))
-        if not column_exists('user', 'lock_until'):
-            db.session.execute(text("ALTER TABLE 'user' ADD COLUMN lock_until DATETIME"))
-        if not column_exists('user', 'is_blocked'):
-            db.session.execute(text("ALTER TABLE 'user' ADD COLUMN is_blocked BOOLEAN DEFAULT 0"))
-        if not column_exists('transaction', 'reason'):
-            db.session.execute(text("ALTER TABLE 'transaction' ADD COLUMN reason TEXT"))
-        db.session.commit()
-    except Exception:
-        db.session.rollback()
-    admin_email = 'admin@mytakaful.com'
-    try:
-        existing_admin = User.query.filter_by(email=admin_email, role='admin').first()
-    except Exception:
-        db.drop_all()
-        db.create_all()
-        try:
-            if not column_exists('transaction', 'provider'):
-                db.session.execute(text("ALTER TABLE 'transaction' ADD COLUMN provider VARCHAR(20)"))
-            if not column_exists('transaction', 'external_id'):
-                db.session.execute(text("ALTER TABLE 'transaction' ADD COLUMN external_id VARCHAR(120)"))
-            if not column_exists('group', 'archived'):
-                db.session.execute(text("ALTER TABLE 'group' ADD COLUMN archived BOOLEAN DEFAULT 0"))
-            if not column_exists('membership', 'auto_pay'):
-                db.session.execute(text("ALTER TABLE 'membership' ADD COLUMN auto_pay BOOLEAN DEFAULT 1"))
-            if not column_exists('user', 'failed_attempts'):
-                db.session.execute(text("ALTER TABLE 'user' ADD COLUMN failed_attempts INTEGER DEFAULT 0"))
-            if not column_exists('user', 'lock_until'):
-                db.session.execute(text("ALTER TABLE 'user' ADD COLUMN lock_until DATETIME"))
-            if not column_exists('user', 'is_blocked'):
-                db.session.execute(text("ALTER TABLE 'user' ADD COLUMN is_blocked BOOLEAN DEFAULT 0"))
-            if not column_exists('transaction', 'reason'):
-                db.session.execute(text("ALTER TABLE 'transaction' ADD COLUMN reason TEXT"))
-            db.session.commit()
-        except Exception:
-            db.session.rollback()
-        existing_admin = None
-    if not existing_admin:
-        admin_user = User(name='admin', email=admin_email, password_hash=generate_password_hash('admin123'), role='admin')
-        db.session.add(admin_user)
-        db.session.commit()
 
-try:
-    from apscheduler.schedulers.background import BackgroundScheduler
-    scheduler = BackgroundScheduler()
-    def generate_monthly_contributions():
-        with app.app_context():
-            groups = Group.query.filter_by(archived=False).all()
-            for gobj in groups:
-                members = Membership.query.filter_by(group_id=gobj.id, auto_pay=True).all()
-                for m in members:
-                    last = Transaction.query.filter_by(group_id=gobj.id, user_id=m.user_id, type='cotisation').order_by(Transaction.date.desc()).first()
-                    due = True
-                    if last:
-                        delta = (datetime.utcnow() - last.date).days
-                        due = delta >= 30
-                    if due:
-                        t = Transaction(group_id=gobj.id, user_id=m.user_id, amount=gobj.monthly_contribution, type='cotisation', status='pending', provider=None)
-                        db.session.add(t)
-                        db.session.commit()
-                        notify_user(m.user_id, 'contribution_due', f"Cotisation de {gobj.monthly_contribution} MAD due pour {gobj.name}", group_id=gobj.id)
-    scheduler.add_job(generate_monthly_contributions, 'interval', minutes=5, id='monthly_contrib')
-    scheduler.start()
-except Exception:
-    pass
+def create_app(config=Config, **overrides):
+    """Build the application. No database query and no background thread happen here."""
+    app = Flask(__name__)
+    app.config.from_object(config)
+    app.config.update(overrides)
+    os.makedirs(app.instance_path, exist_ok=True)
+    db.init_app(app)
+    with app.app_context():
+        for bind_key, engine in db.engines.items():
+            install_sqlite_profile(engine, app.config, read_only=(bind_key == REPLICA_BIND))
+            install_archive_attach(engine, app.config)
+    init_read_your_writes(app)
+    app.register_blueprint(bp)
+    init_assets(app)
+    init_template_cache(app)
+    register_commands(app)
+    if app.config.get('SCHEDULER_ENABLED'):
+        from scheduler import start_scheduler
+        start_scheduler(app)
+    return app
 
 if __name__ == '__main__':
+    # Serveur de développement : schéma, admin et planificateur comme avant
+    # (production : gunicorn -c gunicorn.conf.py wsgi:app, voir wsgi.py)
+    app = create_app()
+    with app.app_context():
+        upgrade_schema()
+        seed_admin()
+    if not app.config.get('SCHEDULER_ENABLED'):
+        from scheduler import start_scheduler
+        start_scheduler(app)
     port = int(os.environ.get("PORT", 5000))  # Railway fournit le PORT via variable d'environnement
     app.run(host='0.0.0.0', port=port, debug=True)
-
@@ -0,0 +1,266 @@
+"""
+Archivage chaud / froid des transactions et des notifications.
+- Transactions réglées (statut autre que 'pending') de plus de ARCHIVE_TRANSACTIONS_MONTHS mois et
+  notifications lues de plus de ARCHIVE_NOTIFICATIONS_DAYS jours déplacées vers transaction_archive /
+  notification_archive, par tranches (une courte transaction par tranche, comme les backfills)
+- Tables d'archive dans la base principale, ou dans un fichier attaché à chaque connexion
+  (ARCHIVE_DB_PATH, schéma 'archive') que les sauvegardes de la base principale ne recopient plus
+- transaction_archive_totals garde les sommes archivées par groupe / utilisateur / type / statut :
+  fonds des groupes et totaux des membres restent exacts sans relire l'archive
+- Ids jamais réutilisés (AUTOINCREMENT, migration 14) : une ligne n'est supprimée de la table récente
+  que si sa copie archivée est identique ; une ligne dont l'id est déjà pris dans l'archive reste en place
+  et est signalée dans le rapport
+- Lecture : transaction_source(True) / notification_source(True) rendent un alias du modèle sur
+  UNION ALL (récentes + archivées) pour l'historique et les exports ; sinon le modèle, lignes récentes seules
+
+Usage :
+    flask --app app archive [--chunk-size 1000 --max-seconds 60]
+    /admin/export/csv?archived=1
+"""
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import (Column, Index, MetaData, Table, and_, bindparam, event, exists, func, insert, not_, select,
+                        text, union_all)
+from sqlalchemy.orm import aliased
+
+from models import db, Notification, Transaction
+
+ARCHIVE_SCHEMA = 'archive'
+ARCHIVED_MODELS = {'transaction': Transaction, 'notification': Notification}
+ARCHIVE_INDEXES = {
+    'transaction': (('group_id', 'date'), ('user_id', 'date')),
+    'notification': (('user_id', 'date'), ('group_id',)),
+}
+ARCHIVE_TOTALS_DDL = (
+    'CREATE TABLE IF NOT EXISTS transaction_archive_totals ('
+    ' id INTEGER PRIMARY KEY,'
+    ' group_id INTEGER NOT NULL,'
+    ' user_id INTEGER NOT NULL,'
+    ' type VARCHAR(20) NOT NULL,'
+    ' status VARCHAR(10) NOT NULL,'
+    ' amount INTEGER NOT NULL DEFAULT 0,'
+    ' count INTEGER NOT NULL DEFAULT 0,'
+    ' UNIQUE (group_id, user_id, type, status))'
+)
+
+_tables = {}
+
+
+def _config(name, default):
+    try:
+        return current_app.config.get(name, default)
+    except RuntimeError:
+        return default
+
+
+def archive_schema():
+    """'archive' when the archive lives in an attached file, None when it shares the main database."""
+    return ARCHIVE_SCHEMA if _config('ARCHIVE_DB_PATH', None) else None
+
+
+def archive_table(source, schema=None):
+    """Table object of `source`'s archive: same columns, no foreign keys."""
+    key = (source, schema)
+    if key not in _tables:
+        name = f'{source}_archive'
+        columns = [Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+                   for c in ARCHIVED_MODELS[source].__table__.columns]
+        indexes = [Index(f"ix_{name}_{'_'.join(cols)}", *cols) for cols in ARCHIVE_INDEXES[source]]
+        _tables[key] = Table(name, MetaData(schema=schema), *columns, *indexes)
+    return _tables[key]
+
+
+def qualified_name(source, schema=None):
+    """Quoted name of the archive table for raw SQL."""
+    name = f'"{source}_archive"'
+    return f'"{schema}".{name}' if schema else name
+
+
+def install_archive_attach(engine, config):
+    """ATTACH the archive file as schema 'archive' on every new connection of `engine`."""
+    path = config.get('ARCHIVE_DB_PATH')
+    if not path or engine.dialect.name != 'sqlite':
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def _attach(dbapi_connection, connection_record):
+        dbapi_connection.execute(f'ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}', (path,))
+
+    return True
+
+
+def _schema_of(conn):
+    names = {r[1] for r in conn.execute(text('PRAGMA database_list'))}
+    return ARCHIVE_SCHEMA if ARCHIVE_SCHEMA in names else None
+
+
+def create_tables(conn):
+    """Create the archive tables (main database or attached file) and the totals table."""
+    schema = _schema_of(conn)
+    for source in ARCHIVED_MODELS:
+        archive_table(source, schema).create(conn, checkfirst=True)
+    conn.execute(text(ARCHIVE_TOTALS_DDL))
+
+
+def _union(source, schema):
+    hot = ARCHIVED_MODELS[source].__table__
+    cold = archive_table(source, schema)
+    return union_all(select(*hot.c), select(*[cold.c[c.name] for c in hot.c])).subquery(f'{source}_all')
+
+
+def transaction_source(include_archived=False):
+    """Transaction, or an alias of it over recent + archived rows (same attributes, read-only)."""
+    if not include_archived:
+        return Transaction
+    return aliased(Transaction, _union('transaction', archive_schema()))
+
+
+def notification_source(include_archived=False):
+    if not include_archived:
+        return Notification
+    return aliased(Notification, _union('notification', archive_schema()))
+
+
+def archived_user_totals(user_id, type_, status=None):
+    """(amount, count) of a user's archived transactions of `type_` (any status when None)."""
+    sql = ('SELECT COALESCE(SUM(amount), 0), COALESCE(SUM(count), 0) FROM transaction_archive_totals '
+           'WHERE user_id = :uid AND type = :type')
+    params = {'uid': user_id, 'type': type_}
+    if status is not None:
+        sql += ' AND status = :status'
+        params['status'] = status
+    amount, count = db.session.execute(text(sql), params).one()
+    return amount, count
+
+
+def delete_archived_user(user_id):
+    """Drop a deleted user's archived rows and totals (the caller commits)."""
+    schema = archive_schema()
+    for source in ARCHIVED_MODELS:
+        db.session.execute(text(f'DELETE FROM {qualified_name(source, schema)} WHERE user_id = :uid'),
+                           {'uid': user_id})
+    db.session.execute(text('DELETE FROM transaction_archive_totals WHERE user_id = :uid'), {'uid': user_id})
+
+
+def _archived_copy(source, schema, identical=True):
+    """EXISTS clause: the hot row's id is in the archive, with the same values (or, with False, different ones)."""
+    hot = ARCHIVED_MODELS[source].__table__
+    cold = archive_table(source, schema)
+    same = and_(*[cold.c[c.name].is_not_distinct_from(c) for c in hot.c if c.name != 'id'])
+    return exists().where(cold.c.id == hot.c.id, same if identical else not_(same))
+
+
+def _settled(source, cutoff):
+    table = ARCHIVED_MODELS[source].__table__
+    if source == 'transaction':
+        settled = table.c.status != 'pending'
+    else:
+        settled = table.c.read == True
+    return and_(settled, table.c.date < cutoff)
+
+
+def _candidates(source, cutoff, schema):
+    table = ARCHIVED_MODELS[source].__table__
+    # Id déjà pris dans l'archive par une autre ligne (base d'avant la migration 14) : la ligne reste
+    return (select(table.c.id).where(_settled(source, cutoff), ~_archived_copy(source, schema, identical=False))
+            .order_by(table.c.id))
+
+
+def _collisions(conn, source, cutoff, schema):
+    """Number of settled rows kept hot because an archived row already holds their id."""
+    table = ARCHIVED_MODELS[source].__table__
+    return conn.execute(select(func.count()).select_from(table).where(
+        _settled(source, cutoff), _archived_copy(source, schema, identical=False))).scalar()
+
+
+def _move_chunk(conn, source, cutoff, schema, chunk_size):
+    hot = ARCHIVED_MODELS[source].__table__
+    ids = [r[0] for r in conn.execute(_candidates(source, cutoff, schema).limit(chunk_size))]
+    if not ids:
+        return 0
+    names = [c.name for c in hot.c]
+    # OR IGNORE : une tranche interrompue entre deux fichiers (WAL) est reprise sans doublon
+    conn.execute(insert(archive_table(source, schema)).prefix_with('OR IGNORE')
+                 .from_select(names, select(*hot.c).where(hot.c.id.in_(ids))))
+    # Seules les lignes dont la copie archivée est identique sont comptées puis supprimées
+    moved = [r[0] for r in conn.execute(select(hot.c.id).where(hot.c.id.in_(ids), _archived_copy(source, schema)))]
+    if source == 'transaction' and moved:
+        conn.execute(text(
+            'INSERT INTO transaction_archive_totals (group_id, user_id, type, status, amount, count) '
+            "SELECT group_id, user_id, type, status, SUM(amount), COUNT(*) FROM 'transaction' WHERE id IN :ids "
+            'GROUP BY group_id, user_id, type, status '
+            'ON CONFLICT (group_id, user_id, type, status) DO UPDATE SET '
+            'amount = amount + excluded.amount, count = count + excluded.count'
+        ).bindparams(bindparam('ids', expanding=True)), {'ids': moved})
+    conn.execute(hot.delete().where(hot.c.id.in_(moved)))
+    return len(moved)
+
+
+def reserve_archived_ids(conn):
+    """Raise the AUTOINCREMENT counters of the hot tables above every archived id."""
+    schema = _schema_of(conn)
+    for source in ARCHIVED_MODELS:
+        high = conn.execute(text(f'SELECT MAX(id) FROM {qualified_name(source, schema)}')).scalar()
+        if not high:
+            continue
+        raised = conn.execute(text('UPDATE sqlite_sequence SET seq = MAX(seq, :high) WHERE name = :t'),
+                              {'high': high, 't': source}).rowcount
+        if not raised:
+            conn.execute(text('INSERT INTO sqlite_sequence (name, seq) VALUES (:t, :high)'),
+                         {'high': high, 't': source})
+
+
+def cutoffs(now=None):
+    """{source: datetime} before which settled rows are archived."""
+    now = now or datetime.utcnow()
+    months = _config('ARCHIVE_TRANSACTIONS_MONTHS', 12)
+    return {
+        'transaction': now - timedelta(days=30 * months),
+        'notification': now - timedelta(days=_config('ARCHIVE_NOTIFICATIONS_DAYS', 90)),
+    }
+
+
+def run_archival(engine=None, chunk_size=None, max_seconds=None, now=None, logger=None):
+    """Move closed periods to the archive chunk by chunk. Returns {source: rows moved, ...}."""
+    engine = engine or db.engine
+    chunk_size = chunk_size or _config('ARCHIVE_CHUNK_SIZE', 1000)
+    started = time.perf_counter()
+    report = {'transaction': 0, 'notification': 0, 'chunks': 0, 'done': False}
+    with engine.begin() as conn:
+        schema = _schema_of(conn)
+        # Fichier d'archive neuf : ses tables sont créées au premier passage
+        create_tables(conn)
+    pending = list(cutoffs(now).items())
+    while pending and (max_seconds is None or time.perf_counter() - started < max_seconds):
+        source, cutoff = pending[0]
+        with engine.begin() as conn:
+            moved = _move_chunk(conn, source, cutoff, schema, chunk_size)
+        if moved < chunk_size:
+            pending.pop(0)
+            with engine.connect() as conn:
+                kept = _collisions(conn, source, cutoff, schema)
+            if kept:
+                report[f'{source}_collisions'] = kept
+                if logger:
+                    logger.warning('Archival: %s %s rows kept, their id is already archived', kept, source)
+        if moved:
+            report[source] += moved
+            report['chunks'] += 1
+    report['done'] = not pending
+    report['duration_s'] = round(time.perf_counter() - started, 3)
+    if logger and report['chunks']:
+        logger.info('Archival: %s', report)
+    return report
+
+
+def archive_status():
+    """Row counts, recent vs archived, per source."""
+    schema = archive_schema()
+    out = {}
+    for source in ARCHIVED_MODELS:
+        hot = db.session.execute(text(f"SELECT COUNT(*) FROM '{source}'")).scalar()
+        cold = db.session.execute(text(f'SELECT COUNT(*) FROM {qualified_name(source, schema)}')).scalar()
+        out[source] = {'recent': hot, 'archived': cold}
+    return out
@@ -0,0 +1,286 @@
+"""
+Chaîne de construction des fichiers statiques (CSS/JS).
+- Sources : static/style.css, static/src/css, static/src/js (les anciens blocs <style>/<script> des gabarits)
+- Build : concaténation par bundle, minification CSS, règles [dir="rtl"] extraites dans *.rtl.css,
+  nom de fichier avec empreinte du contenu, variantes .gz (et .br si le module brotli est installé)
+- asset_url('css/app.css') donne l'URL empreintée ; /assets/ la sert avec Cache-Control immutable
+  et choisit la variante précompressée selon Accept-Encoding
+- Sans build (développement), /assets/<bundle> assemble les sources à la volée, sans cache
+
+Usage :
+    python assets.py build [--fetch-vendor]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import Blueprint, abort, current_app, request, send_from_directory, url_for
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+STATIC_DIR = os.path.join(BASE_DIR, 'static')
+SRC_DIR = os.path.join(STATIC_DIR, 'src')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST = os.path.join(DIST_DIR, 'manifest.json')
+
+CHART_JS_VERSION = '4.4.1'
+CHART_JS_CDN = f'https://cdn.jsdelivr.net/npm/chart.js@{CHART_JS_VERSION}/dist/chart.umd.min.js'
+CHART_JS_VENDOR = 'src/vendor/chart.umd.min.js'
+
+# bundle logique -> fichiers sources (relatifs à static/)
+BUNDLES = {
+    'css/app.css': ['style.css', 'src/css/sidebar.css'],
+    'js/app.js': ['src/js/app.js'],
+    'js/chart.js': [CHART_JS_VENDOR],
+}
+# Bundles servis depuis un CDN tant que leur source n'est pas présente localement
+CDN_FALLBACKS = {'js/chart.js': CHART_JS_CDN}
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+RTL_MARKERS = ('[dir="rtl"]', "[dir='rtl']", '[dir=rtl]', ':dir(rtl)')
+
+assets_bp = Blueprint('assets', __name__)
+
+
+def bundles():
+    """Static bundles plus one bundle per page source (static/src/{css,js}/pages/<page>.<ext>)."""
+    out = dict(BUNDLES)
+    for kind in ('css', 'js'):
+        pages = os.path.join(SRC_DIR, kind, 'pages')
+        if os.path.isdir(pages):
+            for fname in sorted(os.listdir(pages)):
+                if fname.endswith('.' + kind):
+                    out[f'{kind}/{fname}'] = [f'src/{kind}/pages/{fname}']
+    return out
+
+
+def _read_sources(sources):
+    parts = []
+    for rel in sources:
+        with open(os.path.join(STATIC_DIR, rel), encoding='utf-8') as f:
+            parts.append(f.read())
+    return parts
+
+
+def _sources_present(sources):
+    return all(os.path.exists(os.path.join(STATIC_DIR, rel)) for rel in sources)
+
+
+# --- CSS ----------------------------------------------------------------------
+
+def _css_blocks(css):
+    """Split a stylesheet into top-level (prelude, body) blocks; statements like @import have body None."""
+    blocks, i, n = [], 0, len(css)
+    while i < n:
+        j = i
+        while j < n and css[j] not in '{;':
+            j += 1
+        if j >= n:
+            break
+        prelude = css[i:j].strip()
+        if css[j] == ';':
+            blocks.append((prelude, None))
+            i = j + 1
+            continue
+        depth, k = 1, j + 1
+        while k < n and depth:
+            if css[k] == '{':
+                depth += 1
+            elif css[k] == '}':
+                depth -= 1
+            k += 1
+        blocks.append((prelude, css[j + 1:k - 1]))
+        i = k
+    return blocks
+
+
+def _is_rtl_rule(prelude):
+    selectors = [s.strip() for s in prelude.split(',')]
+    return all(any(m in s for m in RTL_MARKERS) for s in selectors)
+
+
+def split_rtl(css):
+    """Return (main_css, rtl_css): rules whose every selector targets dir=rtl go to the second."""
+    main, rtl = [], []
+    for prelude, body in _css_blocks(css):
+        if body is None:
+            main.append(prelude + ';')
+        elif prelude.startswith('@media') or prelude.startswith('@supports'):
+            inner_main, inner_rtl = split_rtl(body)
+            if inner_main.strip():
+                main.append(f'{prelude}{{{inner_main}}}')
+            if inner_rtl.strip():
+                rtl.append(f'{prelude}{{{inner_rtl}}}')
+        elif not prelude.startswith('@') and _is_rtl_rule(prelude):
+            rtl.append(f'{prelude}{{{body}}}')
+        else:
+            main.append(f'{prelude}{{{body}}}')
+    return '\n'.join(main), '\n'.join(rtl)
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.S)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+# --- Build --------------------------------------------------------------------
+
+def _fingerprinted(logical, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    stem, ext = os.path.splitext(logical)
+    return f'{stem}.{digest}{ext}'
+
+
+def _write(dist, rel, content, compress=True):
+    path = os.path.join(dist, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    sizes = {'raw': len(content)}
+    if not compress:
+        return sizes
+    with open(path + '.gz', 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb', compresslevel=9, mtime=0) as gz:
+            gz.write(content)
+    sizes['gzip'] = os.path.getsize(path + '.gz')
+    try:
+        import brotli
+    except ImportError:
+        return sizes
+    with open(path + '.br', 'wb') as f:
+        f.write(brotli.compress(content, quality=11))
+    sizes['br'] = os.path.getsize(path + '.br')
+    return sizes
+
+
+def render_bundle(logical, sources):
+    """Bundle content(s) for `logical`: {logical_name: bytes}, adding the .rtl.css split for CSS."""
+    text = '\n'.join(_read_sources(sources))
+    if not logical.endswith('.css'):
+        return {logical: text.encode('utf-8')}
+    main, rtl = split_rtl(text)
+    out = {logical: minify_css(main).encode('utf-8')}
+    if rtl.strip():
+        out[logical[:-len('.css')] + '.rtl.css'] = minify_css(rtl).encode('utf-8')
+    return out
+
+
+def build(dist=DIST_DIR, log=print):
+    """Build every bundle into `dist` and write manifest.json. Returns the manifest."""
+    if os.path.isdir(dist):
+        shutil.rmtree(dist)
+    os.makedirs(dist)
+    manifest = {}
+    for logical, sources in sorted(bundles().items()):
+        if not _sources_present(sources):
+            log(f'{logical:<36} ignoré (source absente, CDN : {CDN_FALLBACKS.get(logical, "-")})')
+            continue
+        for name, content in render_bundle(logical, sources).items():
+            hashed = _fingerprinted(name, content)
+            sizes = _write(dist, hashed, content)
+            manifest[name] = hashed
+            log(f'{name:<36} -> {hashed:<44} ' + ' '.join(f'{k} {v}' for k, v in sizes.items()))
+    with open(os.path.join(dist, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def fetch_vendor(log=print):
+    """Download the pinned vendor libraries so they are bundled instead of loaded from a CDN."""
+    import requests
+
+    path = os.path.join(STATIC_DIR, CHART_JS_VENDOR)
+    if os.path.exists(path):
+        return
+    r = requests.get(CHART_JS_CDN, timeout=30)
+    r.raise_for_status()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(r.content)
+    log(f'Chart.js {CHART_JS_VERSION} téléchargé dans static/{CHART_JS_VENDOR}')
+
+
+# --- Runtime ------------------------------------------------------------------
+
+_manifest_cache = {'mtime': None, 'data': {}}
+
+
+def load_manifest():
+    try:
+        mtime = os.path.getmtime(MANIFEST)
+    except OSError:
+        return {}
+    if _manifest_cache['mtime'] != mtime:
+        with open(MANIFEST, encoding='utf-8') as f:
+            _manifest_cache['data'] = json.load(f)
+        _manifest_cache['mtime'] = mtime
+    return _manifest_cache['data']
+
+
+def manifest_version():
+    """Changes with every build: part of the key of cached pages that embed asset URLs."""
+    load_manifest()
+    return _manifest_cache['mtime']
+
+
+def asset_url(logical):
+    """URL of a bundle: fingerprinted when built, CDN for missing vendor files, on-the-fly otherwise."""
+    hashed = load_manifest().get(logical)
+    if hashed:
+        return url_for('assets.asset', filename=hashed)
+    if logical in CDN_FALLBACKS and not _sources_present(bundles().get(logical, [])):
+        return CDN_FALLBACKS[logical]
+    return url_for('assets.asset', filename=logical)
+
+
+@assets_bp.route('/assets/<path:filename>')
+def asset(filename):
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    if filename in load_manifest().values():
+        # Qualités de l'en-tête respectées : 'br;q=0' refuse br (RFC 9110)
+        accepted = request.accept_encodings
+        for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+            if accepted[encoding] > 0 and os.path.exists(os.path.join(DIST_DIR, filename + suffix)):
+                resp = send_from_directory(DIST_DIR, filename + suffix, mimetype=mimetype, max_age=31536000)
+                resp.headers['Content-Encoding'] = encoding
+                break
+        else:
+            resp = send_from_directory(DIST_DIR, filename, mimetype=mimetype, max_age=31536000)
+        resp.headers['Cache-Control'] = IMMUTABLE
+        resp.headers['Vary'] = 'Accept-Encoding'
+        return resp
+    # Développement : bundle non construit, assemblé à chaque requête
+    base = filename[:-len('.rtl.css')] + '.css' if filename.endswith('.rtl.css') else filename
+    sources = bundles().get(base)
+    if not sources or not _sources_present(sources):
+        abort(404)
+    content = render_bundle(base, sources).get(filename, b'')
+    resp = current_app.response_class(content, mimetype=mimetype)
+    resp.headers['Cache-Control'] = 'no-cache'
+    return resp
+
+
+def init_assets(app):
+    app.register_blueprint(assets_bp)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Construit les bundles CSS/JS empreintés et précompressés.')
+    parser.add_argument('command', choices=('build',))
+    parser.add_argument('--fetch-vendor', action='store_true', help='Télécharger Chart.js avant le build')
+    args = parser.parse_args(argv)
+    if args.fetch_vendor:
+        fetch_vendor()
+    manifest = build()
+    print(f'{len(manifest)} fichiers écrits dans {os.path.relpath(DIST_DIR, BASE_DIR)}')
+
+
+if __name__ == '__main__':
+    main()
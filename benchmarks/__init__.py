@@ -0,0 +1,5 @@
+"""
+Outils de mesure de performance pour MyTakaful.
+- datagen : génération de bases SQLite synthétiques à grande échelle
+- runner : chronométrage des routes clés via le client de test Flask
+"""
@@ -0,0 +1,238 @@
+"""
+Générateur de données synthétiques pour MyTakaful.
+- Construit une base SQLite au schéma des modèles (models.py)
+- Insertion en masse via sqlite3.executemany, par lots
+- Reproductible : même graine + mêmes tailles = même base
+
+Usage :
+    python -m benchmarks.datagen --out instance/bench.db --scale small
+    python -m benchmarks.datagen --out big.db --users 100000 --groups 5000 \\
+        --transactions 5000000 --notifications 10000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir)))
+
+from sqlalchemy import create_engine
+from werkzeug.security import generate_password_hash
+
+from models import db
+
+SCALES = {
+    'tiny': dict(users=1000, groups=50, transactions=20000, notifications=40000),
+    'small': dict(users=10000, groups=500, transactions=500000, notifications=1000000),
+    'medium': dict(users=50000, groups=2000, transactions=2000000, notifications=4000000),
+    'large': dict(users=100000, groups=5000, transactions=5000000, notifications=10000000),
+}
+
+BATCH_SIZE = 50000
+DATE_FMT = '%Y-%m-%d %H:%M:%S.%f'
+
+# Mot de passe commun à tous les comptes générés, haché une seule fois
+PASSWORD = 'bench123'
+ADMIN_EMAIL = 'admin@mytakaful.com'
+
+AID_REASONS = ['Frais médicaux', 'Loyer', 'Frais scolaires', 'Réparation', 'Urgence familiale', None]
+NOTIFICATION_TYPES = [
+    ('contribution_paid', 'Cotisation de {amount} MAD payée'),
+    ('contribution_due', 'Cotisation de {amount} MAD due'),
+    ('tx_approved', 'Transaction approuvée'),
+    ('aid_approved', "Votre demande d'aide a été approuvée"),
+    ('group_join', 'Vous avez rejoint un groupe'),
+]
+
+
+def _fmt(dt):
+    return dt.strftime(DATE_FMT)
+
+
+def _batched(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _bulk_insert(conn, table, columns, rows):
+    sql = 'INSERT INTO "{}" ({}) VALUES ({})'.format(
+        table, ', '.join(columns), ', '.join('?' for _ in columns)
+    )
+    count = 0
+    for batch in _batched(rows):
+        conn.executemany(sql, batch)
+        count += len(batch)
+    return count
+
+
+class Generator:
+    """Génère les lignes de chaque table à partir d'une graine fixe."""
+
+    def __init__(self, users, groups, transactions, notifications,
+                 memberships_per_user=2, months=24, seed=42, now=None):
+        self.users = max(int(users), 2)
+        self.groups = max(int(groups), 1)
+        self.transactions = int(transactions)
+        self.notifications = int(notifications)
+        self.memberships_per_user = max(int(memberships_per_user), 1)
+        self.months = max(int(months), 1)
+        self.seed = seed
+        self.now = now or datetime.utcnow()
+        self.start = self.now - timedelta(days=30 * self.months)
+        self.span_seconds = int((self.now - self.start).total_seconds())
+        self.memberships = []
+        self.password_hash = generate_password_hash(PASSWORD)
+
+    def _rng(self, name):
+        return random.Random(f'{self.seed}:{name}')
+
+    def _random_date(self, rng, not_before=None):
+        lo = 0
+        if not_before is not None:
+            lo = max(int((not_before - self.start).total_seconds()), 0)
+        return self.start + timedelta(seconds=rng.randint(lo, max(lo, self.span_seconds)))
+
+    def user_rows(self):
+        rng = self._rng('user')
+        # L'utilisateur 1 est l'administrateur par défaut (celui que crée `flask seed-admin`)
+        yield (1, 'admin', ADMIN_EMAIL, self.password_hash, 'admin', _fmt(self.start), 0, None, 0)
+        for uid in range(2, self.users + 1):
+            created = self._random_date(rng)
+            blocked = 1 if rng.random() < 0.005 else 0
+            yield (uid, f'user{uid}', f'user{uid}@example.com', self.password_hash, 'user',
+                   _fmt(created), 0, None, blocked)
+
+    def group_rows(self):
+        rng = self._rng('group')
+        for gid in range(1, self.groups + 1):
+            creator = rng.randint(2, self.users)
+            archived = 1 if rng.random() < 0.05 else 0
+            description = f"Groupe d'entraide n°{gid} pour imprévus de santé et de logement."
+            yield (gid, f'Groupe {gid}', description, 10, creator,
+                   _fmt(self._random_date(rng)), archived)
+
+    def membership_rows(self):
+        rng = self._rng('membership')
+        mid = 0
+        for uid in range(2, self.users + 1):
+            count = min(rng.randint(1, 2 * self.memberships_per_user - 1), self.groups)
+            for gid in rng.sample(range(1, self.groups + 1), count):
+                mid += 1
+                joined = self._random_date(rng)
+                self.memberships.append((uid, gid, joined))
+                yield (mid, uid, gid, 0, _fmt(joined), 1 if rng.random() < 0.9 else 0)
+
+    def transaction_rows(self):
+        rng = self._rng('transaction')
+        memberships = self.memberships
+        for tid in range(1, self.transactions + 1):
+            uid, gid, joined = memberships[rng.randrange(len(memberships))]
+            date = self._random_date(rng, not_before=joined)
+            roll = rng.random()
+            if roll < 0.9:
+                status = 'approved' if rng.random() < 0.85 else rng.choice(['pending', 'rejected'])
+                provider = rng.choice([None, None, 'stripe', 'paypal', 'internal'])
+                external_id = f'{provider}_{tid}' if provider in ('stripe', 'paypal') else None
+                yield (tid, gid, uid, 10, 'cotisation', status, None, _fmt(date), provider, external_id)
+            else:
+                status = rng.choice(['approved', 'approved', 'pending', 'rejected'])
+                yield (tid, gid, uid, rng.choice([20, 50, 100, 200, 500]), 'aide', status,
+                       rng.choice(AID_REASONS), _fmt(date), None, None)
+
+    def notification_rows(self):
+        rng = self._rng('notification')
+        for nid in range(1, self.notifications + 1):
+            uid = 1 if rng.random() < 0.05 else rng.randint(2, self.users)
+            gid = rng.randint(1, self.groups)
+            type_, message = NOTIFICATION_TYPES[rng.randrange(len(NOTIFICATION_TYPES))]
+            date = self._random_date(rng)
+            read = 1 if rng.random() < 0.6 else 0
+            yield (nid, uid, gid, type_, message.format(amount=10), _fmt(date), read)
+
+
+def create_schema(path):
+    engine = create_engine('sqlite:///' + os.path.abspath(path))
+    db.metadata.create_all(engine)
+    engine.dispose()
+
+
+def generate(path, users, groups, transactions, notifications, memberships_per_user=2,
+             months=24, seed=42, overwrite=False, log=print):
+    """Build a synthetic database at `path` and return the row counts."""
+    if os.path.exists(path):
+        if not overwrite:
+            raise FileExistsError(f'{path} existe déjà (utilisez --overwrite)')
+        os.remove(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    create_schema(path)
+
+    gen = Generator(users, groups, transactions, notifications,
+                    memberships_per_user=memberships_per_user, months=months, seed=seed)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode=OFF')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('PRAGMA cache_size=-200000')
+    conn.execute('PRAGMA temp_store=MEMORY')
+
+    steps = [
+        ('user', ['id', 'name', 'email', 'password_hash', 'role', 'created_at',
+                  'failed_attempts', 'lock_until', 'is_blocked'], gen.user_rows),
+        ('group', ['id', 'name', 'description', 'monthly_contribution', 'created_by',
+                   'created_at', 'archived'], gen.group_rows),
+        ('membership', ['id', 'user_id', 'group_id', 'balance', 'joined_at', 'auto_pay'],
+         gen.membership_rows),
+        ('transaction', ['id', 'group_id', 'user_id', 'amount', 'type', 'status', 'reason',
+                         'date', 'provider', 'external_id'], gen.transaction_rows),
+        ('notification', ['id', 'user_id', 'group_id', 'type', 'message', 'date', 'read'],
+         gen.notification_rows),
+    ]
+    counts = {}
+    try:
+        for table, columns, rows in steps:
+            started = time.perf_counter()
+            conn.execute('BEGIN')
+            counts[table] = _bulk_insert(conn, table, columns, rows())
+            conn.execute('COMMIT')
+            log(f'{table}: {counts[table]} lignes en {time.perf_counter() - started:.1f}s')
+        conn.execute('ANALYZE')
+    finally:
+        conn.close()
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Génère une base MyTakaful synthétique.')
+    parser.add_argument('--out', required=True, help='Chemin du fichier SQLite à créer')
+    parser.add_argument('--scale', choices=sorted(SCALES), default='tiny')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--groups', type=int)
+    parser.add_argument('--transactions', type=int)
+    parser.add_argument('--notifications', type=int)
+    parser.add_argument('--memberships-per-user', type=int, default=2)
+    parser.add_argument('--months', type=int, default=24, help="Profondeur d'historique")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args(argv)
+
+    sizes = dict(SCALES[args.scale])
+    for key in sizes:
+        value = getattr(args, key)
+        if value is not None:
+            sizes[key] = value
+    started = time.perf_counter()
+    generate(args.out, memberships_per_user=args.memberships_per_user, months=args.months,
+             seed=args.seed, overwrite=args.overwrite, **sizes)
+    print(f'Base générée dans {args.out} en {time.perf_counter() - started:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,296 @@
+"""
+Serveur local imitant les API Stripe et PayPal utilisées par MyTakaful.
+- Stripe : sessions Checkout (création, lecture, paiement simulé)
+- PayPal : jeton OAuth, commandes, capture
+- Latence et taux d'échec configurables, compteurs exposés sur /__stats
+
+Usage :
+    python -m benchmarks.fake_providers --port 8099 --latency-ms 80 --failure-rate 0.02
+    STRIPE_API_BASE=http://127.0.0.1:8099 PAYPAL_API_BASE=http://127.0.0.1:8099 python app.py
+"""
+import argparse
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+
+class ProviderState:
+    """In-memory provider state shared by every request thread."""
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, failure_rate=0.0, token_ttl=32400, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.token_ttl = token_ttl
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.sessions = {}
+            self.orders = {}
+            self.tokens = {}
+            self.counters = Counter()
+
+    def count(self, name):
+        with self.lock:
+            self.counters[name] += 1
+
+    def delay(self):
+        if self.latency_ms or self.jitter_ms:
+            with self.lock:
+                jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms)
+            time.sleep(max(self.latency_ms + jitter, 0.0) / 1000.0)
+
+    def should_fail(self):
+        if not self.failure_rate:
+            return False
+        with self.lock:
+            return self.rng.random() < self.failure_rate
+
+
+def create_fake_app(state=None):
+    state = state or ProviderState()
+    fake = Flask(__name__)
+    fake.config['PROVIDER_STATE'] = state
+
+    @fake.before_request
+    def simulate_network():
+        if request.path.startswith('/__'):
+            return None
+        state.count(f'{request.method} {request.url_rule.rule if request.url_rule else request.path}')
+        state.delay()
+        if state.should_fail():
+            state.count('injected_failures')
+            return jsonify({'error': {'message': 'injected failure'}}), 503
+        return None
+
+    # --- Stripe -------------------------------------------------------------
+
+    @fake.route('/v1/checkout/sessions', methods=['POST'])
+    def stripe_create_session():
+        form = request.form
+        sid = 'cs_test_' + uuid.uuid4().hex
+        amount = int(form.get('line_items[0][price_data][unit_amount]', '0') or 0)
+        quantity = int(form.get('line_items[0][quantity]', '1') or 1)
+        obj = {
+            'id': sid,
+            'object': 'checkout.session',
+            'amount_total': amount * quantity,
+            'currency': form.get('line_items[0][price_data][currency]', 'mad'),
+            'mode': form.get('mode', 'payment'),
+            'payment_status': 'unpaid',
+            'status': 'open',
+            'success_url': form.get('success_url'),
+            'cancel_url': form.get('cancel_url'),
+            'url': f'{request.host_url.rstrip("/")}/checkout/{sid}',
+            'created': int(time.time()),
+        }
+        with state.lock:
+            state.sessions[sid] = obj
+        return jsonify(obj)
+
+    @fake.route('/v1/checkout/sessions/<sid>', methods=['GET'])
+    def stripe_get_session(sid):
+        with state.lock:
+            obj = state.sessions.get(sid)
+        if not obj:
+            return jsonify({'error': {'type': 'invalid_request_error', 'message': 'No such checkout.session'}}), 404
+        return jsonify(obj)
+
+    @fake.route('/checkout/<sid>/complete', methods=['POST'])
+    def stripe_complete_session(sid):
+        """Stands in for the customer paying on the hosted checkout page."""
+        with state.lock:
+            obj = state.sessions.get(sid)
+            if not obj:
+                return jsonify({'error': 'not_found'}), 404
+            obj['status'] = 'complete'
+            obj['payment_status'] = 'paid'
+        return jsonify(obj)
+
+    @fake.route('/checkout/<sid>/expire', methods=['POST'])
+    def stripe_expire_session(sid):
+        with state.lock:
+            obj = state.sessions.get(sid)
+            if not obj:
+                return jsonify({'error': 'not_found'}), 404
+            if obj['status'] == 'open':
+                obj['status'] = 'expired'
+        return jsonify(obj)
+
+    # --- PayPal -------------------------------------------------------------
+
+    @fake.route('/v1/oauth2/token', methods=['POST'])
+    def paypal_token():
+        if not request.authorization or request.form.get('grant_type') != 'client_credentials':
+            return jsonify({'error': 'invalid_client'}), 401
+        token = 'A21AA' + uuid.uuid4().hex
+        with state.lock:
+            state.tokens[token] = time.time() + state.token_ttl
+            state.counters['tokens_issued'] += 1
+        return jsonify({'access_token': token, 'token_type': 'Bearer', 'expires_in': state.token_ttl})
+
+    def bearer_ok():
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return False
+        with state.lock:
+            expires = state.tokens.get(header[7:])
+        return bool(expires and expires > time.time())
+
+    @fake.route('/v2/checkout/orders', methods=['POST'])
+    def paypal_create_order():
+        if not bearer_ok():
+            return jsonify({'name': 'AUTHENTICATION_FAILURE'}), 401
+        body = request.get_json(silent=True) or {}
+        oid = uuid.uuid4().hex[:17].upper()
+        order = {
+            'id': oid,
+            'intent': body.get('intent', 'CAPTURE'),
+            'status': 'CREATED',
+            'purchase_units': body.get('purchase_units', []),
+            'links': [{'rel': 'approve', 'href': f'{request.host_url.rstrip("/")}/checkoutnow?token={oid}'}],
+        }
+        with state.lock:
+            state.orders[oid] = order
+        return jsonify(order), 201
+
+    @fake.route('/v2/checkout/orders/<oid>', methods=['GET'])
+    def paypal_get_order(oid):
+        if not bearer_ok():
+            return jsonify({'name': 'AUTHENTICATION_FAILURE'}), 401
+        with state.lock:
+            order = state.orders.get(oid)
+        if not order:
+            return jsonify({'name': 'RESOURCE_NOT_FOUND'}), 404
+        return jsonify(order)
+
+    @fake.route('/v2/checkout/orders/<oid>/capture', methods=['POST'])
+    def paypal_capture_order(oid):
+        if not bearer_ok():
+            return jsonify({'name': 'AUTHENTICATION_FAILURE'}), 401
+        with state.lock:
+            order = state.orders.get(oid)
+            if not order:
+                return jsonify({'name': 'RESOURCE_NOT_FOUND'}), 404
+            if order['status'] == 'COMPLETED':
+                return jsonify({'name': 'UNPROCESSABLE_ENTITY',
+                                'details': [{'issue': 'ORDER_ALREADY_CAPTURED'}]}), 422
+            order['status'] = 'COMPLETED'
+            state.counters['captures'] += 1
+        return jsonify(order), 201
+
+    @fake.route('/v1/notifications/verify-webhook-signature', methods=['POST'])
+    def paypal_verify_webhook():
+        if not bearer_ok():
+            return jsonify({'name': 'AUTHENTICATION_FAILURE'}), 401
+        body = request.get_json(silent=True) or {}
+        ok = body.get('transmission_sig') != 'invalid'
+        return jsonify({'verification_status': 'SUCCESS' if ok else 'FAILURE'})
+
+    # --- Pilotage -----------------------------------------------------------
+
+    @fake.route('/__stats', methods=['GET'])
+    def stats():
+        with state.lock:
+            return jsonify({
+                'counters': dict(state.counters),
+                'sessions': Counter(s['status'] for s in state.sessions.values()),
+                'orders': Counter(o['status'] for o in state.orders.values()),
+            })
+
+    @fake.route('/__orders/<oid>', methods=['GET'])
+    def raw_order(oid):
+        with state.lock:
+            return jsonify(state.orders.get(oid) or {})
+
+    @fake.route('/__reset', methods=['POST'])
+    def reset():
+        state.reset()
+        return jsonify({'ok': True})
+
+    return fake
+
+
+def stripe_event(session_obj, type_='checkout.session.completed'):
+    """Stripe-shaped event for a checkout session (delivered by load tests)."""
+    return {'id': 'evt_' + uuid.uuid4().hex, 'object': 'event', 'type': type_,
+            'created': int(time.time()), 'data': {'object': session_obj}}
+
+
+def paypal_event(order_id, type_='PAYMENT.CAPTURE.COMPLETED'):
+    """PayPal-shaped capture event for an order (delivered by load tests)."""
+    return {'id': 'WH-' + uuid.uuid4().hex.upper(), 'event_type': type_,
+            'resource': {'id': uuid.uuid4().hex[:17].upper(), 'status': 'COMPLETED',
+                         'supplementary_data': {'related_ids': {'order_id': order_id}}}}
+
+
+def paypal_transmission_headers():
+    return {
+        'Paypal-Auth-Algo': 'SHA256withRSA',
+        'Paypal-Cert-Url': 'https://api.sandbox.paypal.com/v1/notifications/certs/CERT-fake',
+        'Paypal-Transmission-Id': uuid.uuid4().hex,
+        'Paypal-Transmission-Sig': 'fake-signature',
+        'Paypal-Transmission-Time': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+    }
+
+
+class FakeProviderServer:
+    """Runs the fake provider app on a background thread (port 0 = any free port)."""
+
+    def __init__(self, host='127.0.0.1', port=0, quiet=True, **state_options):
+        if quiet:
+            logging.getLogger('werkzeug').setLevel(logging.WARNING)
+        self.state = ProviderState(**state_options)
+        self.app = create_fake_app(self.state)
+        self.server = make_server(host, port, self.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://{self.server.host}:{self.server.port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serveur Stripe/PayPal factice.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--token-ttl', type=int, default=32400, help='expires_in des jetons PayPal (s)')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+    server = FakeProviderServer(args.host, args.port, quiet=False, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                failure_rate=args.failure_rate, token_ttl=args.token_ttl, seed=args.seed)
+    print(f'Fournisseurs factices sur {server.base_url}')
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+"""
+Test de charge des parcours de paiement Stripe/PayPal contre les fournisseurs factices.
+- Chaque parcours : création (commande PayPal / session Checkout) puis capture / retour succès
+- Exécution concurrente via un pool de threads, un client de test Flask par thread
+- Option --webhooks : confirmation par webhooks signés (livrés en double) au lieu des redirections
+- Vérifie ensuite l'état des transactions : une ligne par paiement, approuvée ssi payée
+
+Usage :
+    python -m benchmarks.datagen --out /tmp/bench.db --scale tiny
+    python -m benchmarks.loadtest_payments --db /tmp/bench.db --flows 500 --concurrency 16 \\
+        --provider both --latency-ms 50 --failure-rate 0.02
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_providers import FakeProviderServer, paypal_event, paypal_transmission_headers, stripe_event
+from benchmarks.runner import RESULTS_DIR, _git_revision, _summary
+
+
+def _members(db_path, count, seed):
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute(
+            "SELECT m.user_id, m.group_id FROM membership m "
+            "JOIN user u ON u.id = m.user_id JOIN \"group\" g ON g.id = m.group_id "
+            "WHERE u.role = 'user' AND u.is_blocked = 0 AND g.archived = 0"
+        ).fetchall()
+    finally:
+        conn.close()
+    if not rows:
+        raise SystemExit('Aucune adhésion exploitable dans la base')
+    rng = random.Random(seed)
+    return [rows[rng.randrange(len(rows))] for _ in range(count)]
+
+
+class PaymentLoadTest:
+    """Drives pay -> capture/success flows concurrently through the Flask test client."""
+
+    def __init__(self, db_path, provider_url, webhooks=False):
+        import requests
+        self.db_path = os.path.abspath(db_path)
+        self.provider_url = provider_url.rstrip('/')
+        self.http = requests.Session()
+        os.environ['MYTAKAFUL_DB_URI'] = 'sqlite:///' + self.db_path
+        os.environ['STRIPE_API_BASE'] = self.provider_url
+        os.environ['PAYPAL_API_BASE'] = self.provider_url
+        os.environ.setdefault('STRIPE_SECRET_KEY', 'sk_test_loadtest')
+        os.environ.setdefault('STRIPE_PUBLIC_KEY', 'pk_test_loadtest')
+        os.environ.setdefault('PAYPAL_CLIENT_ID', 'loadtest-client')
+        os.environ.setdefault('PAYPAL_CLIENT_SECRET', 'loadtest-secret')
+        self.webhooks = webhooks
+        if webhooks:
+            os.environ['STRIPE_WEBHOOK_SECRET'] = 'whsec_loadtest'
+            os.environ['PAYPAL_WEBHOOK_ID'] = 'WH-LOADTEST'
+        from app import create_app
+        from cli import upgrade_schema
+        self.app = create_app(TESTING=True)
+        with self.app.app_context():
+            upgrade_schema()
+
+    def client(self, user_id):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        return client
+
+    def deliver(self, client, provider, event):
+        """Deliver a webhook twice, as providers do on retries."""
+        from webhooks import sign_stripe_payload
+        body = json.dumps(event).encode()
+        for _ in range(2):
+            if provider == 'stripe':
+                headers = {'Stripe-Signature': sign_stripe_payload(body, os.environ['STRIPE_WEBHOOK_SECRET'])}
+            else:
+                headers = paypal_transmission_headers()
+            client.post(f'/webhooks/{provider}', data=body, headers=headers, content_type='application/json')
+
+    def drain_inbox(self):
+        from webhooks import process_pending_events
+        with self.app.app_context():
+            while process_pending_events()['events']:
+                pass
+
+    def paypal_flow(self, user_id, group_id):
+        client = self.client(user_id)
+        resp = client.post(f'/pay/paypal/create-order/{group_id}')
+        if resp.status_code != 200:
+            return {'ok': False, 'stage': 'create', 'status': resp.status_code}
+        order_id = resp.get_json()['id']
+        resp = client.get(f'/pay/paypal/capture/{order_id}')
+        # La vue redirige dans tous les cas : l'état côté fournisseur fait foi
+        captured = self.http.get(f'{self.provider_url}/__orders/{order_id}').json().get('status') == 'COMPLETED'
+        if captured and self.webhooks:
+            self.deliver(client, 'paypal', paypal_event(order_id))
+        return {'ok': resp.status_code == 302 and captured, 'stage': 'capture', 'external_id': order_id,
+                'status': resp.status_code}
+
+    def stripe_flow(self, user_id, group_id):
+        client = self.client(user_id)
+        resp = client.post(f'/pay/stripe/create-checkout-session/{group_id}')
+        location = resp.headers.get('Location', '')
+        if resp.status_code != 302 or '/checkout/cs_' not in location:
+            return {'ok': False, 'stage': 'create', 'status': resp.status_code}
+        session_id = location.rsplit('/', 1)[-1]
+        paid = self.http.post(f'{self.provider_url}/checkout/{session_id}/complete')
+        if paid.status_code != 200:
+            return {'ok': False, 'stage': 'checkout', 'external_id': session_id, 'status': paid.status_code}
+        if self.webhooks:
+            self.deliver(client, 'stripe', stripe_event(paid.json()))
+        resp = client.get(f'/pay/stripe/success?group_id={group_id}&session_id={session_id}')
+        return {'ok': resp.status_code == 302, 'stage': 'success', 'external_id': session_id,
+                'status': resp.status_code}
+
+    def run(self, members, providers, concurrency):
+        def one(i_member):
+            i, (user_id, group_id) = i_member
+            provider = providers[i % len(providers)]
+            started = time.perf_counter()
+            try:
+                flow = self.paypal_flow if provider == 'paypal' else self.stripe_flow
+                result = flow(user_id, group_id)
+            except Exception as exc:
+                result = {'ok': False, 'stage': 'exception', 'error': f'{type(exc).__name__}: {exc}'}
+            result.update(provider=provider, user_id=user_id, group_id=group_id,
+                          elapsed_ms=(time.perf_counter() - started) * 1000.0)
+            return result
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(one, enumerate(members)))
+        return results, time.perf_counter() - started
+
+    def provider_state(self):
+        return self.http.get(f'{self.provider_url}/__stats').json()
+
+    def check_consistency(self, results):
+        """Compare the ledger with what the provider actually captured."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            problems = Counter()
+            for r in results:
+                ext = r.get('external_id')
+                if not ext:
+                    continue
+                rows = conn.execute(
+                    'SELECT status, user_id, group_id FROM "transaction" WHERE provider = ? AND external_id = ?',
+                    (r['provider'], ext),
+                ).fetchall()
+                if len(rows) != 1:
+                    problems['rows_per_payment_not_1'] += 1
+                    continue
+                status, user_id, group_id = rows[0]
+                if (user_id, group_id) != (r['user_id'], r['group_id']):
+                    problems['wrong_owner'] += 1
+                if r['ok'] and status != 'approved':
+                    problems['paid_not_approved'] += 1
+                if not r['ok'] and status == 'approved':
+                    problems['unpaid_but_approved'] += 1
+            return dict(problems)
+        finally:
+            conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Test de charge des paiements Stripe/PayPal.')
+    parser.add_argument('--db', required=True, help='Base générée par benchmarks.datagen (modifiée)')
+    parser.add_argument('--flows', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--provider', choices=['paypal', 'stripe', 'both'], default='both')
+    parser.add_argument('--provider-url', help='Serveur factice déjà lancé (sinon démarré en local)')
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--jitter-ms', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--webhooks', action='store_true', help='Confirmer via webhooks plutôt que redirections')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', default='payments')
+    parser.add_argument('--out', help='Fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    server = None
+    provider_url = args.provider_url
+    if not provider_url:
+        server = FakeProviderServer(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                                    failure_rate=args.failure_rate, seed=args.seed).start()
+        provider_url = server.base_url
+    try:
+        test = PaymentLoadTest(args.db, provider_url, webhooks=args.webhooks)
+        providers = ['paypal', 'stripe'] if args.provider == 'both' else [args.provider]
+        members = _members(test.db_path, args.flows, args.seed)
+        results, wall = test.run(members, providers, args.concurrency)
+        if args.webhooks:
+            test.drain_inbox()
+        problems = test.check_consistency(results)
+        provider_stats = test.provider_state()
+    finally:
+        if server:
+            server.stop()
+
+    by_provider = {}
+    for provider in providers:
+        rows = [r for r in results if r['provider'] == provider]
+        ok = [r['elapsed_ms'] for r in rows if r['ok']]
+        by_provider[provider] = {
+            'flows': len(rows),
+            'succeeded': len(ok),
+            'failed_by_stage': dict(Counter(r['stage'] for r in rows if not r['ok'])),
+            'latency': _summary(ok) if ok else None,
+        }
+    report = {
+        'label': args.label,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'git_revision': _git_revision(),
+        'flows': len(results),
+        'concurrency': args.concurrency,
+        'provider_latency_ms': args.latency_ms,
+        'failure_rate': args.failure_rate,
+        'webhooks': args.webhooks,
+        'wall_s': round(wall, 3),
+        'throughput_flows_per_s': round(len(results) / wall, 2) if wall else None,
+        'providers': by_provider,
+        'provider_stats': provider_stats,
+        'consistency_problems': problems,
+        'errors': Counter(r.get('error') for r in results if r.get('error')).most_common(5),
+    }
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f'{args.label}-{datetime.utcnow().strftime("%Y%m%dT%H%M%S")}.json')
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(json.dumps({k: report[k] for k in ('flows', 'wall_s', 'throughput_flows_per_s',
+                                             'consistency_problems')}, ensure_ascii=False))
+    for provider, stats in by_provider.items():
+        median = (stats['latency'] or {}).get('median_ms')
+        print(f'{provider}: {stats["succeeded"]}/{stats["flows"]} réussis, médiane {median} ms')
+    print(f'Résultats enregistrés dans {out}')
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
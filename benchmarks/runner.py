@@ -0,0 +1,271 @@
+"""
+Banc de mesure des routes clés de MyTakaful.
+- Chronomètre les vues via le client de test Flask (pas de serveur HTTP)
+- Enregistre les résultats en JSON pour comparer les exécutions
+
+Usage :
+    python -m benchmarks.datagen --out /tmp/bench.db --scale small
+    python -m benchmarks.runner --db /tmp/bench.db --label avant
+    python -m benchmarks.runner compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+sys.path.insert(0, ROOT)
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def _summary(samples):
+    return {
+        'runs': len(samples),
+        'min_ms': round(min(samples), 3),
+        'median_ms': round(statistics.median(samples), 3),
+        'p95_ms': round(_percentile(samples, 95), 3),
+        'mean_ms': round(statistics.fmean(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _table_counts(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return {
+            table: conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+            for table in ('user', 'group', 'membership', 'transaction', 'notification')
+        }
+    finally:
+        conn.close()
+
+
+def _pick_user(db_path):
+    """Regular member with the most memberships: the heaviest /dashboard to render."""
+    conn = sqlite3.connect(db_path)
+    try:
+        row = conn.execute(
+            "SELECT m.user_id FROM membership m JOIN user u ON u.id = m.user_id "
+            "WHERE u.role = 'user' AND u.is_blocked = 0 "
+            "GROUP BY m.user_id ORDER BY COUNT(*) DESC, m.user_id LIMIT 1"
+        ).fetchone()
+        admin = conn.execute("SELECT id FROM user WHERE role = 'admin' ORDER BY id LIMIT 1").fetchone()
+        group = conn.execute(
+            'SELECT group_id FROM "transaction" GROUP BY group_id ORDER BY COUNT(*) DESC LIMIT 1'
+        ).fetchone()
+        return (row[0] if row else None, admin[0] if admin else None, group[0] if group else None)
+    finally:
+        conn.close()
+
+
+class Bench:
+    """Runs the scenarios against one database and collects timings."""
+
+    def __init__(self, db_path, repeat=5, warmup=1):
+        self.db_path = os.path.abspath(db_path)
+        self.repeat = repeat
+        self.warmup = warmup
+        os.environ['MYTAKAFUL_DB_URI'] = 'sqlite:///' + self.db_path
+        from app import create_app
+        from cli import upgrade_schema
+        self.app = create_app(TESTING=True)
+        with self.app.app_context():
+            upgrade_schema()
+        self.user_id, self.admin_id, self.group_id = _pick_user(self.db_path)
+
+    def client(self, user_id):
+        client = self.app.test_client()
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['language'] = 'fr'
+        return client
+
+    def time_request(self, user_id, path, revalidate=False):
+        client = self.client(user_id)
+        headers = {}
+        if revalidate:
+            # Rechargement avec l'ETag de la première réponse : mesure le 304
+            headers['If-None-Match'] = client.get(path).headers.get('ETag', '')
+        samples = []
+        status = None
+        size = 0
+        for i in range(self.warmup + self.repeat):
+            started = time.perf_counter()
+            resp = client.get(path, headers=headers)
+            body = resp.get_data()
+            elapsed = (time.perf_counter() - started) * 1000.0
+            status, size = resp.status_code, len(body)
+            if i >= self.warmup:
+                samples.append(elapsed)
+        result = _summary(samples)
+        result.update(status=status, bytes=size, path=path)
+        return result
+
+    def time_stream_first_event(self, user_id, path):
+        client = self.client(user_id)
+        samples = []
+        for i in range(self.warmup + self.repeat):
+            started = time.perf_counter()
+            resp = client.get(path, buffered=False)
+            first = next(iter(resp.response))
+            elapsed = (time.perf_counter() - started) * 1000.0
+            resp.close()
+            if i >= self.warmup:
+                samples.append(elapsed)
+        result = _summary(samples)
+        result.update(status=resp.status_code, bytes=len(first), path=path)
+        return result
+
+    def time_callable(self, fn, repeat=1):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - started) * 1000.0)
+        return _summary(samples)
+
+    def monthly_contributions(self):
+        from scheduler import generate_monthly_contributions
+        with self.app.app_context():
+            generate_monthly_contributions()
+
+    def scenarios(self):
+        user, admin, gid = self.user_id, self.admin_id, self.group_id
+        return [
+            ('groups', lambda: self.time_request(user, '/groups')),
+            ('dashboard', lambda: self.time_request(user, '/dashboard')),
+            ('admin', lambda: self.time_request(admin, '/admin')),
+            ('admin_revalidate', lambda: self.time_request(admin, '/admin', revalidate=True)),
+            ('api_dashboard_transactions', lambda: self.time_request(user, '/api/dashboard/transactions')),
+            ('api_admin_cotisations', lambda: self.time_request(admin, '/api/admin/cotisations')),
+            ('api_admin_chart_group_funds', lambda: self.time_request(admin, '/api/admin/charts/group-funds')),
+            ('api_admin_chart_revenue', lambda: self.time_request(admin, '/api/admin/charts/revenue')),
+            ('admin_group_statistics', lambda: self.time_request(admin, '/admin/group-statistics')),
+            ('admin_group_statistics_revalidate',
+             lambda: self.time_request(admin, '/admin/group-statistics', revalidate=True)),
+            ('admin_group_statistics_group',
+             lambda: self.time_request(admin, f'/admin/group-statistics?group_id={gid}')),
+            ('admin_users', lambda: self.time_request(admin, '/admin/users')),
+            ('admin_groups', lambda: self.time_request(admin, '/admin/groups')),
+            ('export_csv', lambda: self.time_request(admin, '/admin/export/csv')),
+            ('export_cotisations_csv', lambda: self.time_request(admin, '/admin/export/cotisations.csv')),
+            ('export_aides_csv', lambda: self.time_request(admin, '/admin/export/aides.csv')),
+            ('export_cotisations_pdf', lambda: self.time_request(admin, '/admin/export/cotisations.pdf')),
+            ('export_aides_pdf', lambda: self.time_request(admin, '/admin/export/aides.pdf')),
+            ('export_pdf', lambda: self.time_request(admin, '/admin/export/pdf')),
+            ('export_group_statistics_csv',
+             lambda: self.time_request(admin, f'/admin/export/group-statistics.csv?group_id={gid}')),
+            ('export_group_statistics_pdf',
+             lambda: self.time_request(admin, f'/admin/export/group-statistics.pdf?group_id={gid}')),
+            ('notifications_stream_first_event',
+             lambda: self.time_stream_first_event(user, '/notifications/stream')),
+            # Écrit dans la base : toujours en dernier
+            ('generate_monthly_contributions',
+             lambda: self.time_callable(self.monthly_contributions)),
+        ]
+
+    def run(self, only=None, skip=None, log=print):
+        results = {}
+        for name, fn in self.scenarios():
+            if only and name not in only:
+                continue
+            if skip and name in skip:
+                continue
+            try:
+                results[name] = fn()
+            except Exception as exc:
+                results[name] = {'error': f'{type(exc).__name__}: {exc}'}
+            entry = results[name]
+            if 'error' in entry:
+                log(f'{name:<36} ERREUR {entry["error"]}')
+            else:
+                log(f'{name:<36} median {entry["median_ms"]:>10.1f} ms   p95 {entry["p95_ms"]:>10.1f} ms')
+        return results
+
+
+def run(args):
+    counts = _table_counts(args.db)
+    bench = Bench(args.db, repeat=args.repeat, warmup=args.warmup)
+    only = set(args.only.split(',')) if args.only else None
+    skip = set(args.skip.split(',')) if args.skip else None
+    results = bench.run(only=only, skip=skip)
+    report = {
+        'label': args.label,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'git_revision': _git_revision(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'database': os.path.abspath(args.db),
+        'rows': counts,
+        'repeat': args.repeat,
+        'results': results,
+    }
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S')
+        out = os.path.join(RESULTS_DIR, f'{args.label or "run"}-{stamp}.json')
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Résultats enregistrés dans {out}')
+
+
+def compare(args):
+    with open(args.baseline, encoding='utf-8') as f:
+        base = json.load(f)['results']
+    with open(args.candidate, encoding='utf-8') as f:
+        cand = json.load(f)['results']
+    print(f'{"scénario":<36} {"avant (ms)":>12} {"après (ms)":>12} {"gain":>8}')
+    for name in sorted(set(base) | set(cand)):
+        b = base.get(name, {}).get('median_ms')
+        c = cand.get(name, {}).get('median_ms')
+        if b is None or c is None:
+            print(f'{name:<36} {str(b):>12} {str(c):>12} {"-":>8}')
+            continue
+        ratio = (b / c) if c else float('inf')
+        print(f'{name:<36} {b:>12.1f} {c:>12.1f} {ratio:>7.2f}x')
+
+
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] == 'compare':
+        parser = argparse.ArgumentParser(prog='benchmarks.runner compare')
+        parser.add_argument('baseline')
+        parser.add_argument('candidate')
+        return compare(parser.parse_args(argv[1:]))
+    parser = argparse.ArgumentParser(description='Chronomètre les routes clés de MyTakaful.')
+    parser.add_argument('--db', required=True, help='Base générée par benchmarks.datagen')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--label', default='run')
+    parser.add_argument('--only', help='Scénarios à exécuter, séparés par des virgules')
+    parser.add_argument('--skip', help='Scénarios à ignorer, séparés par des virgules')
+    parser.add_argument('--out', help='Fichier JSON de sortie')
+    return run(parser.parse_args(argv))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+"""
+Débit concurrent lecture/écriture SQLite : configuration par défaut vs profil (sqlite_profile.py).
+- Copie la base pour chaque mode, puis lance lecteurs et écrivains en parallèle pendant N secondes
+- Lectures : solde d'un groupe + 20 dernières notifications ; écritures : cotisation + notification
+- Compte les opérations, les erreurs "database is locked" et les latences
+
+Usage :
+    python -m benchmarks.sqlite_concurrency --db /tmp/bench.db --readers 8 --writers 2 --seconds 10
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+
+from sqlalchemy import create_engine, text
+
+from benchmarks.runner import RESULTS_DIR, _git_revision, _summary
+from config import Config
+from sqlite_profile import engine_options, install_sqlite_profile
+
+READ_BALANCE = text(
+    'SELECT COALESCE(SUM(amount), 0) FROM "transaction" '
+    "WHERE group_id = :gid AND status = 'approved' AND type = 'cotisation'"
+)
+READ_NOTIFICATIONS = text(
+    'SELECT id, message, date FROM notification WHERE user_id = :uid ORDER BY date DESC LIMIT 20'
+)
+WRITE_TRANSACTION = text(
+    'INSERT INTO "transaction" (group_id, user_id, amount, type, status, date) '
+    "VALUES (:gid, :uid, 10, 'cotisation', 'approved', :date)"
+)
+WRITE_NOTIFICATION = text(
+    'INSERT INTO notification (user_id, group_id, type, message, date, read) '
+    "VALUES (:uid, :gid, 'contribution_paid', 'Cotisation de 10 MAD payée', :date, 0)"
+)
+
+
+def _profile_config():
+    return {k: getattr(Config, k) for k in dir(Config) if k.startswith('SQLITE_')}
+
+
+def make_engine(path, profiled):
+    uri = 'sqlite:///' + path
+    if not profiled:
+        return create_engine(uri)
+    engine = create_engine(uri, **engine_options(uri, Config.DB_POOL_SIZE, Config.DB_MAX_OVERFLOW,
+                                                 Config.DB_POOL_RECYCLE, Config.DB_POOL_TIMEOUT,
+                                                 Config.SQLITE_BUSY_TIMEOUT_MS))
+    install_sqlite_profile(engine, _profile_config())
+    return engine
+
+
+def run_mode(source, profiled, readers, writers, seconds, seed):
+    workdir = tempfile.mkdtemp(prefix='mytakaful-bench-')
+    path = os.path.join(workdir, 'bench.db')
+    shutil.copyfile(source, path)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    pairs = conn.execute('SELECT user_id, group_id FROM membership LIMIT 5000').fetchall()
+    conn.close()
+    engine = make_engine(path, profiled)
+    stop = threading.Event()
+    stats = {'read': [], 'write': [], 'read_errors': 0, 'write_errors': 0, 'locked': 0}
+    lock = threading.Lock()
+
+    def worker(kind, idx):
+        rng = random.Random(f'{seed}:{kind}:{idx}')
+        local = []
+        errors = locked = 0
+        while not stop.is_set():
+            uid, gid = pairs[rng.randrange(len(pairs))]
+            started = time.perf_counter()
+            try:
+                if kind == 'read':
+                    with engine.connect() as c:
+                        c.execute(READ_BALANCE, {'gid': gid}).scalar()
+                        c.execute(READ_NOTIFICATIONS, {'uid': uid}).fetchall()
+                else:
+                    with engine.begin() as c:
+                        now = datetime.utcnow()
+                        c.execute(WRITE_TRANSACTION, {'gid': gid, 'uid': uid, 'date': now})
+                        c.execute(WRITE_NOTIFICATION, {'gid': gid, 'uid': uid, 'date': now})
+                local.append((time.perf_counter() - started) * 1000.0)
+            except Exception as exc:
+                errors += 1
+                if 'locked' in str(exc):
+                    locked += 1
+        with lock:
+            stats[kind].extend(local)
+            stats[f'{kind}_errors'] += errors
+            stats['locked'] += locked
+
+    threads = [threading.Thread(target=worker, args=('read', i)) for i in range(readers)]
+    threads += [threading.Thread(target=worker, args=('write', i)) for i in range(writers)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+    engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        'reads': len(stats['read']),
+        'writes': len(stats['write']),
+        'reads_per_s': round(len(stats['read']) / wall, 1),
+        'writes_per_s': round(len(stats['write']) / wall, 1),
+        'read_errors': stats['read_errors'],
+        'write_errors': stats['write_errors'],
+        'locked_errors': stats['locked'],
+        'read_latency': _summary(stats['read']) if stats['read'] else None,
+        'write_latency': _summary(stats['write']) if stats['write'] else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Débit concurrent SQLite : défaut vs profil.')
+    parser.add_argument('--db', required=True, help='Base générée par benchmarks.datagen (copiée, non modifiée)')
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', default='sqlite-concurrency')
+    parser.add_argument('--out', help='Fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    results = {}
+    for mode, profiled in (('default', False), ('profile', True)):
+        results[mode] = run_mode(os.path.abspath(args.db), profiled, args.readers, args.writers,
+                                 args.seconds, args.seed)
+        r = results[mode]
+        print(f'{mode:<8} lectures {r["reads_per_s"]:>9.1f}/s  écritures {r["writes_per_s"]:>8.1f}/s  '
+              f'verrous {r["locked_errors"]}')
+    report = {
+        'label': args.label,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'git_revision': _git_revision(),
+        'sqlite': sqlite3.sqlite_version,
+        'readers': args.readers,
+        'writers': args.writers,
+        'seconds': args.seconds,
+        'profile': _profile_config(),
+        'results': results,
+    }
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f'{args.label}-{datetime.utcnow().strftime("%Y%m%dT%H%M%S")}.json')
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Résultats enregistrés dans {out}')
+
+
+if __name__ == '__main__':
+    main()
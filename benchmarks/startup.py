@@ -0,0 +1,124 @@
+"""
+Temps de démarrage : `import app` puis `create_app()`, chacun mesuré dans un interpréteur neuf.
+- Vérifie qu'aucun module lourd (reportlab, stripe, requests, apscheduler) n'est chargé au démarrage
+- Vérifie que create_app() ne touche pas la base (le fichier SQLite ne doit pas être créé)
+- Échoue (code 1) si la médiane dépasse --budget-ms ou régresse de plus de --max-regression
+  par rapport à un résultat précédent (--baseline)
+
+Usage :
+    python -m benchmarks.startup --runs 15 --budget-ms 1500
+    python -m benchmarks.startup --baseline benchmarks/results/startup-base.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, ROOT)
+
+from benchmarks.runner import RESULTS_DIR, _git_revision, _summary
+
+HEAVY_MODULES = ('reportlab', 'stripe', 'requests', 'apscheduler')
+
+PROBE = r'''
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+application = app.create_app()
+t2 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000.0,
+    'create_app_ms': (t2 - t1) * 1000.0,
+    'heavy_modules': sorted(m for m in %r if m in sys.modules),
+    'threads': __import__('threading').active_count(),
+}))
+''' % (HEAVY_MODULES,)
+
+
+def probe(db_path):
+    env = dict(os.environ, MYTAKAFUL_DB_URI='sqlite:///' + db_path, MYTAKAFUL_SCHEDULER='0')
+    out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(runs):
+    workdir = tempfile.mkdtemp(prefix='mytakaful-startup-')
+    db_path = os.path.join(workdir, 'untouched.db')
+    samples = [probe(db_path) for _ in range(runs)]
+    total = [s['import_ms'] + s['create_app_ms'] for s in samples]
+    return {
+        'runs': runs,
+        'import': _summary([s['import_ms'] for s in samples]),
+        'create_app': _summary([s['create_app_ms'] for s in samples]),
+        'total': _summary(total),
+        'heavy_modules': sorted({m for s in samples for m in s['heavy_modules']}),
+        'extra_threads': max(s['threads'] for s in samples) - 1,
+        'db_touched': os.path.exists(db_path),
+    }
+
+
+def check(result, budget_ms=None, baseline=None, max_regression=0.25):
+    problems = []
+    if result['heavy_modules']:
+        problems.append('modules lourds chargés au démarrage : ' + ', '.join(result['heavy_modules']))
+    if result['db_touched']:
+        problems.append('create_app() a ouvert la base de données')
+    if result['extra_threads']:
+        problems.append(f'{result["extra_threads"]} thread(s) démarré(s) au démarrage')
+    median = result['total']['median_ms']
+    if budget_ms is not None and median > budget_ms:
+        problems.append(f'démarrage {median:.0f} ms > budget {budget_ms:.0f} ms')
+    if baseline is not None:
+        reference = baseline['result']['total']['median_ms']
+        if median > reference * (1 + max_regression):
+            problems.append(f'démarrage {median:.0f} ms vs {reference:.0f} ms de référence '
+                            f'(+{(median / reference - 1) * 100:.0f} %)')
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Temps de démarrage de l'application MyTakaful.")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ms', type=float, help='Médiane maximale autorisée (import + create_app)')
+    parser.add_argument('--baseline', help='Résultat JSON précédent servant de référence')
+    parser.add_argument('--max-regression', type=float, default=0.25)
+    parser.add_argument('--label', default='startup')
+    parser.add_argument('--out', help='Fichier JSON de sortie')
+    args = parser.parse_args(argv)
+
+    result = measure(args.runs)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    problems = check(result, args.budget_ms, baseline, args.max_regression)
+    print(f'import     median {result["import"]["median_ms"]:>8.1f} ms   p95 {result["import"]["p95_ms"]:>8.1f} ms')
+    print(f'create_app median {result["create_app"]["median_ms"]:>8.1f} ms   p95 {result["create_app"]["p95_ms"]:>8.1f} ms')
+    report = {
+        'label': args.label,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'git_revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'result': result,
+        'problems': problems,
+    }
+    out = args.out
+    if not out:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        out = os.path.join(RESULTS_DIR, f'{args.label}-{datetime.utcnow().strftime("%Y%m%dT%H%M%S")}.json')
+    with open(out, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f'Résultats enregistrés dans {out}')
+    for p in problems:
+        print('ÉCHEC :', p)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,180 @@
+"""
+Commandes flask d'exploitation (remplacent le travail fait auparavant à l'import de app.py).
+- flask --app app init-db     : applique les migrations (migrations.py), triggers de réplication, admin
+- flask --app app migrate     : applique les migrations en attente (--status pour les lister)
+- flask --app app backfill    : exécute un backfill par tranches, reprenable
+- flask --app app archive     : déplace les périodes closes vers les tables d'archive
+- flask --app app prune-notifications : supprime les notifications lues au-delà de la rétention
+- flask --app app purge-groups : vide la file des groupes supprimés, par tranches
+- flask --app app fund-checkpoints : calcule les points de contrôle mensuels des fonds de groupe
+- flask --app app screen-aids : pré-examine les demandes d'aide en attente (règles de aid_rules.py)
+- flask --app app refresh-streaks : recalcule les séries de cotisation marquées à revoir
+- flask --app app seed-admin  : crée l'administrateur par défaut s'il n'existe pas
+- flask --app app scheduler   : exécute les tâches planifiées au premier plan
+"""
+import click
+from flask import current_app
+from werkzeug.security import generate_password_hash
+
+from aid_rules import screen_aids
+from archive import archive_status, run_archival
+from contribution_streaks import refresh_streaks
+from fund_history import build_checkpoints
+from group_purge import process_group_purges, purge_status
+from migrations import BACKFILLS, backfill_status, migrate, pending_migrations
+from models import db, User
+from notifications import prune_read
+from replication import drop_capture, install_capture, sqlite_path
+
+DEFAULT_ADMIN_EMAIL = 'admin@mytakaful.com'
+
+
+def sync_replication_triggers():
+    """Install (or drop) the change-capture triggers to match REPLICATION_ENABLED."""
+    if not sqlite_path(current_app.config['SQLALCHEMY_DATABASE_URI']):
+        return
+    raw = db.engine.raw_connection()
+    try:
+        if current_app.config.get('REPLICATION_ENABLED'):
+            install_capture(raw.driver_connection)
+        else:
+            drop_capture(raw.driver_connection)
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def upgrade_schema():
+    """Apply pending migrations, then resync the replication triggers. Never drops anything."""
+    applied = migrate(logger=current_app.logger)
+    # Triggers de capture recréés après les ALTER TABLE (voir replication.py)
+    sync_replication_triggers()
+    return applied
+
+
+def seed_admin(email=DEFAULT_ADMIN_EMAIL, password='admin123'):
+    """Create the default admin account if missing. Returns True when it was created."""
+    if User.query.filter_by(email=email, role='admin').first():
+        return False
+    db.session.add(User(name='admin', email=email, password_hash=generate_password_hash(password), role='admin'))
+    db.session.commit()
+    return True
+
+
+def register_commands(app):
+    @app.cli.command('init-db')
+    @click.option('--seed/--no-seed', default=True, help="Créer aussi l'administrateur par défaut")
+    def init_db_command(seed):
+        """Create or upgrade the database schema."""
+        for version, name in upgrade_schema():
+            click.echo(f'Migration {version} ({name}) appliquée')
+        click.echo('Schéma à jour')
+        if seed and seed_admin():
+            click.echo(f'Administrateur {DEFAULT_ADMIN_EMAIL} créé')
+
+    @app.cli.command('migrate')
+    @click.option('--status', is_flag=True, help='Lister les migrations et backfills sans rien appliquer')
+    def migrate_command(status):
+        """Apply pending schema migrations."""
+        if status:
+            for version, name in pending_migrations():
+                click.echo(f'en attente : {version} ({name})')
+            for b in backfill_status():
+                state = 'terminé' if b['completed_at'] else f"id > {b['last_id']}"
+                click.echo(f"backfill {b['backfill']} : {b['rows_done']} lignes, {state}")
+            return
+        for version, name in upgrade_schema():
+            click.echo(f'Migration {version} ({name}) appliquée')
+        click.echo('Schéma à jour')
+
+    @app.cli.command('backfill')
+    @click.argument('name')
+    @click.option('--chunk-size', type=int, help='Lignes par commit')
+    @click.option('--max-rows-per-second', type=float, help='Débit maximal')
+    @click.option('--max-seconds', type=float, help="Durée maximale de cette exécution (reprise ensuite)")
+    def backfill_command(name, chunk_size, max_rows_per_second, max_seconds):
+        """Run (or resume) an online backfill."""
+        if name not in BACKFILLS:
+            raise click.BadParameter(f"backfill inconnu : {name} (connus : {', '.join(sorted(BACKFILLS)) or 'aucun'})")
+        report = BACKFILLS[name].run(chunk_size=chunk_size, max_rows_per_second=max_rows_per_second,
+                                     max_seconds=max_seconds, logger=current_app.logger)
+        click.echo(f"{report['rows']} lignes en {report['chunks']} tranches"
+                   + (' - terminé' if report['done'] else f" - reprise après id {report['last_id']}"))
+
+    @app.cli.command('archive')
+    @click.option('--chunk-size', type=int, help='Lignes déplacées par transaction')
+    @click.option('--max-seconds', type=float, help="Durée maximale de cette exécution (reprise ensuite)")
+    @click.option('--status', is_flag=True, help='Compter les lignes récentes et archivées sans rien déplacer')
+    def archive_command(chunk_size, max_seconds, status):
+        """Move settled transactions and read notifications past their retention to the archive."""
+        if status:
+            for source, counts in archive_status().items():
+                click.echo(f"{source} : {counts['recent']} récentes, {counts['archived']} archivées")
+            return
+        report = run_archival(chunk_size=chunk_size, max_seconds=max_seconds, logger=current_app.logger)
+        click.echo(f"{report['transaction']} transactions et {report['notification']} notifications archivées"
+                   + (' - terminé' if report['done'] else ' - reprise au prochain passage'))
+
+    @app.cli.command('prune-notifications')
+    @click.option('--chunk-size', type=int, help='Lignes supprimées par transaction')
+    @click.option('--max-seconds', type=float, help="Durée maximale de cette exécution (reprise ensuite)")
+    def prune_notifications_command(chunk_size, max_seconds):
+        """Delete read notifications older than NOTIFICATION_RETENTION_DAYS."""
+        report = prune_read(chunk_size=chunk_size, max_seconds=max_seconds, logger=current_app.logger)
+        click.echo(f"{report['rows']} notifications supprimées en {report['chunks']} tranches"
+                   + (' - terminé' if report['done'] else ' - reprise au prochain passage'))
+
+    @app.cli.command('purge-groups')
+    @click.option('--chunk-size', type=int, help='Lignes supprimées par transaction')
+    @click.option('--max-seconds', type=float, help="Durée maximale de cette exécution (reprise ensuite)")
+    @click.option('--status', is_flag=True, help='Afficher la file sans rien supprimer')
+    def purge_groups_command(chunk_size, max_seconds, status):
+        """Delete queued groups chunk by chunk."""
+        if status:
+            for gid, p in purge_status().items():
+                click.echo(f"groupe {gid} ({p['group_name']}) : {p['status']}, "
+                           f"{p['rows_deleted']}/{p['rows_total']} lignes" + (f" - {p['error']}" if p['error'] else ''))
+            return
+        report = process_group_purges(chunk_size=chunk_size, max_seconds=max_seconds, logger=current_app.logger)
+        click.echo(f"{report['groups']} groupe(s) supprimé(s), {report['rows']} lignes en {report['chunks']} tranches"
+                   + (' - file vide' if report['done'] else ' - reprise au prochain passage'))
+
+    @app.cli.command('fund-checkpoints')
+    @click.option('--max-seconds', type=float, help="Durée maximale de cette exécution (reprise ensuite)")
+    def fund_checkpoints_command(max_seconds):
+        """Close the past months of every group into fund_checkpoint."""
+        report = build_checkpoints(max_seconds=max_seconds, logger=current_app.logger)
+        click.echo(f"{report['checkpoints']} points de contrôle pour {report['groups']} groupe(s)"
+                   + (' - terminé' if report['done'] else ' - reprise au prochain passage'))
+
+    @app.cli.command('refresh-streaks')
+    @click.option('--max-seconds', type=float, help="Durée maximale de cette exécution (reprise ensuite)")
+    def refresh_streaks_command(max_seconds):
+        """Recompute the stale rows of membership_streak."""
+        report = refresh_streaks(max_seconds=max_seconds, logger=current_app.logger)
+        click.echo(f"{report['rows']} adhésion(s) recalculée(s)"
+                   + (' - terminé' if report['done'] else ' - reprise au prochain passage'))
+
+    @app.cli.command('screen-aids')
+    @click.option('--dry-run', is_flag=True, help='Évaluer les règles sans rien décider ni enregistrer')
+    def screen_aids_command(dry_run):
+        """Auto-approve, auto-reject or flag the pending aid requests."""
+        report = screen_aids(dry_run=dry_run, logger=current_app.logger)
+        click.echo(f"{report['aids']} aide(s) examinée(s) : {report['approve']} approuvée(s), "
+                   f"{report['reject']} refusée(s), {report['flag']} laissée(s) aux admins"
+                   + ('' if report['applied'] else ' (recommandations seulement)'))
+
+    @app.cli.command('seed-admin')
+    @click.option('--email', default=DEFAULT_ADMIN_EMAIL)
+    @click.option('--password', default='admin123', envvar='MYTAKAFUL_ADMIN_PASSWORD')
+    def seed_admin_command(email, password):
+        """Create the admin account if it does not exist."""
+        click.echo(f'Administrateur {email} créé' if seed_admin(email, password) else f'{email} existe déjà')
+
+    @app.cli.command('scheduler')
+    def scheduler_command():
+        """Run the scheduled jobs in the foreground."""
+        from scheduler import create_scheduler
+
+        click.echo('Planificateur démarré (Ctrl+C pour arrêter)')
+        create_scheduler(current_app._get_current_object(), blocking=True).start()
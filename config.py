@@ -7,6 +7,8 @@ Configuration centralisée pour l'application MyTakaful.
 
 import os
 
+from sqlite_profile import engine_options
+
 # Chemin racine du projet
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 
@@ -21,8 +23,99 @@ class Config:
         or "sqlite:///" + os.path.join(BASE_DIR, "instance", "database.db")
     )
 
+    # Réplica en lecture seule (optionnel) : statistiques, exports et listes y lisent
+    SQLALCHEMY_BINDS = (
+        {"replica": os.environ["MYTAKAFUL_DB_REPLICA_URI"]}
+        if os.environ.get("MYTAKAFUL_DB_REPLICA_URI") else {}
+    )
+    # Durée (s) pendant laquelle un utilisateur qui vient d'écrire relit la base principale
+    DB_READ_YOUR_WRITES_SECONDS = int(os.environ.get("MYTAKAFUL_DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+    # Réplication par journal (voir replication.py) : capture des changements sur la base principale
+    REPLICATION_ENABLED = os.environ.get("MYTAKAFUL_REPLICATION", "0") == "1"
+    REPLICATION_BATCH_SIZE = int(os.environ.get("MYTAKAFUL_REPLICATION_BATCH_SIZE", "500"))
+    REPLICATION_POLL_SECONDS = float(os.environ.get("MYTAKAFUL_REPLICATION_POLL_SECONDS", "1"))
+    REPLICATION_MAX_LAG_SECONDS = float(os.environ.get("MYTAKAFUL_REPLICATION_MAX_LAG_SECONDS", "30"))
+
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Profil SQLite appliqué à chaque connexion (voir sqlite_profile.py)
+    SQLITE_PROFILE_ENABLED = os.environ.get("MYTAKAFUL_SQLITE_PROFILE", "1") != "0"
+    SQLITE_JOURNAL_MODE = os.environ.get("MYTAKAFUL_SQLITE_JOURNAL_MODE", "WAL")
+    SQLITE_SYNCHRONOUS = os.environ.get("MYTAKAFUL_SQLITE_SYNCHRONOUS", "NORMAL")
+    SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get("MYTAKAFUL_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    SQLITE_CACHE_SIZE_KIB = int(os.environ.get("MYTAKAFUL_SQLITE_CACHE_SIZE_KIB", "65536"))
+    SQLITE_MMAP_SIZE = int(os.environ.get("MYTAKAFUL_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+    SQLITE_FOREIGN_KEYS = os.environ.get("MYTAKAFUL_SQLITE_FOREIGN_KEYS", "1") != "0"
+
+    # Pool de connexions SQLAlchemy
+    DB_POOL_SIZE = int(os.environ.get("MYTAKAFUL_DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.environ.get("MYTAKAFUL_DB_MAX_OVERFLOW", "10"))
+    DB_POOL_RECYCLE = int(os.environ.get("MYTAKAFUL_DB_POOL_RECYCLE", "1800"))
+    DB_POOL_TIMEOUT = int(os.environ.get("MYTAKAFUL_DB_POOL_TIMEOUT", "30"))
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        SQLALCHEMY_DATABASE_URI, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE, DB_POOL_TIMEOUT,
+        SQLITE_BUSY_TIMEOUT_MS,
+    )
+
+    # Tâches planifiées démarrées par create_app() (sinon : flask --app app scheduler) ;
+    # sous gunicorn, dans le seul worker qui détient SCHEDULER_LOCK_PATH (voir wsgi.py)
+    SCHEDULER_ENABLED = os.environ.get("MYTAKAFUL_SCHEDULER", "0") == "1"
+    SCHEDULER_LOCK_PATH = (os.environ.get("MYTAKAFUL_SCHEDULER_LOCK")
+                           or os.path.join(BASE_DIR, "instance", "scheduler.lock"))
+
+    # Serveur de production (gunicorn.conf.py) : processus workers et threads par worker
+    WEB_WORKERS = int(os.environ.get("MYTAKAFUL_WEB_WORKERS", "2"))
+    WEB_THREADS = int(os.environ.get("MYTAKAFUL_WEB_THREADS", "4"))
+    WEB_TIMEOUT = int(os.environ.get("MYTAKAFUL_WEB_TIMEOUT", "30"))
+
+    # Suppression des groupes (voir group_purge.py) : au-delà de N lignes dépendantes, purge par tranches
+    GROUP_PURGE_INLINE_ROWS = int(os.environ.get("MYTAKAFUL_GROUP_PURGE_INLINE_ROWS", "5000"))
+    GROUP_PURGE_CHUNK_SIZE = int(os.environ.get("MYTAKAFUL_GROUP_PURGE_CHUNK_SIZE", "1000"))
+    GROUP_PURGE_PAUSE_MS = int(os.environ.get("MYTAKAFUL_GROUP_PURGE_PAUSE_MS", "50"))
+    GROUP_PURGE_POLL_SECONDS = int(os.environ.get("MYTAKAFUL_GROUP_PURGE_POLL_SECONDS", "10"))
+
+    # Archivage (voir archive.py) : transactions réglées après N mois, notifications lues après M jours
+    ARCHIVE_DB_PATH = os.environ.get("MYTAKAFUL_ARCHIVE_DB") or None
+    ARCHIVE_TRANSACTIONS_MONTHS = int(os.environ.get("MYTAKAFUL_ARCHIVE_TRANSACTIONS_MONTHS", "12"))
+    ARCHIVE_NOTIFICATIONS_DAYS = int(os.environ.get("MYTAKAFUL_ARCHIVE_NOTIFICATIONS_DAYS", "90"))
+    ARCHIVE_CHUNK_SIZE = int(os.environ.get("MYTAKAFUL_ARCHIVE_CHUNK_SIZE", "1000"))
+    ARCHIVE_INTERVAL_HOURS = int(os.environ.get("MYTAKAFUL_ARCHIVE_INTERVAL_HOURS", "24"))
+
+    # Notifications lues supprimées après N jours (voir notifications.py), par tranches
+    NOTIFICATION_RETENTION_DAYS = int(os.environ.get("MYTAKAFUL_NOTIFICATION_RETENTION_DAYS", "365"))
+    NOTIFICATION_PRUNE_CHUNK_SIZE = int(os.environ.get("MYTAKAFUL_NOTIFICATION_PRUNE_CHUNK_SIZE", "1000"))
+    NOTIFICATION_STREAM_SECONDS = float(os.environ.get("MYTAKAFUL_NOTIFICATION_STREAM_SECONDS", "3"))
+
+    # Approbations conditionnelles (voir group_funds.py) : tentatives si le verrou d'écriture est occupé
+    APPROVAL_RETRIES = int(os.environ.get("MYTAKAFUL_APPROVAL_RETRIES", "5"))
+    APPROVAL_BACKOFF_MS = int(os.environ.get("MYTAKAFUL_APPROVAL_BACKOFF_MS", "20"))
+    BULK_DECISION_MAX_IDS = int(os.environ.get("MYTAKAFUL_BULK_DECISION_MAX_IDS", "1000"))
+
+    # Pré-examen des demandes d'aide (voir aid_rules.py) ; 'flag' : recommandations seulement
+    AID_SCREENING_MODE = os.environ.get("MYTAKAFUL_AID_SCREENING_MODE", "auto")
+    AID_SCREENING_INTERVAL_MINUTES = int(os.environ.get("MYTAKAFUL_AID_SCREENING_INTERVAL_MINUTES", "15"))
+    AID_MIN_STREAK_MONTHS = int(os.environ.get("MYTAKAFUL_AID_MIN_STREAK_MONTHS", "3"))
+    AID_MAX_FUND_SHARE = float(os.environ.get("MYTAKAFUL_AID_MAX_FUND_SHARE", "0.5"))
+    AID_COOLDOWN_DAYS = int(os.environ.get("MYTAKAFUL_AID_COOLDOWN_DAYS", "90"))
+    AID_AUTO_APPROVE_MAX_AMOUNT = int(os.environ.get("MYTAKAFUL_AID_AUTO_APPROVE_MAX_AMOUNT", "500"))
+
+    # Points de contrôle mensuels des fonds de groupe (voir fund_history.py)
+    FUND_CHECKPOINT_INTERVAL_HOURS = int(os.environ.get("MYTAKAFUL_FUND_CHECKPOINT_INTERVAL_HOURS", "6"))
+    # Recalcul des séries de cotisation marquées à revoir (voir contribution_streaks.py)
+    STREAK_REFRESH_INTERVAL_MINUTES = int(os.environ.get("MYTAKAFUL_STREAK_REFRESH_INTERVAL_MINUTES", "30"))
+    # Backfills non terminés repris par le planificateur (voir migrations.py), durée et débit plafonnés
+    BACKFILL_INTERVAL_MINUTES = int(os.environ.get("MYTAKAFUL_BACKFILL_INTERVAL_MINUTES", "5"))
+    BACKFILL_MAX_SECONDS = float(os.environ.get("MYTAKAFUL_BACKFILL_MAX_SECONDS", "60"))
+    BACKFILL_MAX_ROWS_PER_SECOND = float(os.environ.get("MYTAKAFUL_BACKFILL_MAX_ROWS_PER_SECOND", "5000"))
+
+    # Cache du HTML rendu (voir template_cache.py), par processus
+    TEMPLATE_CACHE_ENABLED = os.environ.get("MYTAKAFUL_TEMPLATE_CACHE", "1") != "0"
+    TEMPLATE_CACHE_MAX_BYTES = int(os.environ.get("MYTAKAFUL_TEMPLATE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    TEMPLATE_CACHE_MAX_ENTRIES = int(os.environ.get("MYTAKAFUL_TEMPLATE_CACHE_MAX_ENTRIES", "10000"))
+    # ETag / 304 sur les tableaux de bord, statistiques, exports et API (voir http_cache.py)
+    HTTP_ETAGS_ENABLED = os.environ.get("MYTAKAFUL_HTTP_ETAGS", "1") != "0"
+
     # Intégrations paiement
     STRIPE_PUBLIC_KEY = os.environ.get("STRIPE_PUBLIC_KEY")
     STRIPE_SECRET_KEY = os.environ.get("STRIPE_SECRET_KEY")
@@ -30,6 +123,29 @@ class Config:
     PAYPAL_CLIENT_ID = os.environ.get("PAYPAL_CLIENT_ID")
     PAYPAL_CLIENT_SECRET = os.environ.get("PAYPAL_CLIENT_SECRET")
 
+    # URLs des fournisseurs (surchargeables pour les serveurs factices locaux)
+    STRIPE_API_BASE = os.environ.get("STRIPE_API_BASE", "https://api.stripe.com")
+    PAYPAL_API_BASE = os.environ.get("PAYPAL_API_BASE", "https://api-m.sandbox.paypal.com")
+
+    # Webhooks : secret de signature Stripe, identifiant du webhook PayPal, traitement par lots
+    STRIPE_WEBHOOK_SECRET = os.environ.get("STRIPE_WEBHOOK_SECRET")
+    PAYPAL_WEBHOOK_ID = os.environ.get("PAYPAL_WEBHOOK_ID")
+    WEBHOOK_POLL_SECONDS = int(os.environ.get("MYTAKAFUL_WEBHOOK_POLL_SECONDS", "5"))
+    WEBHOOK_BATCH_SIZE = int(os.environ.get("MYTAKAFUL_WEBHOOK_BATCH_SIZE", "200"))
+
+    # Réconciliation des cotisations en attente chez les fournisseurs
+    RECONCILE_INTERVAL_MINUTES = int(os.environ.get("MYTAKAFUL_RECONCILE_INTERVAL_MINUTES", "15"))
+    RECONCILE_PAGE_SIZE = int(os.environ.get("MYTAKAFUL_RECONCILE_PAGE_SIZE", "200"))
+    RECONCILE_MAX_WORKERS = int(os.environ.get("MYTAKAFUL_RECONCILE_MAX_WORKERS", "8"))
+    RECONCILE_MIN_AGE_MINUTES = int(os.environ.get("MYTAKAFUL_RECONCILE_MIN_AGE_MINUTES", "15"))
+    RECONCILE_ABANDON_AFTER_HOURS = int(os.environ.get("MYTAKAFUL_RECONCILE_ABANDON_AFTER_HOURS", "72"))
+
+    # Client HTTP des fournisseurs : délais (s), taille du pool, marge de renouvellement du jeton PayPal (s)
+    PROVIDER_CONNECT_TIMEOUT = float(os.environ.get("MYTAKAFUL_PROVIDER_CONNECT_TIMEOUT", "3.05"))
+    PROVIDER_READ_TIMEOUT = float(os.environ.get("MYTAKAFUL_PROVIDER_READ_TIMEOUT", "15"))
+    PROVIDER_POOL_SIZE = int(os.environ.get("MYTAKAFUL_PROVIDER_POOL_SIZE", "10"))
+    PAYPAL_TOKEN_REFRESH_MARGIN = int(os.environ.get("MYTAKAFUL_PAYPAL_TOKEN_REFRESH_MARGIN", "60"))
+
     # Commission technique appliquée aux cotisations (ex: 2%)
     COMMISSION_RATE = float(
         os.environ.get("MYTAKAFUL_COMMISSION_RATE", "0.02")
@@ -0,0 +1,225 @@
+"""
+Suivi des cotisations par adhésion : dernier mois payé, série en cours, mois de retard, total payé.
+- membership_streak (id = adhésion) : tenue à jour par des triggers SQLite à chaque cotisation approuvée
+  (insertion ou passage à 'approved', même hors ORM : paiements, webhooks, approbations en masse)
+- Mois = année * 12 + mois - 1 ; paid_through = dernier mois couvert (mois précédant l'adhésion tant que
+  rien n'est payé). Retard = mois clos depuis paid_through ; le mois en cours n'est pas encore dû
+- Série : mois consécutifs payés jusqu'au dernier mois payé ; elle ne compte plus dès qu'un mois clos manque
+- Cas que les triggers ne suivent pas pas à pas (cotisation antidatée, approbation annulée, montant ou
+  date corrigés) : la ligne passe stale = 1 et refresh_streaks() la recalcule depuis les transactions,
+  archives comprises. L'archivage ne change rien : les lignes déplacées restent comptées
+- Lecture : taux d'activité et listes de retard en une requête sur membership_streak, sans parcourir
+  les transactions
+- Retard et taux d'activité changent au changement de mois sans aucune écriture : les vues qui les
+  affichent ajoutent le mois en cours à leur ETag (etag_versioned(..., extra=current_month))
+
+Usage :
+    flask --app app refresh-streaks [--max-seconds 60]
+    /api/admin/groups/<id>/arrears
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, select, text
+
+from archive import transaction_source
+from models import db
+
+STREAK_DDL = (
+    'CREATE TABLE IF NOT EXISTS membership_streak ('
+    ' id INTEGER PRIMARY KEY,'
+    ' group_id INTEGER NOT NULL,'
+    ' user_id INTEGER NOT NULL,'
+    ' last_period INTEGER,'
+    ' paid_through INTEGER NOT NULL,'
+    ' streak INTEGER NOT NULL DEFAULT 0,'
+    ' total_paid INTEGER NOT NULL DEFAULT 0,'
+    ' stale INTEGER NOT NULL DEFAULT 0)'
+)
+_PERIOD = "(CAST(strftime('%Y', {d}) AS INTEGER) * 12 + CAST(strftime('%m', {d}) AS INTEGER) - 1)"
+_PAID = "{row}.status = 'approved' AND {row}.type = 'cotisation'"
+# SQLite évalue tout le SET sur l'ancienne ligne : last_period y est la valeur d'avant le paiement
+_APPLY = (
+    'UPDATE membership_streak SET '
+    'streak = CASE WHEN last_period IS NULL OR {p} > last_period + 1 THEN 1 '
+    'WHEN {p} = last_period + 1 THEN streak + 1 ELSE streak END, '
+    'stale = CASE WHEN {p} < last_period THEN 1 ELSE stale END, '
+    'last_period = MAX(COALESCE(last_period, {p}), {p}), '
+    'paid_through = MAX(paid_through, {p}), '
+    'total_paid = total_paid + NEW.amount '
+    'WHERE group_id = NEW.group_id AND user_id = NEW.user_id AND {when};'
+)
+_REVERT = ('UPDATE membership_streak SET total_paid = total_paid - OLD.amount, stale = 1 '
+           'WHERE group_id = OLD.group_id AND user_id = OLD.user_id AND {when};')
+
+
+def _apply(when='1'):
+    return _APPLY.format(p=_PERIOD.format(d='NEW.date'), when=when)
+
+
+STREAK_TRIGGERS = {
+    'ms_membership_ins': (
+        'AFTER INSERT ON membership BEGIN '
+        'INSERT OR REPLACE INTO membership_streak (id, group_id, user_id, paid_through) '
+        f"VALUES (NEW.id, NEW.group_id, NEW.user_id, {_PERIOD.format(d='COALESCE(NEW.joined_at, CURRENT_TIMESTAMP)')} - 1); "
+        'END'),
+    'ms_membership_del': 'AFTER DELETE ON membership BEGIN DELETE FROM membership_streak WHERE id = OLD.id; END',
+    'ms_transaction_ins': f"AFTER INSERT ON 'transaction' WHEN {_PAID.format(row='NEW')} BEGIN {_apply()} END",
+    # Retrait d'une cotisation comptée : total_paid reste exact, le reste est recalculé plus tard.
+    # Pas de trigger à la suppression : l'archivage supprime des lignes qui restent comptées
+    'ms_transaction_upd': (
+        "AFTER UPDATE OF status, type, amount, date, group_id, user_id ON 'transaction' "
+        f"WHEN ({_PAID.format(row='OLD')}) OR ({_PAID.format(row='NEW')}) BEGIN "
+        f"{_REVERT.format(when=_PAID.format(row='OLD'))} {_apply(_PAID.format(row='NEW'))} END"),
+}
+
+
+def create_streaks(conn):
+    """Create membership_streak and its triggers; existing memberships are added by fill_streaks()."""
+    conn.execute(text(STREAK_DDL))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_membership_streak_group ON membership_streak (group_id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_membership_streak_stale ON membership_streak (stale)'))
+    for name, body in STREAK_TRIGGERS.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body}'))
+
+
+def fill_streaks(conn, lo, hi):
+    """Backfill step (see migrations.py): add and compute the rows of memberships lo < id <= hi."""
+    # OR IGNORE : une adhésion créée depuis la migration a déjà sa ligne, tenue par les triggers
+    added = conn.execute(text(
+        'INSERT OR IGNORE INTO membership_streak (id, group_id, user_id, paid_through, stale) '
+        f"SELECT id, group_id, user_id, {_PERIOD.format(d='COALESCE(joined_at, CURRENT_TIMESTAMP)')} - 1, 1 "
+        'FROM membership WHERE id > :lo AND id <= :hi'), {'lo': lo, 'hi': hi}).rowcount
+    while _refresh_chunk(conn, 500, (lo, hi)):
+        pass
+    return added
+
+
+def period_of(dt):
+    return dt.year * 12 + dt.month - 1
+
+
+def period_label(period):
+    return f'{period // 12:04d}-{period % 12 + 1:02d}' if period is not None else None
+
+
+def _streak_ending(months, last):
+    streak = 0
+    while last in months:
+        streak += 1
+        last -= 1
+    return streak
+
+
+def _refresh_chunk(conn, chunk_size, id_range=None):
+    """Recompute up to `chunk_size` stale rows (ids in `id_range`, exclusive/inclusive, if given).
+
+    Returns the number of rows refreshed.
+    """
+    lo, hi = id_range or (None, None)
+    rows = conn.execute(text(
+        'SELECT s.id, s.group_id, s.user_id, m.joined_at FROM membership_streak s '
+        'JOIN membership m ON m.id = s.id WHERE s.stale = 1 '
+        + ('AND s.id > :lo AND s.id <= :hi ' if id_range else '') + 'ORDER BY s.id LIMIT :n'),
+        {'n': chunk_size, 'lo': lo, 'hi': hi}).all()
+    if not rows:
+        return 0
+    T = transaction_source(True)
+    month = func.strftime('%Y-%m', T.date)
+    paid = {}
+    for gid, uid, ym, amount in conn.execute(
+            select(T.group_id, T.user_id, month, func.sum(T.amount))
+            .where(T.user_id.in_({r.user_id for r in rows}), T.group_id.in_({r.group_id for r in rows}),
+                   T.type == 'cotisation', T.status == 'approved')
+            .group_by(T.group_id, T.user_id, month)):
+        year, mon = ym.split('-')
+        paid.setdefault((gid, uid), {})[int(year) * 12 + int(mon) - 1] = amount
+    now = datetime.utcnow()
+    updates = []
+    for r in rows:
+        months = paid.get((r.group_id, r.user_id), {})
+        joined = r.joined_at or now
+        if isinstance(joined, str):
+            joined = datetime.fromisoformat(joined)
+        last = max(months) if months else None
+        updates.append({'id': r.id, 'last': last, 'streak': _streak_ending(months, last) if months else 0,
+                        'through': max(period_of(joined) - 1, last if last is not None else -1),
+                        'total': sum(months.values())})
+    conn.execute(text('UPDATE membership_streak SET last_period = :last, streak = :streak, '
+                      'paid_through = :through, total_paid = :total, stale = 0 WHERE id = :id'), updates)
+    return len(updates)
+
+
+def refresh_streaks(engine=None, chunk_size=500, max_seconds=None, logger=None):
+    """Recompute the stale rows chunk by chunk, one short transaction per chunk."""
+    engine = engine or db.engine
+    started = time.perf_counter()
+    report = {'rows': 0, 'chunks': 0, 'done': False}
+    while max_seconds is None or time.perf_counter() - started < max_seconds:
+        with engine.begin() as conn:
+            refreshed = _refresh_chunk(conn, chunk_size)
+        report['rows'] += refreshed
+        report['chunks'] += 1 if refreshed else 0
+        if refreshed < chunk_size:
+            report['done'] = True
+            break
+    report['duration_s'] = round(time.perf_counter() - started, 3)
+    if logger and report['rows']:
+        logger.info('Contribution streaks: %s', report)
+    return report
+
+
+def _current(now):
+    return period_of(now or datetime.utcnow())
+
+
+def activity_rates(group_ids=None, now=None):
+    """{group_id: (members, paying members)} ; paying = nothing due for the closed months."""
+    stmt = text('SELECT group_id, COUNT(*), COALESCE(SUM(paid_through >= :cur - 1), 0) FROM membership_streak '
+                + ('WHERE group_id IN :gids ' if group_ids is not None else '') + 'GROUP BY group_id')
+    params = {'cur': _current(now)}
+    if group_ids is not None:
+        params['gids'] = list(group_ids)
+        if not params['gids']:
+            return {}
+        stmt = stmt.bindparams(bindparam('gids', expanding=True))
+    return {gid: (members, paying) for gid, members, paying in db.session.execute(stmt, params)}
+
+
+def activity_rate(group_ids=None, now=None):
+    """Share of members (in %) with no closed month left unpaid, over `group_ids` or every group."""
+    members = paying = 0
+    for m, p in activity_rates(group_ids, now).values():
+        members, paying = members + m, paying + p
+    return round(paying / members * 100, 1) if members else 0
+
+
+def arrears(group_id=None, min_months=1, now=None):
+    """Members with at least `min_months` closed months unpaid, most overdue first."""
+    cur = _current(now)
+    sql = ('SELECT s.id, s.group_id, s.user_id, u.name, s.last_period, s.total_paid, '
+           ":cur - 1 - s.paid_through AS months FROM membership_streak s JOIN 'user' u ON u.id = s.user_id "
+           'WHERE s.paid_through <= :cur - 1 - :min')
+    params = {'cur': cur, 'min': max(1, min_months)}
+    if group_id is not None:
+        sql += ' AND s.group_id = :gid'
+        params['gid'] = group_id
+    rows = db.session.execute(text(sql + ' ORDER BY months DESC, s.id'), params).all()
+    return [{'membership_id': r.id, 'group_id': r.group_id, 'user_id': r.user_id, 'name': r.name,
+             'last_paid': period_label(r.last_period), 'total_paid': r.total_paid,
+             'months_in_arrears': r.months} for r in rows]
+
+
+def standing(group_id, user_id, now=None):
+    """Tracker row of one membership with the current streak and months in arrears, or None."""
+    row = db.session.execute(text(
+        'SELECT last_period, paid_through, streak, total_paid FROM membership_streak '
+        'WHERE group_id = :gid AND user_id = :uid'), {'gid': group_id, 'uid': user_id}).first()
+    if row is None:
+        return None
+    cur = _current(now)
+    months = max(0, cur - 1 - row.paid_through)
+    return {'last_paid': period_label(row.last_period), 'total_paid': row.total_paid,
+            'streak': row.streak if months == 0 and row.last_period is not None else 0,
+            'months_in_arrears': months}
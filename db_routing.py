@@ -0,0 +1,84 @@
+"""
+Routage des lectures vers un réplica (bind 'replica').
+- Les vues en lecture seule (@replica_reads) et les rapports (use_replica) lisent sur MYTAKAFUL_DB_REPLICA_URI
+- Les écritures, les flush et les sessions ayant des changements en attente restent sur la base principale ;
+  après un flush, le reste de la requête (ou du contexte d'application) y lit aussi ses propres écritures
+- Lecture-après-écriture : après un commit, l'utilisateur reste sur la base principale quelques secondes
+"""
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import current_app, g, has_app_context, has_request_context, session as http_session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+RYW_SESSION_KEY = '_primary_until'
+
+
+def _reads_from_replica():
+    if not has_app_context() or g.get('db_route') != REPLICA_BIND or g.get('db_wrote'):
+        return False
+    if has_request_context() and time.time() < http_session.get(RYW_SESSION_KEY, 0):
+        return False
+    return True
+
+
+def current_read_bind():
+    """Name of the bind plain reads go to right now: 'replica' or 'primary'."""
+    if _reads_from_replica() and REPLICA_BIND in current_app.extensions['sqlalchemy'].engines:
+        return REPLICA_BIND
+    return 'primary'
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session that sends plain reads to the replica bind when asked to."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and _reads_from_replica() and not self._flushing
+                and not (self.new or self.dirty or self.deleted)):
+            engine = self._db.engines.get(REPLICA_BIND)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _remember_write(session, flush_context):
+    if has_app_context():
+        g.db_wrote = True
+
+
+def replica_reads(f):
+    """Route the reads of a read-only view to the replica bind (if configured)."""
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        previous = g.get('db_route')
+        g.db_route = REPLICA_BIND
+        try:
+            return f(*args, **kwargs)
+        finally:
+            g.db_route = previous
+    return wrapper
+
+
+@contextmanager
+def use_replica():
+    """Same as @replica_reads for report jobs running in an app context."""
+    previous = g.get('db_route')
+    g.db_route = REPLICA_BIND
+    try:
+        yield
+    finally:
+        g.db_route = previous
+
+
+def init_read_your_writes(app):
+    """Keep a user on the primary for DB_READ_YOUR_WRITES_SECONDS after a request that wrote."""
+    @app.after_request
+    def _pin_to_primary(response):
+        if g.get('db_wrote'):
+            window = current_app.config.get('DB_READ_YOUR_WRITES_SECONDS', 5)
+            http_session[RYW_SESSION_KEY] = time.time() + window
+        return response
@@ -0,0 +1,184 @@
+"""
+Historique des fonds de groupe : points de contrôle mensuels et soldes à date.
+- fund_checkpoint : cotisations et aides approuvées cumulées d'un groupe avant chaque début de mois
+  (as_of exclu), archives comprises ; une ligne par groupe et par mois clos
+- Solde au jour X : dernier point de contrôle <= X, plus les transactions datées entre ce point et X
+- Série pour les graphiques : les points de contrôle, puis les mois pas encore clos en une requête groupée
+- Invalidation par triggers SQLite : une transaction approuvée insérée, modifiée ou désapprouvée
+  supprime les points de contrôle postérieurs à sa date ; le prochain passage de build_checkpoints()
+  les recalcule à partir du dernier point resté valide. L'archivage ne change aucun total et
+  n'invalide rien ; les suppressions de transactions (comptes supprimés) passent par invalidate_user()
+- Le solde utilise le taux de commission courant, comme group_balance()
+
+Usage :
+    flask --app app fund-checkpoints [--max-seconds 60]
+    /api/admin/groups/<id>/fund?at=2024-06-30
+    /api/admin/groups/<id>/fund-history?start=2024-01-01&end=2024-12-31
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, bindparam, case, func, select, text
+
+from archive import transaction_source
+from models import balance_from_totals, db
+
+CHECKPOINT_DDL = (
+    'CREATE TABLE IF NOT EXISTS fund_checkpoint ('
+    ' id INTEGER PRIMARY KEY,'
+    ' group_id INTEGER NOT NULL,'
+    ' as_of DATETIME NOT NULL,'
+    ' cotisations INTEGER NOT NULL DEFAULT 0,'
+    ' aides INTEGER NOT NULL DEFAULT 0,'
+    ' UNIQUE (group_id, as_of))'
+)
+_AFFECTS = "{row}.status = 'approved' AND {row}.type IN ('cotisation', 'aide')"
+_INVALIDATE = 'DELETE FROM fund_checkpoint WHERE group_id = {row}.group_id AND as_of > {row}.date;'
+CHECKPOINT_TRIGGERS = {
+    'fc_transaction_ins': (
+        f"AFTER INSERT ON 'transaction' WHEN {_AFFECTS.format(row='NEW')} "
+        f"BEGIN {_INVALIDATE.format(row='NEW')} END"),
+    'fc_transaction_upd': (
+        "AFTER UPDATE OF status, amount, type, date, group_id ON 'transaction' "
+        f"WHEN ({_AFFECTS.format(row='OLD')}) OR ({_AFFECTS.format(row='NEW')}) "
+        f"BEGIN {_INVALIDATE.format(row='OLD')} {_INVALIDATE.format(row='NEW')} END"),
+    'fc_group_del': "AFTER DELETE ON 'group' BEGIN DELETE FROM fund_checkpoint WHERE group_id = OLD.id; END",
+}
+
+
+def create_checkpoints(conn):
+    """Create fund_checkpoint and its invalidation triggers (filled by build_checkpoints())."""
+    conn.execute(text(CHECKPOINT_DDL))
+    for name, body in CHECKPOINT_TRIGGERS.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body}'))
+
+
+def month_start(dt):
+    return datetime(dt.year, dt.month, 1)
+
+
+def next_month(dt):
+    return datetime(dt.year + dt.month // 12, dt.month % 12 + 1, 1)
+
+
+def _month_key(dt):
+    return dt.strftime('%Y-%m')
+
+
+def _as_datetime(value):
+    return value if isinstance(value, datetime) or value is None else datetime.fromisoformat(value)
+
+
+def _sums(T):
+    return (func.coalesce(func.sum(case((T.type == 'cotisation', T.amount), else_=0)), 0),
+            func.coalesce(func.sum(case((T.type == 'aide', T.amount), else_=0)), 0))
+
+
+def _totals_query(group_id, start, end, monthly=False):
+    """Approved (cotisations, aides) of a group dated in [start, end), per 'YYYY-MM' month when `monthly`."""
+    T = transaction_source(True)
+    month = func.strftime('%Y-%m', T.date)
+    query = select(month, *_sums(T)).group_by(month) if monthly else select(*_sums(T))
+    query = query.where(T.group_id == group_id, T.status == 'approved')
+    if start is not None:
+        query = query.where(T.date >= start)
+    return query.where(T.date < end)
+
+
+def _checkpoints(conn, group_id, before, latest=False):
+    """Checkpoints of a group with as_of <= before: [(as_of, cotisations, aides)], oldest first or the latest only."""
+    rows = conn.execute(text(
+        'SELECT as_of, cotisations, aides FROM fund_checkpoint WHERE group_id = :gid AND as_of <= :before '
+        f"ORDER BY as_of {'DESC LIMIT 1' if latest else ''}").bindparams(bindparam('before', type_=DateTime)),
+        {'gid': group_id, 'before': before}).all()
+    return [(_as_datetime(r[0]), r[1], r[2]) for r in rows]
+
+
+def fund_as_of(group_id, at=None):
+    """Group fund counting the approved transactions dated before `at` (now when None)."""
+    at = at or datetime.utcnow()
+    latest = _checkpoints(db.session, group_id, at, latest=True)
+    start, cotisations, aides = latest[0] if latest else (None, 0, 0)
+    delta = db.session.execute(_totals_query(group_id, start, at)).one()
+    return balance_from_totals(cotisations + delta[0], aides + delta[1])
+
+
+def fund_series(group_id, start=None, end=None, now=None):
+    """[(date, balance)] at each month start up to `end` (default now), then at `end` itself."""
+    now = now or datetime.utcnow()
+    end = min(end or now, now)
+    checkpoints = _checkpoints(db.session, group_id, end)
+    series = [(as_of, balance_from_totals(c, a)) for as_of, c, a in checkpoints]
+    last, cotisations, aides = checkpoints[-1] if checkpoints else (None, 0, 0)
+    # Mois pas encore clos en base (travail pas encore passé ou invalidation) : une requête groupée
+    months = {m: (c, a) for m, c, a in db.session.execute(_totals_query(group_id, last, end, monthly=True))}
+    cursor = last or (datetime.strptime(min(months), '%Y-%m') if months else None)
+    while cursor is not None and cursor <= end:
+        c, a = months.get(_month_key(cursor), (0, 0))
+        cotisations, aides = cotisations + c, aides + a
+        cursor = next_month(cursor)
+        if cursor <= end:
+            series.append((cursor, balance_from_totals(cotisations, aides)))
+    if not series or series[-1][0] < end:
+        series.append((end, balance_from_totals(cotisations, aides)))
+    if start is not None:
+        series = [p for p in series if p[0] >= start]
+    return series
+
+
+def invalidate_user(user_id):
+    """Drop the checkpoints of the groups where a deleted user has transactions (the caller commits)."""
+    db.session.execute(text(
+        "DELETE FROM fund_checkpoint WHERE group_id IN (SELECT group_id FROM 'transaction' WHERE user_id = :uid "
+        'UNION SELECT group_id FROM transaction_archive_totals WHERE user_id = :uid)'), {'uid': user_id})
+
+
+def _build_group(conn, group_id, close):
+    """Insert the missing month-start checkpoints of one group up to `close`. Returns rows added."""
+    latest = _checkpoints(conn, group_id, close, latest=True)
+    if latest:
+        cursor, cotisations, aides = latest[0]
+    else:
+        T = transaction_source(True)
+        created = conn.execute(text("SELECT created_at FROM 'group' WHERE id = :gid"), {'gid': group_id}).scalar()
+        oldest = conn.execute(select(func.min(T.date)).where(T.group_id == group_id)).scalar()
+        dates = [_as_datetime(d) for d in (created, oldest) if d]
+        if not dates:
+            return 0
+        cursor, cotisations, aides = month_start(min(dates)), 0, 0
+    if cursor >= close:
+        return 0
+    months = {m: (c, a) for m, c, a in conn.execute(_totals_query(group_id, cursor, close, monthly=True))}
+    rows = []
+    while cursor < close:
+        c, a = months.get(_month_key(cursor), (0, 0))
+        cotisations, aides = cotisations + c, aides + a
+        cursor = next_month(cursor)
+        rows.append({'gid': group_id, 'at': cursor, 'c': cotisations, 'a': aides})
+    conn.execute(text('INSERT OR IGNORE INTO fund_checkpoint (group_id, as_of, cotisations, aides) '
+                      'VALUES (:gid, :at, :c, :a)').bindparams(bindparam('at', type_=DateTime)), rows)
+    return len(rows)
+
+
+def build_checkpoints(engine=None, max_seconds=None, now=None, logger=None):
+    """Close every group's past months into fund_checkpoint, one short transaction per group."""
+    engine = engine or db.engine
+    close = month_start(now or datetime.utcnow())
+    started = time.perf_counter()
+    report = {'groups': 0, 'checkpoints': 0, 'done': False}
+    with engine.connect() as conn:
+        group_ids = [r[0] for r in conn.execute(text("SELECT id FROM 'group' ORDER BY id"))]
+    for gid in group_ids:
+        if max_seconds is not None and time.perf_counter() - started >= max_seconds:
+            break
+        with engine.begin() as conn:
+            added = _build_group(conn, gid, close)
+        report['groups'] += 1
+        report['checkpoints'] += added
+    else:
+        report['done'] = True
+    report['duration_s'] = round(time.perf_counter() - started, 3)
+    if logger and report['checkpoints']:
+        logger.info('Fund checkpoints: %s', report)
+    return report
@@ -0,0 +1,208 @@
+"""
+Fonds des groupes tenus à jour en base et approbations conditionnelles.
+- group_fund (id = groupe) : cotisations et aides approuvées, archives comprises, mises à jour par des
+  triggers SQLite sur 'transaction' et transaction_archive_totals (même hors ORM : paiements,
+  webhooks, archivage, suppressions)
+- group_balance() / group_balances() lisent cette ligne au lieu de sommer les transactions
+- approve() : un seul UPDATE conditionnel ; une aide ne passe que si le fonds du groupe la couvre
+  au moment de l'écriture. Deux admins qui approuvent des aides du même groupe ne peuvent plus
+  dépasser le fonds, sans verrou applicatif ; les autres groupes ne sont jamais bloqués
+- decide_many() : approbation / refus en masse (liste /admin) dans une seule transaction ;
+  groupe par groupe, cotisations puis aides par ordre d'arrivée, chaque aide passant par le même
+  UPDATE conditionnel ; notifications insérées dans la même transaction, un résultat par id
+- Verrou d'écriture occupé ou instantané de lecture périmé (WAL) : la tentative est annulée puis
+  rejouée, APPROVAL_RETRIES fois au plus, avec un court délai croissant
+"""
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, text
+from sqlalchemy.exc import OperationalError
+
+from models import Notification, User, commission_rate, db
+
+FUND_DDL = (
+    'CREATE TABLE IF NOT EXISTS group_fund ('
+    ' id INTEGER PRIMARY KEY,'
+    ' cotisations INTEGER NOT NULL DEFAULT 0,'
+    ' aides INTEGER NOT NULL DEFAULT 0)'
+)
+_APPROVED = "{row}.status = 'approved' AND {row}.type IN ('cotisation', 'aide')"
+# Même forme que les compteurs data_version (migrations.py) : INSERT ... SELECT ... WHERE ... ON CONFLICT
+_ADD = ('INSERT INTO group_fund (id, cotisations, aides) SELECT {row}.group_id, '
+        "CASE WHEN {row}.type = 'cotisation' THEN {amount} ELSE 0 END, "
+        "CASE WHEN {row}.type = 'aide' THEN {amount} ELSE 0 END WHERE {when} "
+        'ON CONFLICT (id) DO UPDATE SET cotisations = cotisations + excluded.cotisations, '
+        'aides = aides + excluded.aides;')
+
+
+def _add(row, amount=None, when='1'):
+    return _ADD.format(row=row, amount=amount or f'{row}.amount', when=when)
+
+
+FUND_TRIGGERS = {
+    'gf_transaction_ins': f"AFTER INSERT ON 'transaction' WHEN {_APPROVED.format(row='NEW')} "
+                          f"BEGIN {_add('NEW')} END",
+    'gf_transaction_upd': "AFTER UPDATE OF status, amount, type, group_id ON 'transaction' "
+                          f"WHEN ({_APPROVED.format(row='OLD')}) OR ({_APPROVED.format(row='NEW')}) BEGIN "
+                          f"{_add('OLD', '-OLD.amount', _APPROVED.format(row='OLD'))} "
+                          f"{_add('NEW', when=_APPROVED.format(row='NEW'))} END",
+    'gf_transaction_del': f"AFTER DELETE ON 'transaction' WHEN {_APPROVED.format(row='OLD')} "
+                          f"BEGIN {_add('OLD', '-OLD.amount')} END",
+    # Archivage : la ligne quitte 'transaction' (-) et entre dans les totaux archivés (+)
+    'gf_archive_totals_ins': f"AFTER INSERT ON transaction_archive_totals WHEN {_APPROVED.format(row='NEW')} "
+                             f"BEGIN {_add('NEW')} END",
+    'gf_archive_totals_upd': f"AFTER UPDATE OF amount ON transaction_archive_totals WHEN {_APPROVED.format(row='NEW')} "
+                             f"BEGIN {_add('NEW', '(NEW.amount - OLD.amount)')} END",
+    'gf_archive_totals_del': f"AFTER DELETE ON transaction_archive_totals WHEN {_APPROVED.format(row='OLD')} "
+                             f"BEGIN {_add('OLD', '-OLD.amount')} END",
+    'gf_group_del': "AFTER DELETE ON 'group' BEGIN DELETE FROM group_fund WHERE id = OLD.id; END",
+}
+
+# Fonds net de la commission, comme balance_from_totals() (CAST tronque vers zéro comme int())
+_BALANCE_SQL = 'f.cotisations - f.aides - CAST(f.cotisations * :rate AS INTEGER)'
+_APPROVE_SQL = (
+    "UPDATE 'transaction' SET status = 'approved' "
+    "WHERE id = :id AND status != 'approved' AND (type != 'aide' OR amount <= COALESCE("
+    f'(SELECT {_BALANCE_SQL} FROM group_fund f WHERE f.id = "transaction".group_id), 0))'
+)
+
+# Backfill par tranches de groupes (voir migrations.py) : chaque fonds recalculé en entier depuis les
+# transactions récentes et archivées, les triggers ajoutent ensuite les écritures postérieures
+FUND_FILL_SQL = (
+    'INSERT OR REPLACE INTO group_fund (id, cotisations, aides) '
+    "SELECT group_id, SUM(CASE WHEN type = 'cotisation' THEN amount ELSE 0 END), "
+    "SUM(CASE WHEN type = 'aide' THEN amount ELSE 0 END) FROM ("
+    "SELECT group_id, type, amount FROM 'transaction' WHERE status = 'approved' "
+    "UNION ALL SELECT group_id, type, amount FROM transaction_archive_totals WHERE status = 'approved'"
+    ') WHERE group_id > :lo AND group_id <= :hi GROUP BY group_id'
+)
+
+
+def _config(name, default):
+    try:
+        return current_app.config.get(name, default)
+    except RuntimeError:
+        return default
+
+
+def create_fund(conn):
+    """Create group_fund and its triggers; the funds are filled by FUND_FILL_SQL."""
+    conn.execute(text(FUND_DDL))
+    for name, body in FUND_TRIGGERS.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body}'))
+
+
+def _busy(exc):
+    message = str(exc.orig if getattr(exc, 'orig', None) is not None else exc).lower()
+    return 'locked' in message or 'busy' in message
+
+
+def _with_retries(work, retries=None, backoff_ms=None):
+    """Run `work()` and commit; on a busy write lock, roll back and run it again (bounded)."""
+    retries = retries if retries is not None else _config('APPROVAL_RETRIES', 5)
+    backoff = (backoff_ms if backoff_ms is not None else _config('APPROVAL_BACKOFF_MS', 20)) / 1000.0
+    for attempt in range(retries + 1):
+        try:
+            result = work()
+            db.session.commit()
+            return result
+        except OperationalError as exc:
+            db.session.rollback()
+            if not _busy(exc) or attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+def _approve_one(tx_id, rate, pending_only=False):
+    sql = _APPROVE_SQL + (" AND status = 'pending'" if pending_only else '')
+    return db.session.execute(text(sql), {'id': tx_id, 'rate': rate}).rowcount
+
+
+def approve(tx_id, retries=None, backoff_ms=None):
+    """Approve a transaction in one conditional UPDATE and commit.
+
+    Returns 'approved', 'already_approved', 'insufficient_funds' or 'not_found'.
+    """
+    changed = _with_retries(lambda: _approve_one(tx_id, commission_rate()), retries, backoff_ms)
+    if changed:
+        return 'approved'
+    status = db.session.execute(text("SELECT status FROM 'transaction' WHERE id = :id"), {'id': tx_id}).scalar()
+    if status is None:
+        return 'not_found'
+    return 'already_approved' if status == 'approved' else 'insufficient_funds'
+
+
+_DECISION_MESSAGES = {
+    ('approved', 'cotisation'): ('tx_approved', 'Transaction approuvée'),
+    ('approved', 'aide'): ('aid_approved', 'Votre demande d’aide a été approuvée'),
+    ('rejected', 'aide'): ('aid_rejected', 'Votre demande d’aide a été refusée'),
+}
+
+
+def _decide(ids, action, rate, notes_by_id):
+    rows = db.session.execute(text(
+        "SELECT t.id, t.group_id, t.user_id, t.type, t.amount, t.status, g.name FROM 'transaction' t "
+        "JOIN 'group' g ON g.id = t.group_id WHERE t.id IN :ids ORDER BY t.group_id, t.type = 'aide', t.date, t.id"
+    ).bindparams(bindparam('ids', expanding=True)), {'ids': ids}).all()
+    results = dict.fromkeys(ids, 'not_found')
+    pending = [r for r in rows if r.status == 'pending']
+    for r in rows:
+        if r.status != 'pending':
+            results[r.id] = 'not_pending'
+    done = set()
+    if action == 'reject' and pending:
+        done = set(db.session.execute(
+            text("UPDATE 'transaction' SET status = 'rejected' WHERE id IN :ids AND status = 'pending' RETURNING id")
+            .bindparams(bindparam('ids', expanding=True)), {'ids': [r.id for r in pending]}).scalars())
+    elif action == 'approve':
+        # Par groupe : cotisations d'abord (elles alimentent le fonds), puis les aides dans l'ordre d'arrivée
+        done = {r.id for r in pending if _approve_one(r.id, rate, pending_only=True)}
+    decided = [r for r in pending if r.id in done]
+    failed = [r.id for r in pending if r.id not in done]
+    if failed:
+        # Relu sous le verrou d'écriture : décidée entre-temps par un autre admin, ou fonds insuffisant
+        still_pending = set(db.session.execute(
+            text("SELECT id FROM 'transaction' WHERE id IN :ids AND status = 'pending'")
+            .bindparams(bindparam('ids', expanding=True)), {'ids': failed}).scalars())
+        for tx_id in failed:
+            results[tx_id] = 'insufficient_funds' if tx_id in still_pending else 'not_pending'
+    status = 'approved' if action == 'approve' else 'rejected'
+    now = datetime.utcnow()
+    notes, approved_aids = [], {}
+    for r in decided:
+        results[r.id] = status
+        # Mêmes notifications que les routes unitaires (rien pour une cotisation refusée)
+        note = _DECISION_MESSAGES.get((status, 'aide' if r.type == 'aide' else 'cotisation'))
+        if note:
+            message = note[1] + (f' : {notes_by_id[r.id]}' if r.id in notes_by_id else '')
+            notes.append({'user_id': r.user_id, 'group_id': r.group_id, 'type': note[0], 'message': message[:255],
+                          'date': now})
+        if status == 'approved' and r.type == 'aide':
+            count, total, _ = approved_aids.get(r.group_id, (0, 0, r.name))
+            approved_aids[r.group_id] = (count + 1, total + r.amount, r.name)
+    admin_ids = [a for (a,) in db.session.query(User.id).filter_by(role='admin')] if approved_aids else []
+    for gid, (count, total, name) in approved_aids.items():
+        # Un seul message par groupe pour les admins au lieu d'un par aide
+        notes.extend({'user_id': a, 'group_id': gid, 'type': 'aid_approved', 'date': now,
+                      'message': f"{count} aide(s) ({total} MAD) approuvée(s) pour {name}"} for a in admin_ids)
+    if notes:
+        db.session.execute(insert(Notification), notes)
+    return results
+
+
+def decide_many(ids, action, notes=None, retries=None, backoff_ms=None):
+    """Approve or reject many transactions in one transaction: {id: result}.
+
+    Results: 'approved', 'rejected', 'insufficient_funds', 'not_pending' or 'not_found'.
+    `notes` ({id: text}) is appended to the member's notification, e.g. the reasons of a rejection.
+    """
+    if action not in ('approve', 'reject'):
+        raise ValueError(f'unknown action: {action}')
+    ids = sorted({int(i) for i in ids})
+    if not ids:
+        return {}
+    rate = commission_rate()
+    return _with_retries(lambda: _decide(ids, action, rate, notes or {}), retries, backoff_ms)
@@ -0,0 +1,219 @@
+"""
+Suppression et suspension des groupes en masse, ensemblistes et par tranches.
+- Une requête par table pour toute la sélection (UPDATE / DELETE ... WHERE group_id IN (...)),
+  au lieu de trois DELETE et d'un objet ORM par groupe
+- Les petits groupes sont supprimés tout de suite ; au-delà de GROUP_PURGE_INLINE_ROWS lignes
+  dépendantes, le groupe est suspendu et mis en file (group_purge)
+- La file est vidée par tranches de N lignes, une courte transaction par tranche : le verrou
+  d'écriture SQLite n'est jamais tenu plus d'une tranche ; la progression est enregistrée
+
+Usage :
+    flask --app app purge-groups [--chunk-size 1000 --max-seconds 60]
+"""
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, text
+
+from archive import ARCHIVED_MODELS, archive_schema, qualified_name
+from models import db
+
+# Tables enfants, vidées dans cet ordre avant la ligne 'group' (puis leurs archives, voir archive.py)
+PURGE_TABLES = ('transaction', 'notification', 'membership')
+
+GROUP_PURGE_DDL = (
+    'CREATE TABLE IF NOT EXISTS group_purge ('
+    ' id INTEGER PRIMARY KEY,'
+    ' group_id INTEGER NOT NULL UNIQUE,'
+    ' group_name VARCHAR(120),'
+    ' requested_by INTEGER,'
+    ' requested_at DATETIME NOT NULL,'
+    ' started_at DATETIME,'
+    ' finished_at DATETIME,'
+    " status VARCHAR(10) NOT NULL DEFAULT 'pending',"
+    ' rows_total INTEGER NOT NULL DEFAULT 0,'
+    ' rows_deleted INTEGER NOT NULL DEFAULT 0,'
+    ' error VARCHAR(255))'
+)
+
+
+def _by_groups(sql):
+    """`sql` with its `:gids` placeholder bound as an expanding IN list."""
+    return text(sql).bindparams(bindparam('gids', expanding=True))
+
+
+def _config(name, default):
+    try:
+        return current_app.config.get(name, default)
+    except RuntimeError:
+        return default
+
+
+def _purge_tables():
+    """Quoted names of the tables holding a group's rows: recent ones, then the archives."""
+    schema = archive_schema()
+    return [f"'{t}'" for t in PURGE_TABLES] + [qualified_name(source, schema) for source in ARCHIVED_MODELS]
+
+
+def dependent_rows(group_ids):
+    """{group_id: number of transaction, notification and membership rows, archived ones included}."""
+    group_ids = list(group_ids)
+    counts = dict.fromkeys(group_ids, 0)
+    if not group_ids:
+        return counts
+    union = ' UNION ALL '.join(
+        f"SELECT group_id, COUNT(*) AS n FROM {t} WHERE group_id IN :gids GROUP BY group_id"
+        for t in _purge_tables())
+    for gid, n in db.session.execute(_by_groups(f'SELECT group_id, SUM(n) FROM ({union}) GROUP BY group_id'),
+                                     {'gids': group_ids}):
+        counts[gid] = int(n)
+    return counts
+
+
+def purging_ids(group_ids=None):
+    """Ids of the groups waiting in (or going through) the purge queue."""
+    sql = "SELECT group_id FROM group_purge WHERE status IN ('pending', 'running')"
+    if group_ids is None:
+        return {r[0] for r in db.session.execute(text(sql))}
+    group_ids = list(group_ids)
+    if not group_ids:
+        return set()
+    return {r[0] for r in db.session.execute(_by_groups(sql + ' AND group_id IN :gids'), {'gids': group_ids})}
+
+
+def set_archived(group_ids, archived):
+    """Suspend or reactivate groups in one UPDATE; groups being purged stay suspended."""
+    group_ids = list(group_ids)
+    if not group_ids:
+        return 0
+    changed = db.session.execute(_by_groups(
+        "UPDATE 'group' SET archived = :archived WHERE id IN :gids "
+        "AND id NOT IN (SELECT group_id FROM group_purge WHERE status IN ('pending', 'running'))"),
+        {'gids': group_ids, 'archived': archived}).rowcount
+    db.session.commit()
+    return changed
+
+
+def delete_groups_now(group_ids):
+    """Delete groups and their dependent rows in one transaction, one DELETE per table."""
+    group_ids = list(group_ids)
+    if not group_ids:
+        return 0
+    params = {'gids': group_ids}
+    for table in _purge_tables():
+        db.session.execute(_by_groups(f'DELETE FROM {table} WHERE group_id IN :gids'), params)
+    db.session.execute(_by_groups('DELETE FROM transaction_archive_totals WHERE group_id IN :gids'), params)
+    deleted = db.session.execute(_by_groups("DELETE FROM 'group' WHERE id IN :gids"), params).rowcount
+    db.session.commit()
+    return deleted
+
+
+def schedule_purge(group_ids, requested_by=None, counts=None):
+    """Suspend the groups and queue them for chunked deletion."""
+    group_ids = list(group_ids)
+    if not group_ids:
+        return 0
+    counts = counts if counts is not None else dependent_rows(group_ids)
+    params = {'gids': group_ids}
+    db.session.execute(_by_groups("UPDATE 'group' SET archived = 1 WHERE id IN :gids"), params)
+    names = dict(db.session.execute(_by_groups("SELECT id, name FROM 'group' WHERE id IN :gids"), params).all())
+    now = datetime.utcnow()
+    db.session.execute(
+        text('INSERT INTO group_purge (group_id, group_name, requested_by, requested_at, rows_total) '
+             'VALUES (:gid, :name, :by, :at, :total) '
+             "ON CONFLICT (group_id) DO UPDATE SET group_name = excluded.group_name, "
+             "requested_by = excluded.requested_by, requested_at = excluded.requested_at, "
+             "rows_total = excluded.rows_total, rows_deleted = 0, status = 'pending', "
+             'started_at = NULL, finished_at = NULL, error = NULL'),
+        [{'gid': gid, 'name': names.get(gid), 'by': requested_by, 'at': now, 'total': counts.get(gid, 0)}
+         for gid in group_ids])
+    db.session.commit()
+    return len(group_ids)
+
+
+def delete_groups(group_ids, requested_by=None, inline_limit=None):
+    """Delete small groups now and queue the others. Returns {'deleted': n, 'scheduled': m}."""
+    inline_limit = inline_limit if inline_limit is not None else _config('GROUP_PURGE_INLINE_ROWS', 5000)
+    group_ids = sorted(set(group_ids) - purging_ids(group_ids))
+    counts = dependent_rows(group_ids)
+    inline, later, budget = [], [], inline_limit
+    for gid in sorted(group_ids, key=counts.get):
+        # Plafond cumulé : la transaction de la requête reste courte quelle que soit la sélection
+        if counts[gid] <= budget:
+            inline.append(gid)
+            budget -= counts[gid]
+        else:
+            later.append(gid)
+    return {'deleted': delete_groups_now(inline), 'scheduled': schedule_purge(later, requested_by, counts)}
+
+
+def _purge_chunk(conn, purge_id, gid, chunk_size):
+    """Delete up to `chunk_size` dependent rows of one group; the group row once they are gone."""
+    for table in _purge_tables():
+        deleted = conn.execute(text(
+            f"DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE group_id = :gid LIMIT :n)"),
+            {'gid': gid, 'n': chunk_size}).rowcount
+        if deleted:
+            conn.execute(text('UPDATE group_purge SET rows_deleted = rows_deleted + :r WHERE id = :id'),
+                         {'r': deleted, 'id': purge_id})
+            return deleted, False
+    conn.execute(text('DELETE FROM transaction_archive_totals WHERE group_id = :gid'), {'gid': gid})
+    conn.execute(text("DELETE FROM 'group' WHERE id = :gid"), {'gid': gid})
+    conn.execute(text("UPDATE group_purge SET status = 'done', finished_at = :at WHERE id = :id"),
+                 {'at': datetime.utcnow(), 'id': purge_id})
+    return 0, True
+
+
+def process_group_purges(engine=None, chunk_size=None, max_seconds=None, pause_ms=None, logger=None):
+    """Work through the purge queue chunk by chunk. Returns a progress report."""
+    engine = engine or db.engine
+    chunk_size = chunk_size or _config('GROUP_PURGE_CHUNK_SIZE', 1000)
+    pause = (pause_ms if pause_ms is not None else _config('GROUP_PURGE_PAUSE_MS', 50)) / 1000.0
+    started = time.perf_counter()
+    report = {'groups': 0, 'chunks': 0, 'rows': 0, 'done': False}
+    while max_seconds is None or time.perf_counter() - started < max_seconds:
+        with engine.begin() as conn:
+            job = conn.execute(text("SELECT id, group_id, status FROM group_purge "
+                                    "WHERE status IN ('pending', 'running') ORDER BY id LIMIT 1")).first()
+            if job is None:
+                report['done'] = True
+                break
+            if job.status == 'pending':
+                conn.execute(text("UPDATE group_purge SET status = 'running', started_at = :at WHERE id = :id"),
+                             {'at': datetime.utcnow(), 'id': job.id})
+        try:
+            with engine.begin() as conn:
+                deleted, finished = _purge_chunk(conn, job.id, job.group_id, chunk_size)
+        except Exception as exc:
+            with engine.begin() as conn:
+                conn.execute(text("UPDATE group_purge SET status = 'failed', error = :e, finished_at = :at "
+                                  'WHERE id = :id'), {'e': str(exc)[:255], 'at': datetime.utcnow(), 'id': job.id})
+            if logger:
+                logger.exception('Group purge %s failed', job.group_id)
+            continue
+        report['chunks'] += 1
+        report['rows'] += deleted
+        report['groups'] += int(finished)
+        if pause:
+            # Laisse passer les écritures de l'application entre deux tranches
+            time.sleep(pause)
+    report['duration_s'] = round(time.perf_counter() - started, 3)
+    if logger and report['chunks']:
+        logger.info('Group purge: %s', report)
+    return report
+
+
+def purge_status(group_ids=None):
+    """{group_id: {'status', 'rows_total', 'rows_deleted', 'percent'}} for queued or failed purges."""
+    rows = db.session.execute(text(
+        "SELECT group_id, group_name, status, rows_total, rows_deleted, error FROM group_purge "
+        "WHERE status IN ('pending', 'running', 'failed')")).mappings()
+    out = {}
+    for r in rows:
+        if group_ids is not None and r['group_id'] not in group_ids:
+            continue
+        total = r['rows_total'] or 0
+        percent = 100 if not total else min(100, int(r['rows_deleted'] * 100 / total))
+        out[r['group_id']] = dict(r, percent=percent)
+    return out
@@ -0,0 +1,134 @@
+"""
+Recherche plein texte des groupes (SQLite FTS5).
+- group_fts indexe nom + description, rowid = group.id, tenu à jour par des triggers sur 'group'
+- Normalisation : casse et accents latins par le tokenizer unicode61 (remove_diacritics 2) ;
+  voyelles courtes, tatweel et variantes d'alif / ta marbuta / alif maqsura arabes repliées
+  par la même table de correspondance en SQL (triggers) et en Python (requête)
+- Classement BM25 (nom pondéré), pagination par clé (rang, id), nombre de membres et fonds
+  (group_fund, voir group_funds.py) lus dans la même requête, pour la seule page renvoyée
+"""
+import re
+
+from sqlalchemy import text
+
+from models import balance_from_totals, db
+
+# Repli des caractères arabes : la même table sert à l'index et aux requêtes
+ARABIC_FOLDING = {
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ة': 'ه', 'ى': 'ي', 'ؤ': 'و', 'ئ': 'ي',
+    'ـ': '',
+    # harakat (fatha, damma, kasra, tanwin, shadda, sukun) et alif suscrit
+    'ً': '', 'ٌ': '', 'ٍ': '', 'َ': '', 'ُ': '', 'ِ': '', 'ّ': '', 'ْ': '', 'ٰ': '',
+}
+NAME_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+MAX_TERMS = 8
+ARABIC_ARTICLE = 'ال'
+_TERM = re.compile(r'\w+', re.UNICODE)
+_ARABIC = re.compile('[\u0600-\u06ff]')
+_FOLD_TABLE = str.maketrans(ARABIC_FOLDING)
+
+
+def normalize(value):
+    return (value or '').translate(_FOLD_TABLE)
+
+
+def normalize_sql(expr):
+    """SQL expression applying normalize() to `expr` (nested replace(), no Python function needed)."""
+    out = f"coalesce({expr}, '')"
+    for src, dst in ARABIC_FOLDING.items():
+        out = f"replace({out}, '{src}', '{dst}')"
+    return out
+
+
+def fts_query(q):
+    """User input -> FTS5 query: every term must match, the last one as a prefix."""
+    terms = _TERM.findall(normalize(q))[:MAX_TERMS]
+    if not terms:
+        return None
+    clauses = []
+    for i, term in enumerate(terms):
+        star = '*' if i == len(terms) - 1 else ''
+        variants = [term]
+        if _ARABIC.match(term) and not term.startswith(ARABIC_ARTICLE):
+            # « امل » doit aussi trouver « الامل » : l'article est collé au mot
+            variants.append(ARABIC_ARTICLE + term)
+        clauses.append('(' + ' OR '.join(f'"{v}"{star}' for v in variants) + ')')
+    return ' AND '.join(clauses)
+
+
+def _row(expr_name, expr_desc):
+    return f"{normalize_sql(expr_name)}, {normalize_sql(expr_desc)}"
+
+
+def create_index(conn):
+    """Create group_fts and its sync triggers; existing groups are indexed by INDEX_FILL_SQL."""
+    conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS group_fts USING fts5("
+                      "name, description, tokenize = 'unicode61 remove_diacritics 2')"))
+    triggers = {
+        'group_fts_ins': "AFTER INSERT ON 'group' BEGIN "
+                         f"INSERT INTO group_fts (rowid, name, description) VALUES (NEW.id, {_row('NEW.name', 'NEW.description')}); END",
+        'group_fts_upd': "AFTER UPDATE OF name, description ON 'group' BEGIN "
+                         "DELETE FROM group_fts WHERE rowid = OLD.id; "
+                         f"INSERT INTO group_fts (rowid, name, description) VALUES (NEW.id, {_row('NEW.name', 'NEW.description')}); END",
+        'group_fts_del': "AFTER DELETE ON 'group' BEGIN DELETE FROM group_fts WHERE rowid = OLD.id; END",
+    }
+    for name, body in triggers.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body}'))
+
+
+# Backfill par tranches d'ids (voir migrations.py)
+INDEX_FILL_SQL = ("INSERT OR REPLACE INTO group_fts (rowid, name, description) "
+                  f"SELECT id, {_row('name', 'description')} FROM 'group' WHERE id > :lo AND id <= :hi")
+
+
+def parse_cursor(value):
+    """'rank:id' -> (rank, id), or None when absent or malformed."""
+    try:
+        rank, gid = (value or '').rsplit(':', 1)
+        return float(rank), int(gid)
+    except ValueError:
+        return None
+
+
+def search_groups(q, limit=20, after=None, include_archived=False):
+    """BM25-ranked page of groups matching `q`: (rows, next_cursor).
+
+    Each row has id, name, description, monthly_contribution, archived, rank, members, fund.
+    """
+    match = fts_query(q)
+    if match is None:
+        return [], None
+    params = {'match': match, 'limit': limit + 1}
+    keyset = ''
+    cursor = parse_cursor(after)
+    if cursor is not None:
+        keyset = 'AND (h.rank > :after_rank OR (h.rank = :after_rank AND h.id > :after_id))'
+        params.update(after_rank=cursor[0], after_id=cursor[1])
+    archived = '' if include_archived else 'AND g.archived = 0'
+    sql = f"""
+        WITH hits AS (
+            SELECT rowid AS id, bm25(group_fts, {NAME_WEIGHT}, {DESCRIPTION_WEIGHT}) AS rank
+            FROM group_fts WHERE group_fts MATCH :match
+        ), page AS (
+            SELECT h.id, h.rank FROM hits h JOIN 'group' g ON g.id = h.id
+            WHERE 1 = 1 {archived} {keyset}
+            ORDER BY h.rank, h.id LIMIT :limit
+        )
+        SELECT g.id, g.name, g.description, g.monthly_contribution, g.archived, page.rank,
+               (SELECT COUNT(*) FROM membership m WHERE m.group_id = g.id) AS members,
+               f.cotisations, f.aides
+        FROM page JOIN 'group' g ON g.id = page.id LEFT JOIN group_fund f ON f.id = g.id
+        ORDER BY page.rank, page.id
+    """
+    # Toujours sur la base principale : group_fts n'est pas répliqué (voir replication.py)
+    rows = [dict(r) for r in db.session.execute(text(sql), params, bind_arguments={'bind': db.engine}).mappings()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f"{rows[-1]['rank']!r}:{rows[-1]['id']}"
+    for r in rows:
+        r['fund'] = balance_from_totals(r.pop('cotisations'), r.pop('aides'))
+    return rows, next_cursor
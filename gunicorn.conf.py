@@ -0,0 +1,29 @@
+"""
+Configuration gunicorn : workers et threads lus dans Config, application préchargée (voir wsgi.py).
+
+Usage :
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+
+from config import Config
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"  # Railway fournit le PORT via variable d'environnement
+workers = Config.WEB_WORKERS
+threads = Config.WEB_THREADS
+worker_class = 'gthread' if Config.WEB_THREADS > 1 else 'sync'
+timeout = Config.WEB_TIMEOUT
+preload_app = True
+
+
+def post_fork(server, worker):
+    from wsgi import after_fork, app
+
+    after_fork(app)
+
+
+def post_worker_init(worker):
+    from wsgi import app, start_designated_scheduler
+
+    if start_designated_scheduler(app):
+        worker.log.info('Planificateur démarré dans le worker %s', worker.pid)
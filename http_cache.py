@@ -0,0 +1,94 @@
+"""
+Validation HTTP (ETag / If-None-Match) pilotée par les versions de données (table data_version).
+- ETag fort = empreinte de (route, paramètres, utilisateur, langue, base lue, versions, build des assets)
+- If-None-Match identique : 304 Not Modified sans exécuter la vue
+- Portées : 'global' (toute écriture affichée) par défaut ; group_scopes('group_id') limite une page
+  filtrée sur un groupe à ce groupe, à la liste des groupes et aux noms des utilisateurs
+- Pages qui dépendent aussi de la date (mois en cours) : extra=current_month ajoute le mois à l'ETag,
+  sans quoi le premier affichage d'un nouveau mois sans écriture renverrait 304 et les chiffres du mois passé
+- Jamais pour les requêtes autres que GET/HEAD ni quand un message flash attend d'être affiché
+
+Usage :
+    @bp.route('/admin')
+    @role_required('admin')
+    @etag_versioned(extra=current_month)
+    def admin(): ...
+"""
+import hashlib
+import json
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+
+from assets import manifest_version
+from db_routing import current_read_bind
+from i18n import get_current_language, get_language_direction
+from template_cache import data_versions
+
+GLOBAL_SCOPES = ('global',)
+
+
+def group_scopes(param):
+    """Scopes for a page filtered on ?<param>=<group id>; the global scope when unfiltered."""
+    def scopes(view_args):
+        gid = request.args.get(param, type=int)
+        if gid is None:
+            return GLOBAL_SCOPES
+        return ('groups', 'users', f'group:{gid}')
+    return scopes
+
+
+def current_month():
+    """'YYYY-MM' (UTC): ETag part of the views whose figures depend on the current month."""
+    return datetime.utcnow().strftime('%Y-%m')
+
+
+def current_day():
+    """'YYYY-MM-DD' (UTC): same, for views that end their output at today's date."""
+    return datetime.utcnow().strftime('%Y-%m-%d')
+
+
+def compute_etag(scopes, extra=None):
+    versions = data_versions(scopes)
+    parts = [
+        request.endpoint,
+        sorted(request.view_args.items()) if request.view_args else [],
+        sorted(request.args.items(multi=True)),
+        session.get('user_id'),
+        get_current_language(),
+        get_language_direction(),
+        current_read_bind(),
+        sorted(versions.items()),
+        manifest_version(),
+        extra() if extra else None,
+    ]
+    digest = hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()[:32]
+    return digest
+
+
+def etag_versioned(scopes=None, extra=None):
+    """Answer 304 when the client's ETag matches the current data versions of `scopes`.
+
+    `extra()`, when given, is also part of the ETag (e.g. current_month for date-dependent views).
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if (not current_app.config.get('HTTP_ETAGS_ENABLED', True) or request.method not in ('GET', 'HEAD')
+                    or session.get('_flashes')):
+                return f(*args, **kwargs)
+            # Versions lues avant la vue : une écriture concurrente donne au pire un ETag plus ancien
+            # que le contenu, jamais l'inverse
+            etag = compute_etag(scopes(kwargs) if callable(scopes) else (scopes or GLOBAL_SCOPES), extra)
+            if request.if_none_match.contains(etag):
+                resp = current_app.response_class(status=304)
+            else:
+                resp = make_response(f(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = 'private, no-cache'
+            return resp
+        return wrapper
+    return decorator
@@ -16,6 +16,9 @@ SUPPORTED_LANGUAGES = ['fr', 'en', 'ar']
 # Default language
 DEFAULT_LANGUAGE = 'fr'
 
+# Translations already read, per language (loaded once per process, or in the master before fork)
+_translations = {}
+
 def load_translations(lang_code):
     """
     Load translations for the specified language.
@@ -26,6 +29,18 @@ def load_translations(lang_code):
     Returns:
         dict: Translations dictionary
     """
+    if lang_code not in SUPPORTED_LANGUAGES:
+        lang_code = DEFAULT_LANGUAGE
+    if lang_code not in _translations:
+        _translations[lang_code] = _read_translations(lang_code)
+    return _translations[lang_code]
+
+def preload_translations():
+    """Read every supported language's file now rather than on first use."""
+    for lang_code in SUPPORTED_LANGUAGES:
+        load_translations(lang_code)
+
+def _read_translations(lang_code):
     try:
         file_path = os.path.join(TRANSLATIONS_DIR, f"{lang_code}.json")
         with open(file_path, 'r', encoding='utf-8') as f:
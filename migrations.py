@@ -0,0 +1,417 @@
+"""
+Migrations de schéma versionnées et backfills en ligne.
+- schema_migrations garde les versions appliquées ; chaque migration tourne dans sa propre transaction
+- La migration 1 crée le schéma courant (create_all) : les suivantes doivent rester idempotentes
+  (CREATE ... IF NOT EXISTS, ADD COLUMN seulement si la colonne manque)
+- Un backfill remplit une grande table par tranches de N lignes (pagination par clé sur id),
+  un commit par tranche, débit plafonné, reprise là où il s'était arrêté (backfill_progress)
+- Tables dérivées et index plein texte : la migration ne crée que la table et ses triggers, le contenu
+  existant est calculé par un backfill (tranche recalculée en entier, les triggers suivent les écritures
+  postérieures). Le planificateur reprend les backfills non terminés (run_backfills) ; d'ici là, les
+  lignes pas encore traitées ne reflètent que les écritures faites depuis la migration
+
+Usage :
+    flask --app app migrate [--status]
+    flask --app app backfill NOM [--chunk-size 1000 --max-rows-per-second 5000 --max-seconds 60]
+"""
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+
+from aid_rules import create_screening as create_aid_screening
+from archive import ARCHIVED_MODELS, reserve_archived_ids
+from archive import create_tables as create_archive_tables
+from contribution_streaks import create_streaks, fill_streaks
+from fund_history import create_checkpoints as create_fund_checkpoints
+from group_funds import FUND_FILL_SQL
+from group_funds import create_fund as create_group_fund
+from group_purge import GROUP_PURGE_DDL
+from group_search import INDEX_FILL_SQL as GROUP_INDEX_FILL_SQL
+from group_search import create_index as create_group_search_index
+from models import db
+from notifications import COUNTER_FILL_SQL
+from notifications import create_counter as create_notification_counter
+from user_directory import INDEX_FILL_SQL as USER_INDEX_FILL_SQL
+from user_directory import create_index as create_user_directory_index
+
+MIGRATIONS = []
+BACKFILLS = {}
+
+SCHEMA_MIGRATIONS_DDL = (
+    'CREATE TABLE IF NOT EXISTS schema_migrations ('
+    ' version INTEGER PRIMARY KEY,'
+    ' name VARCHAR(120) NOT NULL,'
+    ' applied_at DATETIME NOT NULL,'
+    ' duration_ms INTEGER)'
+)
+BACKFILL_PROGRESS_DDL = (
+    'CREATE TABLE IF NOT EXISTS backfill_progress ('
+    ' name VARCHAR(120) PRIMARY KEY,'
+    ' last_id INTEGER NOT NULL DEFAULT 0,'
+    ' rows_done INTEGER NOT NULL DEFAULT 0,'
+    ' started_at DATETIME,'
+    ' updated_at DATETIME,'
+    ' completed_at DATETIME)'
+)
+
+
+def migration(version, name):
+    """Register `fn(conn)` as schema migration `version`."""
+    def decorator(fn):
+        if any(v == version for v, _, _ in MIGRATIONS):
+            raise ValueError(f'Duplicate migration version {version}')
+        MIGRATIONS.append((version, name, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def column_exists(conn, table, column):
+    rows = conn.execute(text(f"PRAGMA table_info('{table}')")).mappings().all()
+    return any(r['name'] == column for r in rows)
+
+
+def add_column(conn, table, column, ddl):
+    if not column_exists(conn, table, column):
+        conn.execute(text(f"ALTER TABLE '{table}' ADD COLUMN {column} {ddl}"))
+
+
+def rebuild_table(conn, table):
+    """Recreate `table` from its model (SQLite cannot ALTER a primary key), keeping rows, indexes and triggers."""
+    name = table.name
+    live = [r['name'] for r in conn.execute(text(f"PRAGMA table_info('{name}')")).mappings()]
+    unknown = set(live) - set(table.c.keys())
+    if unknown:
+        raise RuntimeError(f'{name}: columns {sorted(unknown)} are not in the model, rebuild aborted')
+    saved = conn.execute(text("SELECT sql FROM sqlite_master WHERE tbl_name = :t AND type IN ('index', 'trigger') "
+                              'AND sql IS NOT NULL'), {'t': name}).scalars().all()
+    quoted = conn.dialect.identifier_preparer.format_table(table)
+    ddl = str(CreateTable(table).compile(dialect=conn.dialect)).replace(quoted, f'"{name}_rebuild"', 1)
+    columns = ', '.join(f'"{c}"' for c in live)
+    conn.execute(text(ddl))
+    conn.execute(text(f'INSERT INTO "{name}_rebuild" ({columns}) SELECT {columns} FROM {quoted}'))
+    conn.execute(text(f'DROP TABLE {quoted}'))
+    conn.execute(text(f'ALTER TABLE "{name}_rebuild" RENAME TO {quoted}'))
+    for sql in saved:
+        conn.execute(text(sql))
+
+
+def applied_versions(conn):
+    conn.execute(text(SCHEMA_MIGRATIONS_DDL))
+    return {r[0] for r in conn.execute(text('SELECT version FROM schema_migrations'))}
+
+
+def pending_migrations(engine=None):
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    return [(v, name) for v, name, _ in MIGRATIONS if v not in done]
+
+
+def migrate(engine=None, target=None, logger=None):
+    """Apply pending migrations in version order. Returns the list of (version, name) applied."""
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        done = applied_versions(conn)
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        started = time.perf_counter()
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(text('INSERT INTO schema_migrations (version, name, applied_at, duration_ms) '
+                              'VALUES (:v, :n, :at, :ms)'),
+                         {'v': version, 'n': name, 'at': datetime.utcnow(),
+                          'ms': int((time.perf_counter() - started) * 1000)})
+        applied.append((version, name))
+        if logger:
+            logger.info('Migration %s (%s) applied', version, name)
+    return applied
+
+
+class Backfill:
+    """Fill `table` in id-ordered chunks with `update_sql` (bound to :lo and :hi, exclusive/inclusive).
+
+    `update_sql` may also be a function fn(conn, lo, hi) returning the number of rows changed.
+    """
+
+    def __init__(self, name, table, update_sql, chunk_size=1000, max_rows_per_second=None):
+        self.name = name
+        self.table = table
+        self.update_sql = update_sql if callable(update_sql) else text(update_sql)
+        self.chunk_size = chunk_size
+        self.max_rows_per_second = max_rows_per_second
+
+    def progress(self, conn):
+        conn.execute(text(BACKFILL_PROGRESS_DDL))
+        row = conn.execute(text('SELECT last_id, rows_done, completed_at FROM backfill_progress WHERE name = :n'),
+                           {'n': self.name}).first()
+        return (row[0], row[1], row[2]) if row else (0, 0, None)
+
+    def _chunk_end(self, conn, lo, size):
+        # id de la N-ième ligne après lo (ou la dernière) : borne haute de la tranche
+        hi = conn.execute(text(f'SELECT id FROM "{self.table}" WHERE id > :lo ORDER BY id LIMIT 1 OFFSET :off'),
+                          {'lo': lo, 'off': size - 1}).scalar()
+        if hi is None:
+            hi = conn.execute(text(f'SELECT MAX(id) FROM "{self.table}" WHERE id > :lo'), {'lo': lo}).scalar()
+        return hi
+
+    def run(self, engine=None, chunk_size=None, max_rows_per_second=None, max_seconds=None, logger=None):
+        """Process chunks until done or `max_seconds` elapse. Returns a progress report."""
+        engine = engine or db.engine
+        chunk_size = chunk_size or self.chunk_size
+        rate = max_rows_per_second if max_rows_per_second is not None else self.max_rows_per_second
+        started = time.perf_counter()
+        report = {'backfill': self.name, 'chunks': 0, 'rows': 0, 'done': False}
+        with engine.begin() as conn:
+            last_id, rows_done, completed_at = self.progress(conn)
+            if completed_at is None and rows_done == 0:
+                conn.execute(text('INSERT OR IGNORE INTO backfill_progress (name, last_id, rows_done, started_at) '
+                                  'VALUES (:n, 0, 0, :at)'), {'n': self.name, 'at': datetime.utcnow()})
+        if completed_at is not None:
+            report['done'] = True
+            return report
+        while max_seconds is None or time.perf_counter() - started < max_seconds:
+            chunk_started = time.perf_counter()
+            with engine.begin() as conn:
+                hi = self._chunk_end(conn, last_id, chunk_size)
+                now = datetime.utcnow()
+                if hi is None:
+                    conn.execute(text('UPDATE backfill_progress SET completed_at = :at, updated_at = :at '
+                                      'WHERE name = :n'), {'n': self.name, 'at': now})
+                    report['done'] = True
+                    break
+                if callable(self.update_sql):
+                    changed = self.update_sql(conn, last_id, hi)
+                else:
+                    changed = conn.execute(self.update_sql, {'lo': last_id, 'hi': hi}).rowcount
+                conn.execute(text('UPDATE backfill_progress SET last_id = :hi, rows_done = rows_done + :r, '
+                                  'updated_at = :at WHERE name = :n'),
+                             {'n': self.name, 'hi': hi, 'r': max(changed, 0), 'at': now})
+            last_id = hi
+            report['chunks'] += 1
+            report['rows'] += max(changed, 0)
+            if rate:
+                # Laisse respirer les écritures de l'application entre deux tranches
+                pause = chunk_size / float(rate) - (time.perf_counter() - chunk_started)
+                if pause > 0:
+                    time.sleep(pause)
+        report['last_id'] = last_id
+        report['duration_s'] = round(time.perf_counter() - started, 3)
+        if logger:
+            logger.info('Backfill %s: %s', self.name, report)
+        return report
+
+
+def register_backfill(backfill):
+    BACKFILLS[backfill.name] = backfill
+    return backfill
+
+
+def run_backfills(engine=None, max_seconds=None, max_rows_per_second=None, logger=None):
+    """Resume every registered backfill not completed yet, in registration order, within `max_seconds`."""
+    started = time.perf_counter()
+    reports = []
+    for backfill in BACKFILLS.values():
+        left = None if max_seconds is None else max_seconds - (time.perf_counter() - started)
+        if left is not None and left <= 0:
+            break
+        report = backfill.run(engine, max_rows_per_second=max_rows_per_second, max_seconds=left)
+        if report['chunks'] and logger:
+            logger.info('Backfill %s: %s', backfill.name, report)
+        reports.append(report)
+    return reports
+
+
+def backfill_status(engine=None):
+    engine = engine or db.engine
+    with engine.begin() as conn:
+        out = []
+        for name, bf in BACKFILLS.items():
+            last_id, rows_done, completed_at = bf.progress(conn)
+            out.append({'backfill': name, 'last_id': last_id, 'rows_done': rows_done,
+                        'completed_at': completed_at})
+        return out
+
+
+# --- Migrations ---------------------------------------------------------------
+
+@migration(1, 'baseline')
+def _baseline(conn):
+    db.metadata.create_all(conn)
+    # Colonnes ajoutées par les anciens ALTER TABLE de app.py (bases créées avant elles)
+    add_column(conn, 'transaction', 'provider', 'VARCHAR(20)')
+    add_column(conn, 'transaction', 'external_id', 'VARCHAR(120)')
+    add_column(conn, 'group', 'archived', 'BOOLEAN DEFAULT 0')
+    add_column(conn, 'membership', 'auto_pay', 'BOOLEAN DEFAULT 1')
+    add_column(conn, 'user', 'failed_attempts', 'INTEGER DEFAULT 0')
+    add_column(conn, 'user', 'lock_until', 'DATETIME')
+    add_column(conn, 'user', 'is_blocked', 'BOOLEAN DEFAULT 0')
+    add_column(conn, 'transaction', 'reason', 'TEXT')
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transaction_provider_external_id "
+                      "ON 'transaction' (provider, external_id)"))
+    conn.execute(text(BACKFILL_PROGRESS_DDL))
+
+
+@migration(2, 'hot_path_indexes')
+def _hot_path_indexes(conn):
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transaction_group_type_status "
+                      "ON 'transaction' (group_id, type, status)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transaction_user_date ON 'transaction' (user_id, date)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_membership_user ON membership (user_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_membership_group ON membership (group_id)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notification_user_date ON notification (user_id, date)"))
+
+
+# Versions de données lues par template_cache.py : chaque écriture incrémente la portée touchée
+DATA_VERSION_TRIGGERS = {
+    'dv_group_ins': "AFTER INSERT ON 'group' BEGIN {bump_groups} {bump_new_group} END",
+    'dv_group_upd': "AFTER UPDATE ON 'group' BEGIN {bump_groups} {bump_new_group} END",
+    'dv_group_del': "AFTER DELETE ON 'group' BEGIN {bump_groups} {bump_old_group} END",
+    'dv_transaction_ins': "AFTER INSERT ON 'transaction' BEGIN {bump_new_group_id} END",
+    'dv_transaction_upd': "AFTER UPDATE ON 'transaction' BEGIN {bump_old_group_id} {bump_new_group_id} END",
+    'dv_transaction_del': "AFTER DELETE ON 'transaction' BEGIN {bump_old_group_id} END",
+    'dv_membership_ins': "AFTER INSERT ON membership BEGIN {bump_new_group_id} END",
+    'dv_membership_del': "AFTER DELETE ON membership BEGIN {bump_old_group_id} END",
+    # Le nom du créateur est affiché sur les cartes de groupe
+    'dv_user_name': "AFTER UPDATE OF name ON 'user' BEGIN {bump_groups} {bump_created_groups} END",
+}
+_BUMP = ("INSERT INTO data_version (scope, version) {select} "
+         "ON CONFLICT(scope) DO UPDATE SET version = version + 1;")
+_BUMPS = {
+    'bump_groups': _BUMP.format(select="SELECT 'groups', 1 WHERE 1"),
+    'bump_new_group': _BUMP.format(select="SELECT 'group:' || NEW.id, 1 WHERE 1"),
+    'bump_old_group': _BUMP.format(select="SELECT 'group:' || OLD.id, 1 WHERE 1"),
+    'bump_new_group_id': _BUMP.format(select="SELECT 'group:' || NEW.group_id, 1 WHERE 1"),
+    'bump_old_group_id': _BUMP.format(select="SELECT 'group:' || OLD.group_id, 1 WHERE 1"),
+    'bump_created_groups': _BUMP.format(select="SELECT 'group:' || id, 1 FROM 'group' WHERE created_by = NEW.id"),
+}
+
+
+@migration(3, 'data_version')
+def _data_version(conn):
+    conn.execute(text('CREATE TABLE IF NOT EXISTS data_version ('
+                      ' scope VARCHAR(80) PRIMARY KEY,'
+                      ' version INTEGER NOT NULL DEFAULT 0)'))
+    for name, body in DATA_VERSION_TRIGGERS.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body.format(**_BUMPS)}'))
+
+
+# Portées lues par http_cache.py : 'global' (toute donnée affichée), 'users' (noms affichés)
+GLOBAL_VERSION_TABLES = ('transaction', 'membership', 'group', 'notification')
+_BUMPS['bump_global'] = _BUMP.format(select="SELECT 'global', 1 WHERE 1")
+_BUMPS['bump_users'] = _BUMP.format(select="SELECT 'users', 1 WHERE 1")
+
+
+def _global_version_triggers():
+    triggers = {}
+    for table in GLOBAL_VERSION_TABLES:
+        for op in ('INSERT', 'UPDATE', 'DELETE'):
+            triggers[f'dv_global_{table}_{op[:3].lower()}'] = f"AFTER {op} ON '{table}' BEGIN {{bump_global}} END"
+    triggers['dv_global_user_ins'] = "AFTER INSERT ON 'user' BEGIN {bump_global} END"
+    triggers['dv_global_user_del'] = "AFTER DELETE ON 'user' BEGIN {bump_global} {bump_users} END"
+    # Pas sur failed_attempts / lock_until : une connexion ne doit pas invalider tous les ETag
+    triggers['dv_global_user_upd'] = ("AFTER UPDATE OF name, email, role, is_blocked ON 'user' "
+                                      "BEGIN {bump_global} {bump_users} END")
+    return triggers
+
+
+@migration(4, 'data_version_global')
+def _data_version_global(conn):
+    for name, body in _global_version_triggers().items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body.format(**_BUMPS)}'))
+
+
+@migration(5, 'group_search')
+def _group_search(conn):
+    create_group_search_index(conn)
+
+
+register_backfill(Backfill('group_search', 'group', GROUP_INDEX_FILL_SQL))
+
+
+@migration(6, 'user_directory')
+def _user_directory(conn):
+    create_user_directory_index(conn)
+
+
+register_backfill(Backfill('user_directory', 'user', USER_INDEX_FILL_SQL))
+
+
+@migration(7, 'group_purge')
+def _group_purge(conn):
+    conn.execute(text(GROUP_PURGE_DDL))
+    # Les purges par tranches sélectionnent les notifications d'un groupe
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notification_group ON notification (group_id)"))
+
+
+@migration(8, 'archive')
+def _archive(conn):
+    # Dans le fichier attaché si ARCHIVE_DB_PATH est configuré (voir archive.py)
+    create_archive_tables(conn)
+
+
+@migration(9, 'notification_counter')
+def _notification_counter(conn):
+    create_notification_counter(conn)
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_notification_read_date ON notification (read, date)"))
+
+
+# Compteurs recalculés par tranches d'utilisateurs
+register_backfill(Backfill('notification_counter', 'user', COUNTER_FILL_SQL))
+
+
+@migration(10, 'fund_checkpoint')
+def _fund_checkpoint(conn):
+    create_fund_checkpoints(conn)
+    # Soldes à date : somme des transactions d'un groupe entre un point de contrôle et une date
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_transaction_group_date ON 'transaction' (group_id, date)"))
+
+
+@migration(11, 'group_fund')
+def _group_fund(conn):
+    create_group_fund(conn)
+
+
+# Après l'archivage (migration 8) : les totaux archivés comptent dans le fonds
+register_backfill(Backfill('group_fund', 'group', FUND_FILL_SQL))
+
+
+@migration(12, 'aid_screening')
+def _aid_screening(conn):
+    create_aid_screening(conn)
+    # Motifs affichés dans la liste /admin : une nouvelle décision change son ETag
+    for op in ('INSERT', 'UPDATE'):
+        name = f'dv_global_aid_screening_{op[:3].lower()}'
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f"CREATE TRIGGER {name} AFTER {op} ON aid_screening BEGIN {_BUMPS['bump_global']} END"))
+
+
+@migration(13, 'membership_streak')
+def _membership_streak(conn):
+    create_streaks(conn)
+    # Ligne recalculée par refresh_streaks() : les statistiques du groupe changent d'ETag
+    conn.execute(text('DROP TRIGGER IF EXISTS dv_membership_streak_refresh'))
+    conn.execute(text('CREATE TRIGGER dv_membership_streak_refresh AFTER UPDATE OF stale ON membership_streak '
+                      f"WHEN OLD.stale = 1 AND NEW.stale = 0 BEGIN {_BUMPS['bump_global']} "
+                      f"{_BUMPS['bump_new_group_id']} END"))
+
+
+register_backfill(Backfill('membership_streak', 'membership', fill_streaks, chunk_size=500))
+
+
+@migration(14, 'autoincrement_ids')
+def _autoincrement_ids(conn):
+    # Sans AUTOINCREMENT, SQLite rend l'id d'une ligne archivée puis supprimée à la prochaine insertion :
+    # la nouvelle ligne entrerait en collision avec l'archive (voir archive.py)
+    for source, model in ARCHIVED_MODELS.items():
+        sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :t"),
+                           {'t': source}).scalar()
+        if 'AUTOINCREMENT' not in sql.upper():
+            rebuild_table(conn, model.__table__)
+    reserve_archived_ids(conn)
@@ -1,7 +1,8 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
+from db_routing import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -33,6 +34,10 @@ class Membership(db.Model):
     auto_pay = db.Column(db.Boolean, nullable=False, default=True)
     user = db.relationship('User', backref='memberships')
     group = db.relationship('Group', backref='memberships')
+    __table_args__ = (
+        db.Index('ix_membership_user', 'user_id'),
+        db.Index('ix_membership_group', 'group_id'),
+    )
 
 class Transaction(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -47,6 +52,14 @@ class Transaction(db.Model):
     external_id = db.Column(db.String(120), nullable=True)
     group = db.relationship('Group', backref='transactions')
     user = db.relationship('User', backref='transactions')
+    __table_args__ = (
+        db.Index('ix_transaction_provider_external_id', 'provider', 'external_id'),
+        db.Index('ix_transaction_group_type_status', 'group_id', 'type', 'status'),
+        db.Index('ix_transaction_user_date', 'user_id', 'date'),
+        db.Index('ix_transaction_group_date', 'group_id', 'date'),
+        # Ids jamais réutilisés : une ligne archivée garde le sien (voir archive.py, migration 14)
+        {'sqlite_autoincrement': True},
+    )
 
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -58,16 +71,73 @@ class Notification(db.Model):
     read = db.Column(db.Boolean, nullable=False, default=False)
     user = db.relationship('User', backref='notifications')
     group = db.relationship('Group', backref='notifications')
+    __table_args__ = (
+        db.Index('ix_notification_user_date', 'user_id', 'date'),
+        db.Index('ix_notification_group', 'group_id'),
+        db.Index('ix_notification_read_date', 'read', 'date'),
+        {'sqlite_autoincrement': True},
+    )
 
-def group_balance(group_id):
-    from sqlalchemy import func
+class WebhookEvent(db.Model):
+    """Inbox of provider webhook deliveries, deduplicated on (provider, event_id)."""
+    __tablename__ = 'webhook_event'
+    id = db.Column(db.Integer, primary_key=True)
+    provider = db.Column(db.String(20), nullable=False)
+    event_id = db.Column(db.String(120), nullable=False)
+    type = db.Column(db.String(80), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='received')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(255), nullable=True)
+    __table_args__ = (
+        db.UniqueConstraint('provider', 'event_id', name='uq_webhook_event_provider_event'),
+        db.Index('ix_webhook_event_pending', 'processed_at', 'id'),
+    )
+
+def notify_user(user_id, type_, message, group_id=None, commit=True):
+    n = Notification(user_id=user_id, group_id=group_id, type=type_, message=message)
+    db.session.add(n)
+    if commit:
+        db.session.commit()
+
+def notify_admins(type_, message, group_id=None, commit=True, admin_ids=None):
+    if admin_ids is None:
+        admin_ids = [a.id for a in User.query.filter_by(role='admin').all()]
+    for admin_id in admin_ids:
+        n = Notification(user_id=admin_id, group_id=group_id, type=type_, message=message)
+        db.session.add(n)
+    if commit:
+        db.session.commit()
+
+def commission_rate():
     import os
-    rate = 0.02
     try:
-        rate = float(os.environ.get('MYTAKAFUL_COMMISSION_RATE', '0.02'))
+        return float(os.environ.get('MYTAKAFUL_COMMISSION_RATE', '0.02'))
     except Exception:
-        rate = 0.02
-    cotisations = db.session.query(func.coalesce(func.sum(Transaction.amount), 0)).filter(Transaction.group_id == group_id, Transaction.status == 'approved', Transaction.type == 'cotisation').scalar() or 0
-    aides = db.session.query(func.coalesce(func.sum(Transaction.amount), 0)).filter(Transaction.group_id == group_id, Transaction.status == 'approved', Transaction.type == 'aide').scalar() or 0
-    commission = int(cotisations * rate)
-    return int(cotisations - aides - commission)
+        return 0.02
+
+def balance_from_totals(cotisations, aides):
+    """Group fund from its approved cotisation and aid totals, net of the commission."""
+    cotisations = cotisations or 0
+    return int(cotisations - (aides or 0) - int(cotisations * commission_rate()))
+
+def group_balance(group_id):
+    """Group fund from its maintained group_fund row (see group_funds.py)."""
+    from sqlalchemy import text
+    row = db.session.execute(text('SELECT cotisations, aides FROM group_fund WHERE id = :gid'), {'gid': group_id}).first()
+    return balance_from_totals(*row) if row else 0
+
+def group_balances(group_ids):
+    """group_balance() for several groups in one query: {group_id: balance}."""
+    from sqlalchemy import bindparam, text
+    group_ids = list(group_ids)
+    balances = dict.fromkeys(group_ids, 0)
+    if not group_ids:
+        return balances
+    rows = db.session.execute(text('SELECT id, cotisations, aides FROM group_fund WHERE id IN :ids')
+                              .bindparams(bindparam('ids', expanding=True)), {'ids': group_ids})
+    for gid, cotisations, aides in rows:
+        balances[gid] = balance_from_totals(cotisations, aides)
+    return balances
@@ -0,0 +1,128 @@
+"""
+Notifications : compteur de non-lues, marquage en masse, rétention.
+- notification_counter (id = utilisateur) : non-lues et id de la dernière notification, tenus à jour
+  par des triggers SQLite à l'insertion, au passage lu / non lu et à la suppression (même hors ORM)
+- Le badge et le flux SSE lisent cette seule ligne au lieu de parcourir les notifications
+- mark_read() : un UPDATE pour une liste d'ids ou pour toutes les non-lues d'un utilisateur
+- Rétention : notifications lues de plus de NOTIFICATION_RETENTION_DAYS jours supprimées par tranches,
+  dans la table courante comme dans l'archive (voir archive.py) ; les non-lues sont toujours gardées
+
+Usage :
+    flask --app app prune-notifications [--chunk-size 1000 --max-seconds 60]
+"""
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import DateTime, bindparam, text
+
+from archive import archive_schema, qualified_name
+from models import db
+
+COUNTER_DDL = (
+    'CREATE TABLE IF NOT EXISTS notification_counter ('
+    ' id INTEGER PRIMARY KEY,'
+    ' unread INTEGER NOT NULL DEFAULT 0,'
+    ' last_id INTEGER NOT NULL DEFAULT 0)'
+)
+COUNTER_TRIGGERS = {
+    'nc_notification_ins': (
+        'AFTER INSERT ON notification BEGIN '
+        'INSERT INTO notification_counter (id, unread, last_id) '
+        'VALUES (NEW.user_id, CASE WHEN NEW.read THEN 0 ELSE 1 END, NEW.id) '
+        'ON CONFLICT (id) DO UPDATE SET unread = unread + excluded.unread, '
+        'last_id = MAX(last_id, excluded.last_id); END'),
+    'nc_notification_upd': (
+        'AFTER UPDATE OF read ON notification WHEN OLD.read IS NOT NEW.read BEGIN '
+        'UPDATE notification_counter SET unread = MAX(0, unread + CASE WHEN NEW.read THEN -1 ELSE 1 END) '
+        'WHERE id = NEW.user_id; END'),
+    'nc_notification_del': (
+        'AFTER DELETE ON notification WHEN NOT OLD.read BEGIN '
+        'UPDATE notification_counter SET unread = MAX(0, unread - 1) WHERE id = OLD.user_id; END'),
+}
+
+
+def _config(name, default):
+    try:
+        return current_app.config.get(name, default)
+    except RuntimeError:
+        return default
+
+
+# Backfill par tranches d'utilisateurs (voir migrations.py) : recompte complet de chaque ligne, les
+# triggers ajoutent ensuite les écritures postérieures
+COUNTER_FILL_SQL = (
+    'INSERT OR REPLACE INTO notification_counter (id, unread, last_id) '
+    'SELECT user_id, SUM(CASE WHEN read THEN 0 ELSE 1 END), MAX(id) FROM notification '
+    'WHERE user_id > :lo AND user_id <= :hi GROUP BY user_id'
+)
+
+
+def create_counter(conn):
+    """Create notification_counter and its triggers; the counts are filled by COUNTER_FILL_SQL."""
+    conn.execute(text(COUNTER_DDL))
+    for name, body in COUNTER_TRIGGERS.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body}'))
+
+
+def counter_state(user_id):
+    """(unread, last notification id) of a user, from the counter row."""
+    row = db.session.execute(text('SELECT unread, last_id FROM notification_counter WHERE id = :uid'),
+                             {'uid': user_id}).first()
+    return (row[0], row[1]) if row else (0, 0)
+
+
+def unread_count(user_id):
+    return counter_state(user_id)[0]
+
+
+def mark_read(user_id, ids=None):
+    """Mark the user's notifications `ids` (all unread ones when None) as read. Returns the unread count."""
+    params = {'uid': user_id}
+    sql = 'UPDATE notification SET read = 1 WHERE user_id = :uid AND read = 0'
+    if ids is not None:
+        ids = [int(i) for i in ids]
+        if not ids:
+            return unread_count(user_id)
+        sql += ' AND id IN :ids'
+        params['ids'] = ids
+    stmt = text(sql)
+    if ids is not None:
+        stmt = stmt.bindparams(bindparam('ids', expanding=True))
+    db.session.execute(stmt, params)
+    db.session.commit()
+    return unread_count(user_id)
+
+
+def new_since(user_id, after_id, limit=5):
+    """The user's notifications with id > after_id, newest first."""
+    rows = db.session.execute(text(
+        'SELECT id, message, date FROM notification WHERE user_id = :uid AND id > :after '
+        'ORDER BY id DESC LIMIT :n'), {'uid': user_id, 'after': after_id, 'n': limit}).all()
+    return [{'id': r[0], 'message': r[1], 'date': r[2]} for r in rows]
+
+
+def prune_read(engine=None, chunk_size=None, max_seconds=None, now=None, logger=None):
+    """Delete read notifications older than the retention, chunk by chunk. Returns a progress report."""
+    engine = engine or db.engine
+    chunk_size = chunk_size or _config('NOTIFICATION_PRUNE_CHUNK_SIZE', 1000)
+    cutoff = (now or datetime.utcnow()) - timedelta(days=_config('NOTIFICATION_RETENTION_DAYS', 365))
+    started = time.perf_counter()
+    report = {'rows': 0, 'chunks': 0, 'done': False}
+    tables = ['notification', qualified_name('notification', archive_schema())]
+    while tables and (max_seconds is None or time.perf_counter() - started < max_seconds):
+        with engine.begin() as conn:
+            deleted = conn.execute(text(
+                f'DELETE FROM {tables[0]} WHERE id IN (SELECT id FROM {tables[0]} '
+                'WHERE read = 1 AND date < :cutoff LIMIT :n)').bindparams(bindparam('cutoff', type_=DateTime)),
+                {'cutoff': cutoff, 'n': chunk_size}).rowcount
+        report['rows'] += deleted
+        report['chunks'] += 1
+        if deleted < chunk_size:
+            tables.pop(0)
+    report['done'] = not tables
+    report['duration_s'] = round(time.perf_counter() - started, 3)
+    if logger and report['rows']:
+        logger.info('Notification retention: %s', report)
+    return report
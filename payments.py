@@ -0,0 +1,44 @@
+"""
+Confirmation des paiements fournisseurs (Stripe, PayPal).
+- Recherche des transactions par (provider, external_id), indexée
+- Passage pending -> approved/rejected par mise à jour conditionnelle : idempotent
+- Les notifications sont ajoutées à la session ; l'appelant valide (commit)
+"""
+from sqlalchemy.orm.attributes import set_committed_value
+
+from models import Transaction, notify_user, notify_admins
+
+PROVIDER_LABELS = {'stripe': 'Stripe', 'paypal': 'PayPal'}
+
+
+def find_provider_transactions(provider, external_ids):
+    """Map external_id -> Transaction for one provider in a single indexed query."""
+    ids = list({e for e in external_ids if e})
+    if not ids:
+        return {}
+    rows = Transaction.query.filter(Transaction.provider == provider, Transaction.external_id.in_(ids)).all()
+    return {t.external_id: t for t in rows}
+
+
+def settle_transaction(t, status, admin_ids=None):
+    """Move a pending provider transaction to `status`.
+
+    Returns True only for the caller that actually performed the transition,
+    so concurrent redirects, webhooks and reconciliation never notify twice.
+    """
+    changed = Transaction.query.filter(
+        Transaction.id == t.id, Transaction.status == 'pending'
+    ).update({'status': status}, synchronize_session=False)
+    if not changed:
+        return False
+    set_committed_value(t, 'status', status)
+    label = PROVIDER_LABELS.get(t.provider, t.provider or '')
+    if status == 'approved':
+        notify_user(t.user_id, 'contribution_paid', f"Cotisation de {t.amount} MAD payée ({label})",
+                    group_id=t.group_id, commit=False)
+        notify_admins('contribution_paid', f"Cotisation {label} confirmée pour utilisateur #{t.user_id}",
+                      group_id=t.group_id, commit=False, admin_ids=admin_ids)
+    else:
+        notify_user(t.user_id, 'contribution_failed', f"Paiement de {t.amount} MAD non abouti ({label})",
+                    group_id=t.group_id, commit=False)
+    return True
@@ -0,0 +1,158 @@
+"""
+Clients HTTP des fournisseurs de paiement (PayPal, Stripe).
+- Une session requests partagée par fournisseur : connexions keep-alive en pool
+- Jeton OAuth PayPal mis en cache jusqu'à peu avant expires_in, rafraîchi une seule fois à la fois
+- Délais de connexion et de lecture imposés sur chaque appel
+"""
+import threading
+import time
+
+
+class ProviderError(Exception):
+    """Transport-level failure talking to a payment provider (timeout, DNS, reset...)."""
+
+
+def _new_session(pool_size):
+    import requests
+    from requests.adapters import HTTPAdapter
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=pool_size, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class PayPalClient:
+    """PayPal REST client with a pooled session and a cached client_credentials token."""
+
+    def __init__(self, client_id, client_secret, base_url, connect_timeout=3.05, read_timeout=15.0,
+                 pool_size=10, refresh_margin=60):
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.pool_size = pool_size
+        self.refresh_margin = refresh_margin
+        self._session = None
+        self._session_lock = threading.Lock()
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return bool(self.client_id and self.client_secret)
+
+    @property
+    def session(self):
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = _new_session(self.pool_size)
+        return self._session
+
+    def _send(self, method, path, **kwargs):
+        import requests
+        kwargs.setdefault('timeout', self.timeout)
+        try:
+            return self.session.request(method, self.base_url + path, **kwargs)
+        except requests.RequestException as exc:
+            raise ProviderError(f'PayPal {method} {path}: {exc}') from exc
+
+    def _cached_token(self):
+        if self._token and time.monotonic() < self._token_expires_at:
+            return self._token
+        return None
+
+    def access_token(self):
+        """Return a valid access token, fetching a new one only when the cached one is near expiry."""
+        if not self.configured:
+            return None
+        token = self._cached_token()
+        if token:
+            return token
+        with self._token_lock:
+            # Un autre thread a pu rafraîchir le jeton pendant l'attente du verrou
+            token = self._cached_token()
+            if token:
+                return token
+            r = self._send('POST', '/v1/oauth2/token', auth=(self.client_id, self.client_secret),
+                           data={'grant_type': 'client_credentials'})
+            if r.status_code != 200:
+                return None
+            payload = r.json()
+            expires_in = int(payload.get('expires_in', 0) or 0)
+            self._token = payload.get('access_token')
+            self._token_expires_at = time.monotonic() + max(expires_in - self.refresh_margin, 0)
+            return self._token
+
+    def invalidate_token(self, token):
+        """Drop `token` from the cache unless another thread already replaced it."""
+        with self._token_lock:
+            if self._token == token:
+                self._token = None
+                self._token_expires_at = 0.0
+
+    def request(self, method, path, **kwargs):
+        """Authenticated call; a 401 invalidates the cached token and retries once."""
+        extra_headers = kwargs.pop('headers', None) or {}
+        for attempt in range(2):
+            token = self.access_token()
+            if not token:
+                return None
+            headers = dict(extra_headers, Authorization=f'Bearer {token}')
+            r = self._send(method, path, headers=headers, **kwargs)
+            if r.status_code != 401 or attempt:
+                return r
+            self.invalidate_token(token)
+        return r
+
+    def create_order(self, body):
+        return self.request('POST', '/v2/checkout/orders', json=body)
+
+    def capture_order(self, order_id):
+        return self.request('POST', f'/v2/checkout/orders/{order_id}/capture',
+                            headers={'Content-Type': 'application/json'})
+
+    def get_order(self, order_id):
+        return self.request('GET', f'/v2/checkout/orders/{order_id}')
+
+
+_paypal_client = None
+_stripe_configured = False
+_lock = threading.Lock()
+
+
+def get_paypal_client(config):
+    """Process-wide PayPal client built from the Flask config on first use."""
+    global _paypal_client
+    if _paypal_client is None:
+        with _lock:
+            if _paypal_client is None:
+                _paypal_client = PayPalClient(
+                    config.get('PAYPAL_CLIENT_ID'),
+                    config.get('PAYPAL_CLIENT_SECRET'),
+                    config.get('PAYPAL_API_BASE'),
+                    connect_timeout=config.get('PROVIDER_CONNECT_TIMEOUT', 3.05),
+                    read_timeout=config.get('PROVIDER_READ_TIMEOUT', 15.0),
+                    pool_size=config.get('PROVIDER_POOL_SIZE', 10),
+                    refresh_margin=config.get('PAYPAL_TOKEN_REFRESH_MARGIN', 60),
+                )
+    return _paypal_client
+
+
+def get_stripe(config):
+    """Return the stripe module configured once with key, base URL, timeouts and a pooled session."""
+    global _stripe_configured
+    import stripe
+    if not _stripe_configured:
+        with _lock:
+            if not _stripe_configured:
+                stripe.api_key = config.get('STRIPE_SECRET_KEY')
+                stripe.api_base = config.get('STRIPE_API_BASE').rstrip('/')
+                stripe.default_http_client = stripe.RequestsClient(
+                    timeout=(config.get('PROVIDER_CONNECT_TIMEOUT', 3.05), config.get('PROVIDER_READ_TIMEOUT', 15.0)),
+                    session=_new_session(config.get('PROVIDER_POOL_SIZE', 10)),
+                )
+                _stripe_configured = True
+    return stripe
@@ -0,0 +1,144 @@
+"""
+Réconciliation des cotisations en attente chez Stripe et PayPal.
+- Parcourt par pages (pagination par clé sur id) les transactions pending d'un fournisseur
+- Interroge le fournisseur en parallèle via un pool de threads borné, sans accès à la base
+- Applique les changements d'état et les notifications par lots : un commit par page
+"""
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from models import db, Transaction, User
+from payments import settle_transaction
+from providers import ProviderError, get_paypal_client, get_stripe
+
+RECONCILED_PROVIDERS = ('stripe', 'paypal')
+
+
+def _check_stripe(stripe, session_id):
+    try:
+        obj = stripe.checkout.Session.retrieve(session_id)
+    except stripe.InvalidRequestError as exc:
+        if getattr(exc, 'http_status', None) == 404:
+            return 'rejected'
+        raise
+    if obj.status == 'complete' and obj.payment_status in ('paid', 'no_payment_required'):
+        return 'approved'
+    if obj.status == 'expired':
+        return 'rejected'
+    return None
+
+
+def _check_paypal(client, order_id, abandoned):
+    r = client.get_order(order_id)
+    if r is None:
+        raise ProviderError('PayPal not configured')
+    if r.status_code == 404:
+        return 'rejected'
+    if r.status_code != 200:
+        raise ProviderError(f'PayPal order lookup returned {r.status_code}')
+    status = r.json().get('status')
+    if status == 'COMPLETED':
+        return 'approved'
+    if status == 'APPROVED':
+        # Le payeur a validé mais n'est jamais revenu sur /pay/paypal/capture
+        captured = client.capture_order(order_id)
+        return 'approved' if captured is not None and captured.status_code == 201 else None
+    if status == 'VOIDED' or abandoned:
+        return 'rejected'
+    return None
+
+
+def reconcile_pending(config, page_size=200, max_workers=8, min_age_minutes=15, abandon_after_hours=72,
+                      max_pages=None, logger=None):
+    """Re-check pending provider cotisations and settle the ones the provider has decided.
+
+    Returns a per-run report with counts and provider-call latencies.
+    """
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    cutoff = now - timedelta(minutes=min_age_minutes)
+    abandon_before = now - timedelta(hours=abandon_after_hours)
+    stripe = get_stripe(config) if config.get('STRIPE_SECRET_KEY') else None
+    paypal = get_paypal_client(config)
+    admin_ids = [a.id for a in User.query.filter_by(role='admin').all()]
+
+    report = {'pages': 0, 'checked': 0, 'approved': 0, 'rejected': 0, 'unchanged': 0,
+              'skipped': 0, 'errors': 0}
+    latencies = []
+
+    def check(tx):
+        t0 = time.perf_counter()
+        try:
+            if tx['provider'] == 'stripe':
+                outcome = _check_stripe(stripe, tx['external_id'])
+            else:
+                outcome = _check_paypal(paypal, tx['external_id'], tx['date'] < abandon_before)
+            return tx['id'], outcome, None, time.perf_counter() - t0
+        except Exception as exc:
+            return tx['id'], None, exc, time.perf_counter() - t0
+
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while max_pages is None or report['pages'] < max_pages:
+            page = (Transaction.query
+                    .filter(Transaction.status == 'pending',
+                            Transaction.provider.in_(RECONCILED_PROVIDERS),
+                            Transaction.external_id.isnot(None),
+                            Transaction.date <= cutoff,
+                            Transaction.id > last_id)
+                    .order_by(Transaction.id).limit(page_size).all())
+            if not page:
+                break
+            report['pages'] += 1
+            last_id = page[-1].id
+            by_id = {t.id: t for t in page}
+            todo = []
+            for t in page:
+                if (t.provider == 'stripe' and stripe is None) or (t.provider == 'paypal' and not paypal.configured):
+                    report['skipped'] += 1
+                    continue
+                todo.append({'id': t.id, 'provider': t.provider, 'external_id': t.external_id, 'date': t.date})
+            # Les threads ne font que des appels HTTP ; la session SQLAlchemy reste dans ce thread
+            for tx_id, outcome, error, elapsed in pool.map(check, todo):
+                report['checked'] += 1
+                latencies.append(elapsed * 1000.0)
+                if error is not None:
+                    report['errors'] += 1
+                    if logger:
+                        logger.warning('Reconciliation of transaction #%s failed: %s', tx_id, error)
+                elif outcome and settle_transaction(by_id[tx_id], outcome, admin_ids=admin_ids):
+                    report[outcome] += 1
+                else:
+                    report['unchanged'] += 1
+            db.session.commit()
+            if len(page) < page_size:
+                break
+
+    report['duration_s'] = round(time.perf_counter() - started, 3)
+    if latencies:
+        ordered = sorted(latencies)
+        report['provider_latency_ms'] = {
+            'median': round(statistics.median(ordered), 1),
+            'p95': round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 1),
+            'max': round(ordered[-1], 1),
+        }
+    if logger:
+        logger.info('Reconciliation run: %s', report)
+    return report
+
+
+def run_reconciliation():
+    """reconcile_pending with the current app's RECONCILE_* settings."""
+    config = current_app.config
+    return reconcile_pending(
+        config,
+        page_size=config.get('RECONCILE_PAGE_SIZE', 200),
+        max_workers=config.get('RECONCILE_MAX_WORKERS', 8),
+        min_age_minutes=config.get('RECONCILE_MIN_AGE_MINUTES', 15),
+        abandon_after_hours=config.get('RECONCILE_ABANDON_AFTER_HOURS', 72),
+        logger=current_app.logger,
+    )
@@ -0,0 +1,410 @@
+"""
+Réplication par journal (log shipping) de la base SQLite.
+- Des triggers sur la base principale copient chaque ligne modifiée (transaction, membership, group,
+  user, notification et leurs archives) dans change_log, dans la même transaction que l'écriture
+- Un suiveur initialise chaque réplica par l'API de sauvegarde SQLite, puis y rejoue change_log par lots
+- Les tables dérivées (group_fund, membership_streak, ...) arrivent par le journal : leurs triggers sont
+  désactivés sur le réplica et recréés à la promotion
+- Retard (changements et secondes) mesuré par suiveur ; le journal est purgé jusqu'au réplica le plus en retard
+
+Usage :
+    python replication.py follow --replica /srv/replica.db [--replica /srv/standby.db]
+    python replication.py status
+    python replication.py promote --replica /srv/standby.db
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import time
+
+# Archives (voir archive.py) : répliquées quand elles sont dans la base principale ; un fichier
+# d'archive attaché est partagé tel quel par la base principale et les réplicas
+REPLICATED_TABLES = ('transaction', 'membership', 'group', 'user', 'notification',
+                     'transaction_archive', 'notification_archive', 'transaction_archive_totals',
+                     'notification_counter', 'fund_checkpoint', 'group_fund',
+                     'aid_screening', 'membership_streak')
+TRIGGER_PREFIX = 'repl_'
+# Triggers qui tiennent les tables dérivées (fonds, compteurs, points de contrôle, séries, décisions) :
+# ces tables sont répliquées telles quelles, un réplica ne doit pas les recalculer en rejouant le journal.
+# Mis de côté dans replica_trigger, ils sont recréés par promote()
+DERIVED_TRIGGER_PREFIXES = ('gf_', 'nc_', 'fc_', 'ms_', 'as_')
+NOW_SQL = "((julianday('now') - 2440587.5) * 86400.0)"
+
+logger = logging.getLogger('mytakaful.replication')
+
+CHANGE_LOG_DDL = (
+    'CREATE TABLE IF NOT EXISTS change_log ('
+    ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+    ' tbl TEXT NOT NULL,'
+    ' op TEXT NOT NULL,'
+    ' row_id INTEGER NOT NULL,'
+    ' data TEXT,'
+    ' changed_at REAL NOT NULL)'
+)
+FOLLOWER_DDL = (
+    'CREATE TABLE IF NOT EXISTS replication_follower ('
+    ' name TEXT PRIMARY KEY,'
+    ' last_change_id INTEGER NOT NULL,'
+    ' lag_seconds REAL,'
+    ' updated_at REAL NOT NULL)'
+)
+REPLICA_TRIGGER_DDL = 'CREATE TABLE IF NOT EXISTS replica_trigger (name TEXT PRIMARY KEY, sql TEXT NOT NULL)'
+REPLICA_STATE_DDL = (
+    'CREATE TABLE IF NOT EXISTS replica_state ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 1),'
+    ' last_change_id INTEGER NOT NULL,'
+    ' applied_at REAL NOT NULL)'
+)
+
+
+def sqlite_path(uri):
+    """File path of a sqlite:/// URI (None for other databases or in-memory)."""
+    if not uri.startswith('sqlite:///'):
+        return None
+    path = uri[len('sqlite:///'):].split('?', 1)[0]
+    return None if path in ('', ':memory:') else path
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _columns(conn, table):
+    return [r[1] for r in conn.execute(f'PRAGMA main.table_info({_quote(table)})')]
+
+
+def _capture_triggers(conn):
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE ?", (TRIGGER_PREFIX + '%',))]
+
+
+def drop_capture(conn):
+    for name in _capture_triggers(conn):
+        conn.execute(f'DROP TRIGGER IF EXISTS {_quote(name)}')
+
+
+def _derived_triggers(conn):
+    return [(name, sql) for name, sql in conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")
+            if name.startswith(DERIVED_TRIGGER_PREFIXES)]
+
+
+def park_derived_triggers(replica, triggers):
+    """On a replica: keep `triggers` (name, sql) in replica_trigger and drop them from the schema."""
+    replica.execute(REPLICA_TRIGGER_DDL)
+    names = [name for name, _ in triggers]
+    replica.execute(f'DELETE FROM replica_trigger WHERE name NOT IN ({", ".join("?" for _ in names)})', names)
+    for name, sql in triggers:
+        replica.execute('INSERT OR REPLACE INTO replica_trigger (name, sql) VALUES (?, ?)', (name, sql))
+    for name, _ in _derived_triggers(replica):
+        replica.execute(f'DROP TRIGGER IF EXISTS {_quote(name)}')
+
+
+def restore_derived_triggers(conn):
+    """Recreate the triggers parked by park_derived_triggers() (replica being promoted)."""
+    conn.execute(REPLICA_TRIGGER_DDL)
+    for name, sql in conn.execute('SELECT name, sql FROM replica_trigger').fetchall():
+        conn.execute(f'DROP TRIGGER IF EXISTS {_quote(name)}')
+        conn.execute(sql)
+    conn.execute('DROP TABLE replica_trigger')
+
+
+def install_capture(conn, tables=REPLICATED_TABLES):
+    """(Re)create the change-capture triggers; call after every schema change."""
+    conn.execute(CHANGE_LOG_DDL)
+    conn.execute(FOLLOWER_DDL)
+    drop_capture(conn)
+    for table in tables:
+        cols = _columns(conn, table)
+        if not cols:
+            continue
+        q = _quote(table)
+        row = 'json_object(' + ', '.join(f"'{c}', NEW.{_quote(c)}" for c in cols) + ')'
+        for op, event, ref, data in (('I', 'INSERT', 'NEW', row), ('U', 'UPDATE', 'NEW', row),
+                                     ('D', 'DELETE', 'OLD', 'NULL')):
+            conn.execute(
+                f'CREATE TRIGGER {_quote(TRIGGER_PREFIX + table + "_" + op.lower())} AFTER {event} ON {q} '
+                f'BEGIN INSERT INTO change_log (tbl, op, row_id, data, changed_at) '
+                f"VALUES ('{table}', '{op}', {ref}.id, {data}, {NOW_SQL}); END"
+            )
+
+
+def prune_change_log(conn):
+    """Delete log entries every registered follower has applied. Returns the number deleted."""
+    row = conn.execute('SELECT MIN(last_change_id) FROM replication_follower').fetchone()
+    if not row or row[0] is None:
+        return 0
+    return conn.execute('DELETE FROM change_log WHERE id <= ?', (row[0],)).rowcount
+
+
+def _head(conn):
+    """Last change id ever logged (the log may have been pruned empty)."""
+    return conn.execute("SELECT COALESCE((SELECT MAX(id) FROM change_log), "
+                        "(SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)").fetchone()[0]
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute('PRAGMA busy_timeout=30000')
+    return conn
+
+
+class ReplicaFollower:
+    """Keeps one replica file up to date with the primary's change_log."""
+
+    def __init__(self, primary_path, replica_path, name=None, batch_size=500):
+        self.primary_path = primary_path
+        self.replica_path = replica_path
+        self.name = name or os.path.abspath(replica_path)
+        self.batch_size = batch_size
+        self._primary = None
+        self._replica = None
+        self._schema_version = None
+
+    def open(self):
+        self._primary = _connect(self.primary_path)
+        self._primary.execute(CHANGE_LOG_DDL)
+        self._primary.execute(FOLLOWER_DDL)
+        if not self._is_initialised():
+            self.snapshot()
+        self._replica = _connect(self.replica_path)
+        self._replica.execute('PRAGMA journal_mode=WAL')
+        self._replica.execute('PRAGMA synchronous=NORMAL')
+        return self
+
+    def close(self):
+        for conn in (self._primary, self._replica):
+            if conn is not None:
+                conn.close()
+        self._primary = self._replica = None
+
+    def _is_initialised(self):
+        if not os.path.exists(self.replica_path):
+            return False
+        conn = sqlite3.connect(self.replica_path)
+        try:
+            return conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'replica_state'").fetchone() is not None
+        finally:
+            conn.close()
+
+    def snapshot(self):
+        """Copy a consistent image of the primary and record the change_log position it contains."""
+        tmp = self.replica_path + '.snapshot'
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        target = sqlite3.connect(tmp, isolation_level=None)
+        try:
+            self._primary.backup(target)
+            drop_capture(target)
+            park_derived_triggers(target, _derived_triggers(target))
+            position = _head(target)
+            target.execute('DELETE FROM change_log')
+            target.execute('DROP TABLE IF EXISTS replication_follower')
+            target.execute(REPLICA_STATE_DDL)
+            target.execute('INSERT OR REPLACE INTO replica_state (id, last_change_id, applied_at) VALUES (1, ?, ?)',
+                           (position, time.time()))
+            target.execute('PRAGMA journal_mode=DELETE')
+        finally:
+            target.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.replica_path + suffix):
+                os.remove(self.replica_path + suffix)
+        os.replace(tmp, self.replica_path)
+        self._register(position, 0.0)
+        logger.info('Replica %s initialised from snapshot at change %s', self.name, position)
+        return position
+
+    def position(self):
+        return self._replica.execute('SELECT last_change_id FROM replica_state WHERE id = 1').fetchone()[0]
+
+    def _register(self, position, lag_seconds):
+        self._primary.execute(
+            'INSERT INTO replication_follower (name, last_change_id, lag_seconds, updated_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET last_change_id = excluded.last_change_id, '
+            'lag_seconds = excluded.lag_seconds, updated_at = excluded.updated_at',
+            (self.name, position, lag_seconds, time.time()))
+
+    def _sync_schema(self):
+        """Carry DDL over from the primary (new tables/indexes, ALTER TABLE ... ADD COLUMN)."""
+        version = self._primary.execute('PRAGMA schema_version').fetchone()[0]
+        if version == self._schema_version:
+            return
+        existing = {r[0] for r in self._replica.execute('SELECT name FROM sqlite_master')}
+        # Index plein texte (FTS5, voir group_search.py) : lus sur la base principale, pas répliqués
+        virtual = [r[0] for r in self._primary.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'")]
+        for type_, name, sql in self._primary.execute(
+                "SELECT type, name, sql FROM sqlite_master WHERE type IN ('table', 'index') AND sql IS NOT NULL "
+                "AND name NOT LIKE 'sqlite_%' ORDER BY type DESC"):
+            if name in existing or name in ('change_log', 'replication_follower'):
+                continue
+            if any(name == v or name.startswith(v + '_') for v in virtual):
+                continue
+            self._replica.execute(sql)
+        for table in REPLICATED_TABLES:
+            have = set(_columns(self._replica, table))
+            for _, col, type_, _, _, _ in self._primary.execute(f'PRAGMA table_info({_quote(table)})'):
+                if col not in have:
+                    self._replica.execute(f'ALTER TABLE {_quote(table)} ADD COLUMN {_quote(col)} {type_}')
+        # Triggers data_version (voir migrations.py) : le réplica tient ses propres versions à jour
+        have = dict(self._replica.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'"))
+        for name, sql in self._primary.execute(
+                "SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'dv!_%' ESCAPE '!'"):
+            if have.get(name) != sql:
+                self._replica.execute(f'DROP TRIGGER IF EXISTS {_quote(name)}')
+                self._replica.execute(sql)
+        # Triggers des tables dérivées : mis de côté (y compris sur un réplica initialisé avant cette règle)
+        park_derived_triggers(self._replica, _derived_triggers(self._primary))
+        self._schema_version = version
+
+    def _apply(self, tbl, op, row_id, data):
+        q = _quote(tbl)
+        if op == 'D':
+            self._replica.execute(f'DELETE FROM {q} WHERE id = ?', (row_id,))
+            return
+        row = json.loads(data)
+        cols = list(row)
+        names = ', '.join(_quote(c) for c in cols)
+        updates = ', '.join(f'{_quote(c)} = excluded.{_quote(c)}' for c in cols if c != 'id')
+        self._replica.execute(
+            f'INSERT INTO {q} ({names}) VALUES ({", ".join("?" for _ in cols)}) '
+            f'ON CONFLICT(id) DO UPDATE SET {updates}',
+            [row[c] for c in cols])
+
+    def apply_batch(self):
+        """Apply the next batch of changes in one replica transaction. Returns the number applied."""
+        start = self.position()
+        rows = self._primary.execute(
+            'SELECT id, tbl, op, row_id, data, changed_at FROM change_log WHERE id > ? ORDER BY id LIMIT ?',
+            (start, self.batch_size)).fetchall()
+        if not rows:
+            self._register(start, 0.0)
+            return 0
+        self._replica.execute('BEGIN IMMEDIATE')
+        try:
+            self._sync_schema()
+            for _, tbl, op, row_id, data, _ in rows:
+                self._apply(tbl, op, row_id, data)
+            self._replica.execute('UPDATE replica_state SET last_change_id = ?, applied_at = ? WHERE id = 1',
+                                  (rows[-1][0], time.time()))
+            self._replica.execute('COMMIT')
+        except Exception:
+            self._replica.execute('ROLLBACK')
+            raise
+        self._register(rows[-1][0], self.lag()['lag_seconds'])
+        return len(rows)
+
+    def lag(self):
+        """Changes not yet applied and age (s) of the oldest of them."""
+        position = self.position()
+        pending, oldest = self._primary.execute(
+            'SELECT COUNT(*), MIN(changed_at) FROM change_log WHERE id > ?', (position,)).fetchone()
+        return {
+            'replica': self.name,
+            'position': position,
+            'lag_changes': pending,
+            'lag_seconds': round(time.time() - oldest, 3) if oldest is not None else 0.0,
+        }
+
+    def catch_up(self, max_batches=None):
+        applied = batches = 0
+        while max_batches is None or batches < max_batches:
+            n = self.apply_batch()
+            applied += n
+            batches += 1
+            if n < self.batch_size:
+                break
+        return applied
+
+    def promote(self):
+        """Turn a caught-up standby into a primary: drop replica bookkeeping, start capturing."""
+        self.catch_up()
+        self._replica.execute('DROP TABLE IF EXISTS replica_state')
+        self._replica.execute('DELETE FROM change_log')
+        restore_derived_triggers(self._replica)
+        install_capture(self._replica)
+        self._primary.execute('DELETE FROM replication_follower WHERE name = ?', (self.name,))
+
+
+def follow(primary_path, replica_paths, batch_size=500, poll_seconds=1.0, max_lag_seconds=30.0, once=False):
+    """Run followers for every replica until interrupted, pruning the primary's log as they advance."""
+    followers = [ReplicaFollower(primary_path, p, batch_size=batch_size).open() for p in replica_paths]
+    try:
+        while True:
+            busy = False
+            for f in followers:
+                applied = f.catch_up(max_batches=10)
+                busy = busy or applied >= 10 * batch_size
+                lag = f.lag()
+                if lag['lag_seconds'] > max_lag_seconds:
+                    logger.warning('Replica %s is %.1fs behind (%s changes)', f.name, lag['lag_seconds'],
+                                   lag['lag_changes'])
+            prune_change_log(followers[0]._primary)
+            if once:
+                return [f.lag() for f in followers]
+            if not busy:
+                time.sleep(poll_seconds)
+    finally:
+        for f in followers:
+            f.close()
+
+
+def replication_status(primary_path):
+    """Registered followers with their position and lag, as seen from the primary."""
+    conn = _connect(primary_path)
+    try:
+        conn.execute(CHANGE_LOG_DDL)
+        conn.execute(FOLLOWER_DDL)
+        head = _head(conn)
+        out = []
+        for name, position, lag_seconds, updated_at in conn.execute(
+                'SELECT name, last_change_id, lag_seconds, updated_at FROM replication_follower ORDER BY name'):
+            pending = conn.execute('SELECT COUNT(*) FROM change_log WHERE id > ?', (position,)).fetchone()[0]
+            out.append({'replica': name, 'position': position, 'lag_changes': pending,
+                        'lag_seconds': lag_seconds, 'last_seen_s': round(time.time() - updated_at, 1)})
+        return {'head': head, 'capturing': bool(_capture_triggers(conn)), 'followers': out}
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Réplication par journal de la base SQLite MyTakaful.')
+    parser.add_argument('command', choices=('follow', 'status', 'promote'))
+    parser.add_argument('--primary', default=sqlite_path(Config.SQLALCHEMY_DATABASE_URI),
+                        help='Fichier de la base principale (défaut : MYTAKAFUL_DB_URI)')
+    parser.add_argument('--replica', action='append', default=[], help='Fichier réplica (répétable)')
+    parser.add_argument('--batch-size', type=int, default=Config.REPLICATION_BATCH_SIZE)
+    parser.add_argument('--poll-seconds', type=float, default=Config.REPLICATION_POLL_SECONDS)
+    parser.add_argument('--max-lag-seconds', type=float, default=Config.REPLICATION_MAX_LAG_SECONDS)
+    parser.add_argument('--once', action='store_true', help='Rattraper le retard puis quitter')
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if not args.primary:
+        parser.error('la base principale doit être un fichier SQLite')
+
+    if args.command == 'status':
+        print(json.dumps(replication_status(args.primary), indent=2))
+    elif args.command == 'follow':
+        if not args.replica:
+            parser.error('--replica est requis')
+        lags = follow(args.primary, args.replica, args.batch_size, args.poll_seconds, args.max_lag_seconds,
+                      once=args.once)
+        if lags:
+            print(json.dumps(lags, indent=2))
+    else:
+        if len(args.replica) != 1:
+            parser.error('promote attend exactement un --replica')
+        f = ReplicaFollower(args.primary, args.replica[0], batch_size=args.batch_size).open()
+        try:
+            f.promote()
+        finally:
+            f.close()
+        print(f'{args.replica[0]} promu : la capture des changements y est active')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""
+Tâches planifiées (APScheduler) : cotisations mensuelles, boîte de réception des webhooks, réconciliation,
+purge des groupes supprimés, archivage, rétention des notifications, points de contrôle des fonds,
+pré-examen des demandes d'aide, recalcul des séries de cotisation, reprise des backfills.
+- Rien ne démarre à l'import : create_app() les lance si SCHEDULER_ENABLED, sinon `flask --app app scheduler`
+- Sous gunicorn (wsgi.py) : un seul worker les lance, celui qui obtient le verrou SCHEDULER_LOCK_PATH ;
+  le verrou est libéré à la mort du worker et repris par son remplaçant
+- APScheduler n'est importé qu'au démarrage du planificateur
+"""
+import os
+from datetime import datetime
+
+from flask import current_app
+
+from aid_rules import screen_aids
+from archive import run_archival
+from contribution_streaks import refresh_streaks
+from fund_history import build_checkpoints
+from group_purge import process_group_purges
+from migrations import run_backfills
+from models import db, Group, Membership, Transaction, notify_user
+from notifications import prune_read
+from reconciliation import run_reconciliation
+from webhooks import process_pending_events
+
+
+def generate_monthly_contributions():
+    groups = Group.query.filter_by(archived=False).all()
+    for gobj in groups:
+        members = Membership.query.filter_by(group_id=gobj.id, auto_pay=True).all()
+        for m in members:
+            last = Transaction.query.filter_by(group_id=gobj.id, user_id=m.user_id, type='cotisation').order_by(Transaction.date.desc()).first()
+            due = True
+            if last:
+                delta = (datetime.utcnow() - last.date).days
+                due = delta >= 30
+            if due:
+                t = Transaction(group_id=gobj.id, user_id=m.user_id, amount=gobj.monthly_contribution, type='cotisation', status='pending', provider=None)
+                db.session.add(t)
+                db.session.commit()
+                notify_user(m.user_id, 'contribution_due', f"Cotisation de {gobj.monthly_contribution} MAD due pour {gobj.name}", group_id=gobj.id)
+
+
+def process_webhook_inbox(batch_size=200):
+    while process_pending_events(batch_size=batch_size)['events'] == batch_size:
+        pass
+
+
+def purge_deleted_groups():
+    process_group_purges(logger=current_app.logger)
+
+
+def archive_closed_periods():
+    run_archival(logger=current_app.logger)
+
+
+def prune_read_notifications():
+    prune_read(logger=current_app.logger)
+
+
+def close_fund_months():
+    build_checkpoints(logger=current_app.logger)
+
+
+def screen_pending_aids():
+    screen_aids(logger=current_app.logger)
+
+
+def refresh_contribution_streaks():
+    refresh_streaks(logger=current_app.logger)
+
+
+def resume_backfills():
+    config = current_app.config
+    run_backfills(max_seconds=config.get('BACKFILL_MAX_SECONDS', 60),
+                  max_rows_per_second=config.get('BACKFILL_MAX_ROWS_PER_SECOND', 5000), logger=current_app.logger)
+
+
+def _in_app_context(app, fn, *args):
+    def job():
+        with app.app_context():
+            fn(*args)
+    job.__name__ = fn.__name__
+    return job
+
+
+def create_scheduler(app, blocking=False):
+    """Build a scheduler with the application's jobs (not started)."""
+    if blocking:
+        from apscheduler.schedulers.blocking import BlockingScheduler as Scheduler
+    else:
+        from apscheduler.schedulers.background import BackgroundScheduler as Scheduler
+    scheduler = Scheduler()
+    config = app.config
+    scheduler.add_job(_in_app_context(app, generate_monthly_contributions), 'interval', minutes=5,
+                      id='monthly_contrib')
+    scheduler.add_job(_in_app_context(app, process_webhook_inbox, config.get('WEBHOOK_BATCH_SIZE', 200)),
+                      'interval', seconds=config.get('WEBHOOK_POLL_SECONDS', 5), id='webhook_inbox',
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(_in_app_context(app, run_reconciliation), 'interval',
+                      minutes=config.get('RECONCILE_INTERVAL_MINUTES', 15), id='reconcile_payments',
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(_in_app_context(app, purge_deleted_groups), 'interval',
+                      seconds=config.get('GROUP_PURGE_POLL_SECONDS', 10), id='group_purge',
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(_in_app_context(app, archive_closed_periods), 'interval',
+                      hours=config.get('ARCHIVE_INTERVAL_HOURS', 24), id='archive',
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(_in_app_context(app, prune_read_notifications), 'interval', hours=24,
+                      id='notification_retention', max_instances=1, coalesce=True)
+    scheduler.add_job(_in_app_context(app, close_fund_months), 'interval',
+                      hours=config.get('FUND_CHECKPOINT_INTERVAL_HOURS', 6), id='fund_checkpoints',
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(_in_app_context(app, screen_pending_aids), 'interval',
+                      minutes=config.get('AID_SCREENING_INTERVAL_MINUTES', 15), id='aid_screening',
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(_in_app_context(app, refresh_contribution_streaks), 'interval',
+                      minutes=config.get('STREAK_REFRESH_INTERVAL_MINUTES', 30), id='streak_refresh',
+                      max_instances=1, coalesce=True)
+    scheduler.add_job(_in_app_context(app, resume_backfills), 'interval',
+                      minutes=config.get('BACKFILL_INTERVAL_MINUTES', 5), id='backfills',
+                      max_instances=1, coalesce=True)
+    return scheduler
+
+
+def start_scheduler(app):
+    """Start the jobs in a background thread of this process and keep a handle on the app."""
+    scheduler = create_scheduler(app)
+    scheduler.start()
+    app.extensions['scheduler'] = scheduler
+    return scheduler
+
+
+def start_scheduler_locked(app, lock_path):
+    """Start the jobs here only if this process takes the exclusive lock on `lock_path`. Returns True if started."""
+    import fcntl
+
+    os.makedirs(os.path.dirname(os.path.abspath(lock_path)), exist_ok=True)
+    handle = open(lock_path, 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    # Gardé ouvert tant que le processus vit : le verrou part avec lui
+    app.extensions['scheduler_lock'] = handle
+    start_scheduler(app)
+    return True
@@ -0,0 +1,68 @@
+"""
+Profil de performance SQLite appliqué à chaque nouvelle connexion.
+- WAL + synchronous=NORMAL : lecteurs et écrivain ne se bloquent plus mutuellement
+- busy_timeout : attente du verrou d'écriture au lieu de "database is locked"
+- cache_size, mmap_size, temp_store=MEMORY, foreign_keys
+Les valeurs viennent de Config (SQLITE_*).
+"""
+from sqlalchemy import event
+
+
+def sqlite_pragmas(config):
+    """Ordered (pragma, value) pairs for the configured profile."""
+    if not config.get('SQLITE_PROFILE_ENABLED', True):
+        return []
+    return [
+        ('journal_mode', config.get('SQLITE_JOURNAL_MODE', 'WAL')),
+        ('synchronous', config.get('SQLITE_SYNCHRONOUS', 'NORMAL')),
+        ('busy_timeout', int(config.get('SQLITE_BUSY_TIMEOUT_MS', 5000))),
+        ('cache_size', int(config.get('SQLITE_CACHE_SIZE_KIB', 65536)) * -1),
+        ('mmap_size', int(config.get('SQLITE_MMAP_SIZE', 268435456))),
+        ('temp_store', 'MEMORY'),
+        ('foreign_keys', 'ON' if config.get('SQLITE_FOREIGN_KEYS', True) else 'OFF'),
+    ]
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def install_sqlite_profile(engine, config, read_only=False):
+    """Register a connect hook on `engine` applying the profile (no-op for other databases)."""
+    if engine.dialect.name != 'sqlite':
+        return False
+    pragmas = sqlite_pragmas(config)
+    if read_only:
+        pragmas.append(('query_only', 'ON'))
+    if engine.url.database in (None, '', ':memory:'):
+        # WAL n'a pas de sens pour une base en mémoire
+        pragmas = [(k, v) for k, v in pragmas if k != 'journal_mode']
+    if not pragmas:
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def _on_connect(dbapi_connection, connection_record):
+        apply_pragmas(dbapi_connection, pragmas)
+
+    return True
+
+
+def engine_options(uri, pool_size=10, max_overflow=10, pool_recycle=1800, pool_timeout=30, busy_timeout_ms=5000):
+    """SQLALCHEMY_ENGINE_OPTIONS suited to `uri`; in-memory SQLite keeps its single-connection pool."""
+    if not uri.startswith('sqlite'):
+        return {'pool_size': pool_size, 'max_overflow': max_overflow,
+                'pool_recycle': pool_recycle, 'pool_timeout': pool_timeout, 'pool_pre_ping': True}
+    if uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri:
+        return {}
+    return {
+        'pool_size': pool_size,
+        'max_overflow': max_overflow,
+        'pool_recycle': pool_recycle,
+        'pool_timeout': pool_timeout,
+        'connect_args': {'timeout': busy_timeout_ms / 1000.0, 'check_same_thread': False},
+    }
@@ -0,0 +1,39 @@
+function toggleSidebar(){
+  var el=document.querySelector('.sidebar');
+  if(el){ el.classList.toggle('collapsed'); return; }
+  // For non-admin users or when sidebar doesn't exist, we could implement a mobile menu
+  var nav=document.querySelector('.header-nav');
+  if(nav){ nav.classList.toggle('open'); }
+}
+
+// Données chargées après affichage : réponses JSON en colonnes ({col: [..], next: id|null})
+function fetchColumns(url){
+  return fetch(url, {headers:{'Accept':'application/json'}, credentials:'same-origin'}).then(function(r){
+    if(!r.ok){ throw new Error('HTTP ' + r.status); }
+    return r.json();
+  });
+}
+function columnRows(data, cols){
+  var n = (data[cols[0]] || []).length, out = [];
+  for(var i=0;i<n;i++){ out.push(cols.map(function(c){ return data[c][i]; })); }
+  return out;
+}
+function lazyTable(table, moreBtn, cols, renderRow, emptyText){
+  if(!table) return;
+  var tbody = table.querySelector('tbody'), base = table.dataset.url, cursor = null;
+  function load(){
+    var url = cursor ? base + (base.indexOf('?') < 0 ? '?' : '&') + 'before=' + cursor : base;
+    return fetchColumns(url).then(function(data){
+      var rows = columnRows(data, cols);
+      rows.forEach(function(r){ var tr=document.createElement('tr'); tr.innerHTML=renderRow(r); tbody.appendChild(tr); });
+      if(!tbody.children.length){ tbody.innerHTML = '<tr><td colspan="' + table.querySelectorAll('thead th').length + '">' + emptyText + '</td></tr>'; }
+      cursor = data.next;
+      if(moreBtn){ moreBtn.style.display = cursor ? '' : 'none'; }
+    });
+  }
+  if(moreBtn){ moreBtn.addEventListener('click', load); }
+  load();
+}
+function escapeHtml(v){
+  return String(v == null ? '' : v).replace(/[&<>"']/g, function(c){ return {'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'}[c]; });
+}
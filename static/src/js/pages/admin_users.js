@@ -0,0 +1,34 @@
+(function(){
+  var chkAll = document.getElementById('chkAll');
+  var bulkBar = document.getElementById('bulkBar');
+  var bulkCount = document.getElementById('bulkCount');
+  function rows(){ return Array.from(document.querySelectorAll('#usersTable tbody tr')); }
+  function selected(){ return rows().filter(function(r){ return r.querySelector('.row-check').checked; }); }
+  function updateBulk(){
+    var sel = selected();
+    var all = rows();
+    bulkCount.textContent = String(sel.length);
+    bulkBar.style.display = sel.length ? 'flex' : 'none';
+    if(chkAll){ chkAll.checked = sel.length === all.length && all.length > 0; }
+  }
+  if(chkAll){ chkAll.addEventListener('change', function(){ rows().forEach(function(r){ var c=r.querySelector('.row-check'); if(c) c.checked = chkAll.checked; }); updateBulk(); }); }
+  rows().forEach(function(r){
+    var c=r.querySelector('.row-check'); if(c){ c.addEventListener('change', updateBulk); }
+    var dd=r.querySelector('.dropdown'); if(dd){ var btn=dd.querySelector('.dropdown-btn'); btn.addEventListener('click', function(e){ e.stopPropagation(); dd.classList.toggle('open'); }); document.addEventListener('click', function(){ dd.classList.remove('open'); }); }
+    var del=r.querySelector('.js-delete'); if(del){ del.addEventListener('click', function(){ if(!confirm('Supprimer cet utilisateur ?')) return; fetch(r.dataset.urlDelete, {method:'DELETE'}).then(function(resp){ if(!resp.ok){ return resp.json().then(function(j){ alert(j.error||'Erreur suppression'); }); } else { location.reload(); } }); }); }
+  });
+  function post(url){ return fetch(url, {method:'POST'}); }
+  function confirmRun(msg, fn){ if(!confirm(msg)) return; fn(); }
+  document.getElementById('bulkBlock').addEventListener('click', function(){ confirmRun('Bloquer les utilisateurs sélectionnés ?', function(){
+    var ops = selected().filter(function(r){ return r.dataset.blocked==='0'; }).map(function(r){ return post(r.dataset.urlBlock); }); Promise.all(ops).then(function(){ location.reload(); });
+  }); });
+  document.getElementById('bulkUnblock').addEventListener('click', function(){ confirmRun('Débloquer les utilisateurs sélectionnés ?', function(){
+    var ops = selected().filter(function(r){ return r.dataset.blocked==='1'; }).map(function(r){ return post(r.dataset.urlUnblock); }); Promise.all(ops).then(function(){ location.reload(); });
+  }); });
+  document.getElementById('bulkPromote').addEventListener('click', function(){ confirmRun('Promouvoir en admin les utilisateurs sélectionnés ?', function(){
+    var ops = selected().filter(function(r){ return r.dataset.role==='user'; }).map(function(r){ return post(r.dataset.urlMakeAdmin); }); Promise.all(ops).then(function(){ location.reload(); });
+  }); });
+  document.getElementById('bulkDemote').addEventListener('click', function(){ confirmRun('Rétrograder en user les admins sélectionnés ?', function(){
+    var ops = selected().filter(function(r){ return r.dataset.role==='admin'; }).map(function(r){ return post(r.dataset.urlMakeUser); }); Promise.all(ops).then(function(){ location.reload(); });
+  }); });
+})();
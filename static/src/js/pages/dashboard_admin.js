@@ -0,0 +1,93 @@
+(function(){
+  function chart(id, build){
+    var canvas = document.getElementById(id);
+    if(canvas){ fetchColumns(canvas.dataset.url).then(function(d){ new Chart(canvas, build(d)); }); }
+  }
+  chart('adminChart', function(d){ return {type:'bar', data:{labels:d.labels, datasets:[{label:'Fonds par groupe (MAD)', data:d.values, backgroundColor:'rgba(30,58,138,0.6)', borderColor:'#1e3a8a'}]}}; });
+  chart('aidStatusChart', function(d){ return {type:'doughnut', data:{labels:d.labels, datasets:[{data:d.values, backgroundColor:['#f59e0b','#10b981','#ef4444']} ]}}; });
+  chart('monthlyRevenueChart', function(d){ return {type:'line', data:{labels:d.labels, datasets:[{label:'Revenus (MAD)', data:d.values, borderColor:'#065f46', backgroundColor:'rgba(6,95,70,0.2)'}]}}; });
+  lazyTable(document.getElementById('cotisationsTable'), document.getElementById('cotisationsMore'),
+    ['date', 'amount', 'user', 'group'],
+    function(r){
+      return '<td>' + escapeHtml((r[0] || '').replace('T', ' ')) + '</td><td class="col-right">' + escapeHtml(r[1]) +
+        '</td><td>' + escapeHtml(r[2]) + '</td><td>' + escapeHtml(r[3]) + '</td>';
+    }, 'Aucune cotisation');
+  // Sélection multiple : une requête pour toute la sélection, résultat par id
+  document.querySelectorAll('.bulk-bar').forEach(function(bar){
+    var table = bar.parentNode.querySelector('table');
+    var checkAll = table.querySelector('.check-all');
+    function checks(){ return Array.from(table.querySelectorAll('tbody .row-check')); }
+    function update(){
+      var n = checks().filter(function(c){ return c.checked; }).length;
+      bar.querySelector('.bulk-count').textContent = String(n);
+      bar.style.display = n ? 'flex' : 'none';
+    }
+    checkAll.addEventListener('change', function(){ checks().forEach(function(c){ c.checked = checkAll.checked; }); update(); });
+    table.addEventListener('change', function(e){ if(e.target.classList.contains('row-check')){ update(); } });
+    bar.querySelectorAll('button[data-action]').forEach(function(btn){
+      btn.addEventListener('click', function(){
+        var ids = checks().filter(function(c){ return c.checked; }).map(function(c){ return Number(c.value); });
+        fetch(bar.dataset.url, {method:'POST', credentials:'same-origin',
+          headers:{'Content-Type':'application/json', 'Accept':'application/json'},
+          body: JSON.stringify({action: btn.dataset.action, ids: ids})
+        }).then(function(r){ return r.json(); }).then(function(data){
+          checks().forEach(function(c){
+            var result = data.results && data.results[c.value];
+            if(!result) return;
+            var row = c.closest('tr');
+            if(result === 'insufficient_funds'){ row.classList.add('bulk-failed'); c.checked = false; }
+            else { row.remove(); }
+          });
+          checkAll.checked = false;
+          update();
+          if(data.counts && data.counts.insufficient_funds){ alert(data.counts.insufficient_funds + ' aide(s) non approuvée(s) : fonds insuffisants'); }
+        });
+      });
+    });
+  });
+  const f = document.getElementById('txFilter');
+  f && f.addEventListener('input', function(){
+    const q = this.value.toLowerCase();
+    document.querySelectorAll('#txTable tbody tr').forEach(tr=>{
+      tr.style.display = tr.textContent.toLowerCase().includes(q)?'':'none';
+    });
+  });
+  document.querySelectorAll('#txTable thead th').forEach((th, idx)=>{
+    if(th.classList.contains('col-check')) return;
+    let asc=true;
+    th.addEventListener('click', ()=>{
+      const rows = Array.from(document.querySelectorAll('#txTable tbody tr'));
+      rows.sort((a,b)=>{
+        const ta = a.children[idx].textContent.trim();
+        const tb = b.children[idx].textContent.trim();
+        if(!isNaN(parseFloat(ta)) && !isNaN(parseFloat(tb))){ return (parseFloat(ta)-parseFloat(tb))*(asc?1:-1); }
+        return ta.localeCompare(tb)*(asc?1:-1);
+      });
+      const tbody = document.querySelector('#txTable tbody');
+      tbody.innerHTML=''; rows.forEach(r=>tbody.appendChild(r)); asc=!asc;
+    });
+  });
+  
+  // Handle form submissions with AJAX for better UX
+  document.querySelectorAll('#txTable form, #aides-list form').forEach(form => {
+    form.addEventListener('submit', function(e) {
+      e.preventDefault();
+      
+      const row = this.closest('tr');
+      const action = this.querySelector('button').textContent.trim();
+      
+      fetch(this.action, {
+        method: 'POST',
+        headers: {
+          'X-Requested-With': 'XMLHttpRequest'
+        }
+      }).then(response => {
+        // Remove the row from the table
+        row.remove();
+              
+        // Silent operation - no messages displayed
+        // Success feedback is implicit by row removal
+      });
+    });
+  });
+})();
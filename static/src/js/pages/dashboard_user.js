@@ -0,0 +1,14 @@
+(function(){
+  var canvas = document.getElementById('groupFundsChart');
+  if(canvas){
+    fetchColumns(canvas.dataset.url).then(function(d){
+      new Chart(canvas, {type:'bar', data:{labels:d.labels, datasets:[{label:'Fonds par groupe (MAD)', data:d.values, backgroundColor:'rgba(30,58,138,0.6)'}]}});
+    });
+  }
+  lazyTable(document.getElementById('historyTable'), document.getElementById('historyMore'),
+    ['date', 'group', 'type', 'amount', 'status'],
+    function(r){
+      return '<td>' + escapeHtml((r[0] || '').replace('T', ' ')) + '</td><td>' + escapeHtml(r[1]) + '</td><td>' + escapeHtml(r[2]) +
+        '</td><td class="col-right">' + escapeHtml(r[3]) + '</td><td class="col-center"><span class="status-badge ' + escapeHtml(r[4]) + '">' + escapeHtml(r[4]) + '</span></td>';
+    }, 'Aucune transaction');
+})();
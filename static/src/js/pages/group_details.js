@@ -0,0 +1,6 @@
+function openTab(k){
+  document.querySelectorAll('.tab').forEach(t=>t.style.display='none');
+  document.getElementById('tab-'+k).style.display='block';
+  document.querySelectorAll('.tab-btn').forEach(b=>b.classList.toggle('active', b.getAttribute('data-tab')===k));
+}
+document.querySelectorAll('.tab-btn').forEach(b=>{ b.addEventListener('click', function(){ openTab(this.getAttribute('data-tab')); }); });
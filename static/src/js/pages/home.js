@@ -0,0 +1,7 @@
+document.querySelectorAll('.faq-q').forEach(btn=>{
+  btn.addEventListener('click',()=>{ btn.parentElement.classList.toggle('open'); });
+});
+const io = new IntersectionObserver((entries)=>{
+  entries.forEach(e=>{ if(e.isIntersecting) e.target.classList.add('in'); });
+}, {threshold: 0.15});
+document.querySelectorAll('.fade').forEach(el=>io.observe(el));
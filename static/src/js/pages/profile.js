@@ -0,0 +1,18 @@
+// Handle delete account confirmation
+document.addEventListener('DOMContentLoaded', function() {
+  const deleteBtn = document.getElementById('deleteBtn');
+  const confirmDelete = document.getElementById('confirmDelete');
+  const cancelDelete = document.getElementById('cancelDelete');
+
+  if (deleteBtn) {
+    deleteBtn.addEventListener('click', function() {
+      confirmDelete.classList.add('show');
+    });
+  }
+
+  if (cancelDelete) {
+    cancelDelete.addEventListener('click', function() {
+      confirmDelete.classList.remove('show');
+    });
+  }
+});
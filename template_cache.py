@@ -0,0 +1,165 @@
+"""
+Cache du HTML rendu : pages complètes (visiteurs anonymes) et fragments de gabarits.
+- Clé = langue + direction (ltr/rtl) + version des données + éléments propres au fragment
+- Versions tenues par des triggers SQLite dans data_version (portée 'group:<id>', 'groups') :
+  toute écriture, même hors ORM ou depuis un autre processus, invalide les entrées concernées
+- LRU en mémoire, par processus, borné en octets et en nombre d'entrées
+
+Dans un gabarit :
+    {% cache g.id, versions[g.id] %} ... {% endcache %}
+"""
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from jinja2 import nodes
+from jinja2.ext import Extension
+from sqlalchemy import text
+
+from assets import manifest_version
+from i18n import get_current_language, get_language_direction
+from models import db
+
+
+class RenderCache:
+    """Thread-safe LRU of rendered HTML bounded by total size and entry count."""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=10000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._data and (self._bytes > self.max_bytes or len(self._data) > self.max_entries):
+                _, (_, evicted) = self._data.popitem(last=False)
+                self._bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._data), 'bytes': self._bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+def get_cache():
+    return current_app.extensions.get('template_cache')
+
+
+def data_versions(scopes):
+    """Current version of each scope (0 when never written)."""
+    scopes = list(scopes)
+    if not scopes:
+        return {}
+    versions = dict.fromkeys(scopes, 0)
+    for i in range(0, len(scopes), 500):
+        chunk = scopes[i:i + 500]
+        params = {f's{j}': s for j, s in enumerate(chunk)}
+        rows = db.session.execute(
+            text(f"SELECT scope, version FROM data_version WHERE scope IN ({', '.join(':' + k for k in params)})"),
+            params)
+        versions.update(dict(rows.all()))
+    return versions
+
+
+def group_versions(group_ids):
+    versions = data_versions(f'group:{gid}' for gid in group_ids)
+    return {gid: versions[f'group:{gid}'] for gid in group_ids}
+
+
+class LazyMap(dict):
+    """dict filled on first access: cached fragments never ask for the values they contain."""
+
+    def __init__(self, loader):
+        super().__init__()
+        self._loader = loader
+
+    def __missing__(self, key):
+        value = self[key] = self._loader(key)
+        return value
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        parts = [nodes.Const(parser.name), nodes.Const(lineno), parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            parts.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        args = [nodes.List(parts), nodes.Name('current_language', 'load'), nodes.Name('language_direction', 'load')]
+        return nodes.CallBlock(self.call_method('_render', args), [], [], body).set_lineno(lineno)
+
+    def _render(self, parts, language, direction, caller):
+        cache = get_cache()
+        if cache is None:
+            return caller()
+        key = ('fragment', language, direction) + tuple(parts)
+        html = cache.get(key)
+        if html is None:
+            html = caller()
+            cache.set(key, html)
+        return html
+
+
+def cached_page(version_scope=None):
+    """Serve a whole page from the cache for anonymous GETs (no session user, no pending flash)."""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if (cache is None or request.method != 'GET' or session.get('user_id')
+                    or session.get('_flashes')):
+                return f(*args, **kwargs)
+            version = data_versions([version_scope])[version_scope] if version_scope else 0
+            key = ('page', request.full_path, get_current_language(), get_language_direction(), version,
+                   manifest_version())
+            html = cache.get(key)
+            if html is not None:
+                resp = current_app.response_class(html, mimetype='text/html')
+                resp.headers['X-Cache'] = 'HIT'
+                return resp
+            resp = make_response(f(*args, **kwargs))
+            if resp.status_code == 200 and resp.mimetype == 'text/html' and not resp.is_streamed:
+                cache.set(key, resp.get_data(as_text=True))
+                resp.headers['X-Cache'] = 'MISS'
+            return resp
+        return wrapper
+    return decorator
+
+
+def init_template_cache(app):
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    if app.config.get('TEMPLATE_CACHE_ENABLED', True):
+        app.extensions['template_cache'] = RenderCache(
+            max_bytes=app.config.get('TEMPLATE_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+            max_entries=app.config.get('TEMPLATE_CACHE_MAX_ENTRIES', 10000),
+        )
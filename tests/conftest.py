@@ -0,0 +1,115 @@
+"""
+Fixtures des tests : base principale et réplica dans deux fichiers SQLite distincts.
+- La configuration est relue après avoir posé les variables MYTAKAFUL_* (Config les lit à l'import)
+- Le réplica est une copie de la base principale, puis reçoit un groupe qui n'existe que chez lui :
+  une page qui l'affiche a lu le réplica
+- statements() enregistre, par bind, les requêtes SQL exécutées
+"""
+import importlib
+import os
+import sqlite3
+import sys
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+REPLICA_ONLY_GROUP = 'Groupe du réplica'
+SHARED_GROUP = 'Groupe commun'
+
+
+def _build_app(tmp_path, monkeypatch, replica):
+    primary = tmp_path / 'primary.db'
+    monkeypatch.setenv('MYTAKAFUL_DB_URI', f'sqlite:///{primary}')
+    if replica:
+        monkeypatch.setenv('MYTAKAFUL_DB_REPLICA_URI', f"sqlite:///{tmp_path / 'replica.db'}")
+    else:
+        monkeypatch.delenv('MYTAKAFUL_DB_REPLICA_URI', raising=False)
+    # Pas de cache de pages ni d'ETag : chaque requête exécute la vue
+    monkeypatch.setenv('MYTAKAFUL_TEMPLATE_CACHE', '0')
+    monkeypatch.setenv('MYTAKAFUL_HTTP_ETAGS', '0')
+    monkeypatch.setenv('MYTAKAFUL_SCHEDULER', '0')
+    monkeypatch.setenv('MYTAKAFUL_SECRET_KEY', 'tests')
+    import config
+    importlib.reload(config)
+    from app import create_app
+    from cli import seed_admin, upgrade_schema
+    from models import Group, Membership, Transaction, User, db
+
+    app = create_app(config.Config, TESTING=True)
+    with app.app_context():
+        upgrade_schema()
+        seed_admin()
+        member = User(name='membre', email='membre@example.com', password_hash=generate_password_hash('x'))
+        db.session.add(member)
+        db.session.flush()
+        group = Group(name=SHARED_GROUP, created_by=member.id)
+        db.session.add(group)
+        db.session.flush()
+        db.session.add(Membership(user_id=member.id, group_id=group.id))
+        db.session.add(Transaction(group_id=group.id, user_id=member.id, amount=10, type='cotisation',
+                                   status='approved'))
+        db.session.commit()
+        app.config['TEST_IDS'] = {'admin': User.query.filter_by(role='admin').first().id,
+                                  'member': member.id, 'group': group.id}
+        for engine in db.engines.values():
+            engine.dispose()
+    if replica:
+        _make_replica(primary, tmp_path / 'replica.db', app.config['TEST_IDS'])
+    return app
+
+
+def _make_replica(primary, replica, ids):
+    src, dst = sqlite3.connect(primary), sqlite3.connect(replica)
+    src.backup(dst)
+    src.close()
+    dst.execute("INSERT INTO 'group' (name, monthly_contribution, created_by, archived, created_at) "
+                "VALUES (?, 10, ?, 0, '2024-01-01 00:00:00')", (REPLICA_ONLY_GROUP, ids['member']))
+    gid = dst.execute('SELECT last_insert_rowid()').fetchone()[0]
+    dst.execute("INSERT INTO 'transaction' (group_id, user_id, amount, type, status, date) "
+                "VALUES (?, ?, 10, 'cotisation', 'approved', '2024-01-01 00:00:00')", (gid, ids['member']))
+    dst.commit()
+    dst.close()
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    return _build_app(tmp_path, monkeypatch, replica=True)
+
+
+@pytest.fixture
+def primary_only_app(tmp_path, monkeypatch):
+    return _build_app(tmp_path, monkeypatch, replica=False)
+
+
+def login(client, app, who):
+    with client.session_transaction() as s:
+        s['user_id'] = app.config['TEST_IDS'][who]
+
+
+@contextmanager
+def statements(app):
+    """Record the SQL run on each bind: {'primary': [...], 'replica': [...]}."""
+    from db_routing import REPLICA_BIND
+    from models import db
+
+    seen = {}
+    listeners = []
+    with app.app_context():
+        for key, engine in db.engines.items():
+            name = 'replica' if key == REPLICA_BIND else 'primary'
+            seen[name] = []
+
+            def record(conn, cursor, statement, parameters, context, executemany, _name=name):
+                seen[_name].append(statement)
+
+            event.listen(engine, 'before_cursor_execute', record)
+            listeners.append((engine, record))
+    try:
+        yield seen
+    finally:
+        for engine, record in listeners:
+            event.remove(engine, 'before_cursor_execute', record)
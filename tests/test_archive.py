@@ -0,0 +1,80 @@
+"""Archivage des transactions (archive.py) : ids jamais réutilisés, totaux et lecture récentes + archivées."""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, text
+
+from archive import qualified_name, run_archival, transaction_source
+from group_purge import delete_groups_now
+from models import Group, Transaction, db
+
+OLD = datetime.utcnow() - timedelta(days=800)
+
+
+def _tx(group_id, user_id, amount):
+    tx = Transaction(group_id=group_id, user_id=user_id, amount=amount, type='cotisation', status='approved',
+                     date=OLD)
+    db.session.add(tx)
+    db.session.commit()
+    return tx.id
+
+
+def _archived_totals(group_id):
+    return tuple(db.session.execute(text(
+        'SELECT COALESCE(SUM(amount), 0), COALESCE(SUM(count), 0) FROM transaction_archive_totals '
+        'WHERE group_id = :gid'), {'gid': group_id}).one())
+
+
+def _all_rows(group_id):
+    T = transaction_source(True)
+    return dict(db.session.query(T.id, T.amount).filter(T.group_id == group_id).all())
+
+
+def _fund(group_id):
+    return db.session.execute(text('SELECT cotisations FROM group_fund WHERE id = :gid'), {'gid': group_id}).scalar()
+
+
+def test_archive_purge_insert_archive_keeps_every_transaction(primary_only_app):
+    app = primary_only_app
+    ids = app.config['TEST_IDS']
+    with app.app_context():
+        gid, uid = ids['group'], ids['member']
+        seeded = db.session.query(Transaction.id).filter_by(group_id=gid).scalar()
+        archived = {_tx(gid, uid, 5): 5, _tx(gid, uid, 7): 7}
+        # La transaction d'id maximal appartient à un groupe supprimé juste après son archivage
+        other = Group(name='Groupe purgé', created_by=uid)
+        db.session.add(other)
+        db.session.commit()
+        newest = _tx(other.id, uid, 3)
+
+        assert run_archival()['transaction'] == 3
+        assert delete_groups_now([other.id]) == 1
+        assert db.session.query(func.max(Transaction.id)).scalar() < newest
+
+        late = _tx(gid, uid, 11)
+        assert late > newest
+        assert run_archival()['transaction'] == 1
+
+        assert _archived_totals(gid) == (5 + 7 + 11, 3)
+        assert _all_rows(gid) == {seeded: 10, **archived, late: 11}
+        assert _fund(gid) == 10 + 5 + 7 + 11
+
+
+def test_id_already_archived_keeps_the_row(primary_only_app):
+    # Base d'avant la migration 14 : l'id d'une ligne récente a déjà servi à une ligne archivée
+    app = primary_only_app
+    ids = app.config['TEST_IDS']
+    with app.app_context():
+        gid, uid = ids['group'], ids['member']
+        tx_id = _tx(gid, uid, 8)
+        db.session.execute(text(
+            f"INSERT INTO {qualified_name('transaction')} (id, group_id, user_id, amount, type, status, date) "
+            "VALUES (:id, :gid, :uid, 4, 'cotisation', 'approved', :date)"),
+            {'id': tx_id, 'gid': gid, 'uid': uid, 'date': OLD})
+        db.session.commit()
+
+        report = run_archival()
+        assert report['transaction'] == 0
+        assert report['transaction_collisions'] == 1
+        assert db.session.get(Transaction, tx_id) is not None
+        assert _archived_totals(gid) == (0, 0)
+        assert _fund(gid) == 10 + 8
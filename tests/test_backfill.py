@@ -0,0 +1,109 @@
+"""Backfills en ligne (migrations.py) : tables dérivées remplies par tranches, reprise et débit plafonné."""
+import pytest
+from sqlalchemy import text
+
+import migrations
+from group_funds import FUND_FILL_SQL
+from migrations import BACKFILLS, run_backfills
+from models import Group, Membership, Transaction, User, db
+
+DERIVED = {
+    'group_fund': 'id, cotisations, aides',
+    'notification_counter': 'id, unread',
+    'membership_streak': 'id, group_id, user_id, last_period, paid_through, streak, total_paid, stale',
+    'group_fts': 'rowid, name, description',
+    'user_fts': 'rowid, name, email',
+}
+
+
+def _snapshot():
+    return {t: db.session.execute(text(f'SELECT {cols} FROM {t} ORDER BY 1')).all() for t, cols in DERIVED.items()}
+
+
+def _seed(app, groups=5):
+    uid = app.config['TEST_IDS']['member']
+    for i in range(groups):
+        group = Group(name=f'Groupe {i}', created_by=uid)
+        db.session.add(group)
+        db.session.flush()
+        db.session.add(Membership(user_id=uid, group_id=group.id))
+        db.session.add(Transaction(group_id=group.id, user_id=uid, amount=10 + i, type='cotisation',
+                                   status='approved'))
+    for i in range(4):
+        db.session.add(User(name=f'utilisateur {i}', email=f'u{i}@example.com', password_hash='x'))
+    db.session.commit()
+
+
+def _reset(*tables):
+    # Base migrée avant le remplissage : tables vides, aucune progression
+    for table in tables:
+        db.session.execute(text(f'DELETE FROM {table}'))
+    db.session.execute(text('DELETE FROM backfill_progress'))
+    db.session.commit()
+
+
+def test_backfills_rebuild_every_derived_table(primary_only_app):
+    app = primary_only_app
+    with app.app_context():
+        _seed(app)
+        expected = _snapshot()
+        _reset(*DERIVED)
+        reports = run_backfills()
+        assert [r['backfill'] for r in reports] == list(BACKFILLS)
+        assert all(r['done'] for r in reports)
+        assert _snapshot() == expected
+
+
+def test_backfill_resumes_after_an_interrupt(primary_only_app, monkeypatch):
+    app = primary_only_app
+    backfill = BACKFILLS['group_fund']
+    with app.app_context():
+        _seed(app)
+        expected = _snapshot()['group_fund']
+        _reset('group_fund')
+        chunks = []
+
+        def interrupted(conn, lo, hi):
+            if len(chunks) == 2:
+                raise RuntimeError('processus arrêté')
+            chunks.append((lo, hi))
+            return conn.execute(text(FUND_FILL_SQL), {'lo': lo, 'hi': hi}).rowcount
+
+        monkeypatch.setattr(backfill, 'update_sql', interrupted)
+        with pytest.raises(RuntimeError):
+            backfill.run(chunk_size=2)
+        with db.engine.begin() as conn:
+            last_id, rows_done, completed_at = backfill.progress(conn)
+        assert (last_id, rows_done, completed_at) == (chunks[-1][1], 4, None)
+
+        # Écriture entre les deux passages : les triggers l'ajoutent, la reprise ne la compte pas deux fois
+        gid = app.config['TEST_IDS']['group']
+        db.session.add(Transaction(group_id=gid, user_id=app.config['TEST_IDS']['member'], amount=7,
+                                   type='cotisation', status='approved'))
+        db.session.commit()
+        expected = [(i, c + 7 if i == gid else c, a) for i, c, a in expected]
+
+        monkeypatch.undo()
+        report = backfill.run(chunk_size=2)
+        assert report['done'] and report['rows'] == len(expected) - 4
+        assert _snapshot()['group_fund'] == expected
+
+
+def test_backfill_rate_limit(primary_only_app, monkeypatch):
+    app = primary_only_app
+    backfill = BACKFILLS['user_directory']
+    pauses = []
+    monkeypatch.setattr(migrations.time, 'sleep', pauses.append)
+    with app.app_context():
+        _seed(app)
+        _reset('user_fts')
+        report = backfill.run(chunk_size=2, max_rows_per_second=10)
+        assert report['done'] and report['chunks'] == 3
+        # 2 lignes par tranche à 10 lignes/s : au plus 0,2 s par tranche
+        assert len(pauses) == report['chunks']
+        assert all(0 < p <= 0.2 for p in pauses)
+
+        _reset('user_fts')
+        pauses.clear()
+        assert backfill.run(chunk_size=2)['done']
+        assert not pauses
@@ -0,0 +1,112 @@
+"""Read routing between the primary and the replica bind (db_routing.py), on two SQLite files."""
+import time
+
+import pytest
+
+import db_routing
+from conftest import REPLICA_ONLY_GROUP, SHARED_GROUP, login, statements
+from db_routing import RYW_SESSION_KEY, current_read_bind, use_replica
+from models import Group, db
+
+DATA_TABLES = ('"transaction"', '"group"', 'membership', 'group_fund', 'membership_streak')
+
+
+def data_reads(sql):
+    return [s for s in sql if s.lstrip().upper().startswith(('SELECT', 'WITH')) and any(t in s for t in DATA_TABLES)]
+
+
+@pytest.mark.parametrize('who, url', [
+    ('member', '/groups'),
+    ('admin', '/admin/group-statistics'),
+    ('admin', '/admin/export/csv'),
+    ('admin', '/admin/export/cotisations.csv'),
+    ('admin', '/admin/export/aides.csv'),
+    ('admin', '/admin/export/cotisations.pdf'),
+    ('admin', '/admin/export/aides.pdf'),
+    ('admin', '/admin/export/pdf'),
+    ('admin', '/admin/export/group-statistics.csv'),
+    ('admin', '/admin/export/group-statistics.pdf'),
+])
+def test_read_only_views_read_the_replica(app, who, url):
+    client = app.test_client()
+    login(client, app, who)
+    with statements(app) as sql:
+        resp = client.get(url)
+    assert resp.status_code == 200
+    assert data_reads(sql['replica'])
+    assert not data_reads(sql['primary'])
+
+
+def test_pages_show_the_replica_data(app):
+    client = app.test_client()
+    login(client, app, 'member')
+    assert REPLICA_ONLY_GROUP in client.get('/groups').get_data(as_text=True)
+    login(client, app, 'admin')
+    assert REPLICA_ONLY_GROUP in client.get('/admin/group-statistics').get_data(as_text=True)
+    assert REPLICA_ONLY_GROUP in client.get('/admin/export/csv').get_data(as_text=True)
+
+
+def test_admin_users_reads_the_primary(app):
+    # user_fts n'est pas répliqué : l'annuaire reste sur la base principale (voir user_directory.py)
+    client = app.test_client()
+    login(client, app, 'admin')
+    with statements(app) as sql:
+        assert client.get('/admin/users').status_code == 200
+    assert any('user' in s for s in sql['primary'])
+    assert not sql['replica']
+
+
+def test_pending_changes_are_flushed_to_the_primary(app):
+    with app.test_request_context('/'), use_replica():
+        assert current_read_bind() == 'replica'
+        with statements(app) as sql:
+            assert db.session.query(Group).filter_by(name=REPLICA_ONLY_GROUP).count() == 1
+            db.session.add(Group(name='Nouveau groupe', created_by=app.config['TEST_IDS']['member']))
+            # Autoflush : l'INSERT et la lecture qui le suit partent sur la base principale
+            assert db.session.query(Group).filter_by(name='Nouveau groupe').count() == 1
+            db.session.commit()
+        assert any(s.startswith('INSERT INTO "group"') for s in sql['primary'])
+        assert not any(s.startswith('INSERT') for s in sql['replica'])
+        assert data_reads(sql['replica'])
+    with app.app_context():
+        assert db.session.query(Group).filter_by(name='Nouveau groupe').count() == 1
+        assert db.session.query(Group).filter_by(name=REPLICA_ONLY_GROUP).count() == 0
+
+
+def test_user_who_wrote_is_pinned_to_the_primary(app, monkeypatch):
+    client = app.test_client()
+    login(client, app, 'member')
+    window = app.config['DB_READ_YOUR_WRITES_SECONDS']
+    before = time.time()
+    assert client.post(f"/pay-contribution/{app.config['TEST_IDS']['group']}").status_code == 302
+    with client.session_transaction() as s:
+        pinned_until = s[RYW_SESSION_KEY]
+    assert before + window <= pinned_until <= time.time() + window
+
+    with statements(app) as sql:
+        page = client.get('/groups').get_data(as_text=True)
+    assert SHARED_GROUP in page and REPLICA_ONLY_GROUP not in page
+    assert data_reads(sql['primary'])
+    assert not sql['replica']
+
+    # Fenêtre écoulée : retour sur le réplica
+    monkeypatch.setattr(db_routing.time, 'time', lambda: pinned_until + 1)
+    with statements(app) as sql:
+        page = client.get('/groups').get_data(as_text=True)
+    assert REPLICA_ONLY_GROUP in page
+    assert data_reads(sql['replica'])
+
+
+def test_without_replica_everything_reads_the_primary(primary_only_app):
+    app = primary_only_app
+    with app.app_context():
+        assert set(db.engines) == {None}
+    client = app.test_client()
+    login(client, app, 'admin')
+    with statements(app) as sql:
+        assert client.get('/admin/group-statistics').status_code == 200
+        assert client.get('/admin/export/csv').status_code == 200
+    assert data_reads(sql['primary'])
+    assert set(sql) == {'primary'}
+    with app.test_request_context('/'), use_replica():
+        assert current_read_bind() == 'primary'
@@ -0,0 +1,78 @@
+"""Réplication par journal (replication.py) : les tables dérivées du réplica suivent la base principale."""
+import sqlite3
+
+import pytest
+from sqlalchemy import text
+
+from contribution_streaks import refresh_streaks
+from group_funds import approve
+from models import Membership, Transaction, User, db
+from replication import DERIVED_TRIGGER_PREFIXES, ReplicaFollower, install_capture, sqlite_path
+
+
+def _rows(path, table):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute(f'SELECT * FROM {table} ORDER BY id').fetchall()
+    finally:
+        conn.close()
+
+
+def _derived_triggers(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+                if name.startswith(DERIVED_TRIGGER_PREFIXES)]
+    finally:
+        conn.close()
+
+
+@pytest.fixture
+def follower(primary_only_app, tmp_path):
+    app = primary_only_app
+    primary = sqlite_path(app.config['SQLALCHEMY_DATABASE_URI'])
+    conn = sqlite3.connect(primary, isolation_level=None)
+    install_capture(conn)
+    conn.close()
+    f = ReplicaFollower(primary, str(tmp_path / 'standby.db')).open()
+    yield app, primary, f
+    f.close()
+
+
+def test_derived_tables_match_the_primary_after_an_approval(follower):
+    app, primary, f = follower
+    assert not _derived_triggers(f.replica_path)
+    ids = app.config['TEST_IDS']
+    with app.app_context():
+        newcomer = User(name='nouveau', email='nouveau@example.com', password_hash='x')
+        db.session.add(newcomer)
+        db.session.flush()
+        db.session.add(Membership(user_id=newcomer.id, group_id=ids['group']))
+        tx = Transaction(group_id=ids['group'], user_id=newcomer.id, amount=25, type='cotisation', status='pending')
+        db.session.add(tx)
+        db.session.commit()
+        assert approve(tx.id) == 'approved'
+        # Lignes recalculées par la tâche de fond : elles n'arrivent au réplica que par le journal
+        db.session.execute(text('UPDATE membership_streak SET stale = 1'))
+        db.session.commit()
+        assert refresh_streaks()['rows'] == 2
+    f.catch_up()
+    for table in ('group_fund', 'membership_streak'):
+        assert _rows(f.replica_path, table) == _rows(primary, table)
+    assert not _derived_triggers(f.replica_path)
+
+
+def test_promote_restores_the_derived_triggers(follower):
+    app, primary, f = follower
+    f.promote()
+    assert sorted(_derived_triggers(f.replica_path)) == sorted(_derived_triggers(primary))
+    gid, uid = app.config['TEST_IDS']['group'], app.config['TEST_IDS']['member']
+    conn = sqlite3.connect(f.replica_path, isolation_level=None)
+    try:
+        fund = 'SELECT cotisations FROM group_fund WHERE id = ?'
+        before = conn.execute(fund, (gid,)).fetchone()[0]
+        conn.execute("INSERT INTO 'transaction' (group_id, user_id, amount, type, status, date) "
+                     "VALUES (?, ?, 5, 'cotisation', 'approved', '2024-01-01 00:00:00')", (gid, uid))
+        assert conn.execute(fund, (gid,)).fetchone()[0] == before + 5
+    finally:
+        conn.close()
@@ -0,0 +1,90 @@
+"""
+Annuaire des utilisateurs pour l'administration (recherche côté serveur).
+- Moins de 3 caractères : préfixe du nom ou de l'email (LIKE 'x%' sur des index COLLATE NOCASE)
+- 3 caractères et plus : sous-chaîne n'importe où via user_fts (FTS5, tokenizer trigram),
+  tenu à jour par des triggers sur 'user'
+- Filtres rôle / statut (actif, bloqué, verrouillé), pagination par clé sur id décroissant
+- Nombre de groupes et de transactions de la page en une seule requête agrégée
+"""
+from datetime import datetime
+
+from sqlalchemy import bindparam, or_, text
+
+from models import db, User
+
+PAGE_SIZE = 50
+TRIGRAM_MIN_LENGTH = 3
+STATUSES = ('active', 'blocked', 'locked')
+
+
+def create_index(conn):
+    """Prefix indexes, user_fts and its sync triggers; existing users are indexed by INDEX_FILL_SQL."""
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_user_name_nocase ON 'user' (name COLLATE NOCASE)"))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_user_email_nocase ON 'user' (email COLLATE NOCASE)"))
+    conn.execute(text("CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(name, email, tokenize = 'trigram')"))
+    triggers = {
+        'user_fts_ins': "AFTER INSERT ON 'user' BEGIN "
+                        "INSERT INTO user_fts (rowid, name, email) VALUES (NEW.id, NEW.name, NEW.email); END",
+        'user_fts_upd': "AFTER UPDATE OF name, email ON 'user' BEGIN "
+                        "DELETE FROM user_fts WHERE rowid = OLD.id; "
+                        "INSERT INTO user_fts (rowid, name, email) VALUES (NEW.id, NEW.name, NEW.email); END",
+        'user_fts_del': "AFTER DELETE ON 'user' BEGIN DELETE FROM user_fts WHERE rowid = OLD.id; END",
+    }
+    for name, body in triggers.items():
+        conn.execute(text(f'DROP TRIGGER IF EXISTS {name}'))
+        conn.execute(text(f'CREATE TRIGGER {name} {body}'))
+
+
+# Backfill par tranches d'ids (voir migrations.py)
+INDEX_FILL_SQL = ("INSERT OR REPLACE INTO user_fts (rowid, name, email) "
+                  "SELECT id, name, email FROM 'user' WHERE id > :lo AND id <= :hi")
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_users(q='', role=None, status=None, before=None, limit=PAGE_SIZE, now=None):
+    """One page of users, newest first: (users, next_before_id)."""
+    now = now or datetime.utcnow()
+    query = User.query
+    q = (q or '').strip()
+    if len(q) >= TRIGRAM_MIN_LENGTH:
+        match = '"' + q.replace('"', '""') + '"'
+        query = query.filter(User.id.in_(text('SELECT rowid FROM user_fts WHERE user_fts MATCH :match')
+                                         .bindparams(match=match)))
+    elif q:
+        prefix = _escape_like(q) + '%'
+        query = query.filter(or_(User.name.like(prefix, escape='\\'), User.email.like(prefix, escape='\\')))
+    if role in ('admin', 'user'):
+        query = query.filter(User.role == role)
+    if status == 'blocked':
+        query = query.filter(User.is_blocked == True)
+    elif status == 'locked':
+        query = query.filter(User.lock_until > now)
+    elif status == 'active':
+        query = query.filter(User.is_blocked == False, or_(User.lock_until == None, User.lock_until <= now))
+    if before is not None:
+        query = query.filter(User.id < before)
+    users = query.order_by(User.id.desc()).limit(limit + 1).all()
+    next_before = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_before = users[-1].id
+    return users, next_before
+
+
+def activity_counts(user_ids):
+    """{user_id: (group count, transaction count)} for a page of users, in one query."""
+    user_ids = list(user_ids)
+    counts = dict.fromkeys(user_ids, (0, 0))
+    if not user_ids:
+        return counts
+    rows = db.session.execute(text(
+        "SELECT u.id,"
+        " (SELECT COUNT(*) FROM membership m WHERE m.user_id = u.id),"
+        " (SELECT COUNT(*) FROM 'transaction' t WHERE t.user_id = u.id)"
+        " FROM 'user' u WHERE u.id IN :ids").bindparams(bindparam('ids', expanding=True)), {'ids': user_ids})
+    for uid, groups, transactions in rows:
+        counts[uid] = (groups, transactions)
+    return counts
@@ -0,0 +1,169 @@
+"""
+Réception des webhooks Stripe et PayPal.
+- Vérification de la signature puis enregistrement brut dans la boîte de réception (webhook_event)
+- Déduplication par identifiant d'événement du fournisseur
+- Traitement asynchrone par lots : une requête indexée par fournisseur, un commit par lot
+"""
+import hashlib
+import hmac
+import json
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from models import db, User, WebhookEvent
+from payments import find_provider_transactions, settle_transaction
+
+STRIPE_SIGNATURE_TOLERANCE = 300
+
+# type d'événement -> statut de la transaction
+STRIPE_OUTCOMES = {
+    'checkout.session.completed': 'approved',
+    'checkout.session.async_payment_succeeded': 'approved',
+    'checkout.session.async_payment_failed': 'rejected',
+    'checkout.session.expired': 'rejected',
+}
+PAYPAL_OUTCOMES = {
+    'CHECKOUT.ORDER.COMPLETED': 'approved',
+    'PAYMENT.CAPTURE.COMPLETED': 'approved',
+    'PAYMENT.CAPTURE.DENIED': 'rejected',
+    'PAYMENT.CAPTURE.DECLINED': 'rejected',
+}
+
+
+def verify_stripe_signature(payload, header, secret, tolerance=STRIPE_SIGNATURE_TOLERANCE, now=None):
+    """Check a `Stripe-Signature` header (t=...,v1=...) against the raw request body."""
+    if not header or not secret:
+        return False
+    timestamp = None
+    signatures = []
+    for part in header.split(','):
+        key, _, value = part.strip().partition('=')
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value)
+    if not timestamp or not signatures:
+        return False
+    try:
+        ts = int(timestamp)
+    except ValueError:
+        return False
+    if tolerance and abs((now or time.time()) - ts) > tolerance:
+        return False
+    signed = timestamp.encode() + b'.' + payload
+    expected = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return any(hmac.compare_digest(expected, s) for s in signatures)
+
+
+def sign_stripe_payload(payload, secret, timestamp=None):
+    """Build a `Stripe-Signature` header value (used by the local stand-in and load tests)."""
+    timestamp = str(int(timestamp or time.time()))
+    digest = hmac.new(secret.encode(), timestamp.encode() + b'.' + payload, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={digest}'
+
+
+def verify_paypal_signature(client, webhook_id, headers, event):
+    """Ask PayPal to verify the transmission headers of a delivery."""
+    if not webhook_id:
+        return False
+    body = {
+        'auth_algo': headers.get('Paypal-Auth-Algo'),
+        'cert_url': headers.get('Paypal-Cert-Url'),
+        'transmission_id': headers.get('Paypal-Transmission-Id'),
+        'transmission_sig': headers.get('Paypal-Transmission-Sig'),
+        'transmission_time': headers.get('Paypal-Transmission-Time'),
+        'webhook_id': webhook_id,
+        'webhook_event': event,
+    }
+    if not all(body.values()):
+        return False
+    r = client.request('POST', '/v1/notifications/verify-webhook-signature', json=body)
+    return bool(r is not None and r.status_code == 200
+                and r.json().get('verification_status') == 'SUCCESS')
+
+
+def store_event(provider, event_id, type_, payload):
+    """Persist a delivery in the inbox. Returns False when it was already received."""
+    db.session.add(WebhookEvent(provider=provider, event_id=event_id, type=type_ or '', payload=payload))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    return True
+
+
+def parse_event(provider, event):
+    """Return (external_id, status) for events that settle a payment, else None."""
+    if provider == 'stripe':
+        status = STRIPE_OUTCOMES.get(event.get('type'))
+        obj = (event.get('data') or {}).get('object') or {}
+        if event.get('type') == 'checkout.session.completed' and obj.get('payment_status') not in ('paid', 'no_payment_required'):
+            # Paiement différé : le résultat arrivera par async_payment_succeeded/failed
+            return None
+        return (obj.get('id'), status) if status and obj.get('id') else None
+    if provider == 'paypal':
+        status = PAYPAL_OUTCOMES.get(event.get('event_type'))
+        resource = event.get('resource') or {}
+        if event.get('event_type', '').startswith('PAYMENT.CAPTURE.'):
+            order_id = ((resource.get('supplementary_data') or {}).get('related_ids') or {}).get('order_id')
+        else:
+            order_id = resource.get('id')
+        return (order_id, status) if status and order_id else None
+    return None
+
+
+def process_pending_events(batch_size=200, max_attempts=5):
+    """Apply one batch of inbox events to their transactions and commit once.
+
+    Events whose transaction is not found yet (webhook faster than the
+    create-order commit) stay in the inbox and are retried up to
+    `max_attempts` times before being marked 'unmatched'.
+    """
+    events = (WebhookEvent.query.filter(WebhookEvent.processed_at.is_(None))
+              .order_by(WebhookEvent.id).limit(batch_size).all())
+    counts = {'events': len(events), 'settled': 0, 'already_settled': 0, 'ignored': 0, 'unmatched': 0, 'failed': 0}
+    if not events:
+        return counts
+    now = datetime.utcnow()
+    parsed = {}
+    for ev in events:
+        try:
+            parsed[ev.id] = parse_event(ev.provider, json.loads(ev.payload))
+        except (ValueError, TypeError, AttributeError) as exc:
+            ev.status, ev.error, ev.processed_at = 'failed', str(exc)[:255], now
+            counts['failed'] += 1
+
+    lookups = {}
+    for ev in events:
+        outcome = parsed.get(ev.id)
+        if outcome:
+            lookups.setdefault(ev.provider, set()).add(outcome[0])
+    txs = {provider: find_provider_transactions(provider, ids) for provider, ids in lookups.items()}
+    admin_ids = [a.id for a in User.query.filter_by(role='admin').all()]
+
+    for ev in events:
+        if ev.status == 'failed':
+            continue
+        ev.attempts = (ev.attempts or 0) + 1
+        outcome = parsed.get(ev.id)
+        if not outcome:
+            ev.status, ev.processed_at = 'ignored', now
+            counts['ignored'] += 1
+            continue
+        external_id, status = outcome
+        t = txs.get(ev.provider, {}).get(external_id)
+        if t is None:
+            if ev.attempts >= max_attempts:
+                ev.status, ev.processed_at = 'unmatched', now
+            counts['unmatched'] += 1
+            continue
+        if settle_transaction(t, status, admin_ids=admin_ids):
+            counts['settled'] += 1
+        else:
+            counts['already_settled'] += 1
+        ev.status, ev.processed_at = 'processed', now
+    db.session.commit()
+    return counts
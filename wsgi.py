@@ -0,0 +1,55 @@
+"""
+Point d'entrée de production (gunicorn, voir gunicorn.conf.py).
+- L'application est construite une fois dans le processus maître (preload_app) : schéma et admin par défaut,
+  traductions, templates compilés et manifeste des assets sont chargés avant le fork et partagés par les
+  workers en copie sur écriture. La base de connaissances de l'assistant est construite à l'import
+- gc.freeze() après le préchargement : le ramasse-miettes des workers ne réécrit plus ces pages partagées
+- Aucune connexion SQLite ni thread ne traverse le fork : les pools sont vidés dans le maître puis
+  abandonnés dans chaque worker (after_fork) ; le planificateur n'est jamais lancé dans le maître
+- Planificateur (SCHEDULER_ENABLED) : démarré dans le seul worker qui obtient SCHEDULER_LOCK_PATH
+
+Usage :
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import gc
+
+from app import create_app
+from assets import load_manifest
+from cli import seed_admin, upgrade_schema
+from config import Config
+from i18n import preload_translations
+from models import db
+
+
+def preload(app):
+    """Load in this (master) process everything the workers only read."""
+    with app.app_context():
+        upgrade_schema()
+        seed_admin()
+        for engine in db.engines.values():
+            engine.dispose()
+    preload_translations()
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        app.jinja_env.get_template(name)
+    load_manifest()
+    gc.freeze()
+
+
+def after_fork(app):
+    """In a new worker: drop the pooled connections inherited from the master without closing them."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def start_designated_scheduler(app):
+    if not Config.SCHEDULER_ENABLED:
+        return False
+    from scheduler import start_scheduler_locked
+
+    return start_scheduler_locked(app, app.config['SCHEDULER_LOCK_PATH'])
+
+
+# Jamais de thread planificateur dans le maître : il ne survivrait pas au fork
+app = create_app(SCHEDULER_ENABLED=False)
+preload(app)